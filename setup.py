@@ -55,6 +55,8 @@ setup(
             'img = txm2nexuslib.scripts.image_operate:main',
             'copy2proc = txm2nexuslib.scripts.copy2proc:main',
             'manyxrm2h5 = txm2nexuslib.scripts.manyxrm2h5:main',
+            'xrmindex = txm2nexuslib.scripts.xrmindex:main',
+            'xrmwatch = txm2nexuslib.scripts.xrmwatch:main',
             'manynorm = txm2nexuslib.scripts.manynorm:main',
             'manycrop = txm2nexuslib.scripts.manycrop:main',
             'manyalign = txm2nexuslib.scripts.manyalign:main',
@@ -20,7 +20,11 @@
 
 #------------------------------------------------------------------------------
 
-import string, StringIO, struct, array, os.path, sys
+import string, StringIO, struct, array, os.path, sys, mmap, marshal, hashlib
+import threading
+from collections import OrderedDict
+
+import numpy as np
 
 #[PL] workaround to fix an issue with array item size on 64 bits systems:
 if array.array('L').itemsize == 4:
@@ -45,6 +49,20 @@ DEBUG_MODE = False
 
 MAGIC = '\320\317\021\340\241\261\032\341'
 
+# Layout cache: sidecar file written next to an OLE file, keeping what is
+# needed to open it again without parsing its FAT and directory (see
+# OleFileIO.open). The version is increased when the content changes.
+# The sidecar starts with LAYOUT_CACHE_MAGIC and the SHA-1 digest of the
+# marshalled layout, which is only unmarshalled if the digest matches
+# (marshal is not meant to load corrupt data).
+LAYOUT_CACHE_EXT = '.xrmidx'
+LAYOUT_CACHE_VERSION = 2
+LAYOUT_CACHE_MAGIC = 'XRMIDX\0\0'
+
+# Read-ahead window of the I/O strategy of OleFileIO: bytes of the blocks of
+# min_read_size bytes kept in memory (see _BlockReader)
+BLOCK_CACHE_BYTES = 4 << 20
+
 # added constants for Sector IDs (from AAF specifications)
 MAXREGSECT = 0xFFFFFFFAL; # maximum SECT
 DIFSECT    = 0xFFFFFFFCL; # (-4) denotes a DIFAT sector in a FAT
@@ -115,6 +133,14 @@ def isOleFile (filename):
         return False
 
 
+def layout_cache_path(filename):
+    """
+    Return the path of the layout cache sidecar file of an OLE file.
+    filename: file name or path (str, unicode)
+    """
+    return filename + LAYOUT_CACHE_EXT
+
+
 def i16(c, o = 0):
     """
     Converts a 2-bytes (16 bits) string to an integer.
@@ -199,8 +225,304 @@ except NameError:
         
         
 
+def _sector_breaks(fat):
+    """
+    Return the sorted indexes of the sectors of a FAT (or MiniFAT) which are
+    not followed by the next sector in the file, that is, the indexes where a
+    run of contiguous sectors ends. The last index of the FAT is always a
+    break. Used by _chain_extents to walk sector chains run by run instead of
+    sector by sector.
+
+    fat: array of sector indexes (FAT or MiniFAT)
+    return: numpy array of sector indexes
+    """
+    nb_sect = len(fat)
+    breaks = np.flatnonzero(fat[:-1] != np.arange(1, nb_sect, dtype=np.uint32))
+    if nb_sect:
+        breaks = np.append(breaks, nb_sect-1)
+    return breaks
+
+
+def _chain_extents(sect, size, offset, sectorsize, fat, breaks):
+    """
+    Walk the sector chain of a stream and return the runs of contiguous
+    sectors (extents) it is made of.
+
+    sect      : sector index of first sector in the stream
+    size      : total size of the stream (0x7FFFFFFF if unknown)
+    offset    : offset in bytes for the first FAT or MiniFAT sector
+    sectorsize: size of one sector
+    fat       : array of sector indexes (FAT or MiniFAT)
+    breaks    : run breaks of the FAT (see _sector_breaks)
+    return    : list of (offset, length) tuples, in stream order. The last
+                extent is truncated to the stream size, if it is known.
+    raise IOError if the sector chain is malformed
+    """
+    unknown_size = False
+    if size==0x7FFFFFFF:
+        size = len(fat)*sectorsize
+        unknown_size = True
+    nb_sectors = (size + (sectorsize-1)) / sectorsize
+    # This number should (at least) be less than the total number of
+    # sectors in the given FAT:
+    if nb_sectors > len(fat):
+        raise IOError, 'malformed OLE document, stream too large'
+    # if size is zero, then first sector index should be ENDOFCHAIN:
+    if size == 0 and sect != ENDOFCHAIN:
+        if DEBUG_MODE:
+            print 'size == 0 and sect != ENDOFCHAIN:'
+        raise IOError, 'incorrect OLE sector index for empty stream'
+    extents = []
+    nb_read = 0
+    #[ The number of runs is bounded by the number of sectors, to avoid
+    # DoS attacks with FAT loops:
+    while nb_read < nb_sectors:
+        # Sector index may be ENDOFCHAIN, but only if size was unknown
+        if sect == ENDOFCHAIN:
+            if unknown_size:
+                break
+            else:
+                # else this means that the stream is smaller than declared:
+                if DEBUG_MODE:
+                    print 'sect=ENDOFCHAIN before expected size'
+                raise IOError, 'incomplete OLE stream'
+        # sector index should be within FAT:
+        if sect<0 or sect>=len(fat):
+            if DEBUG_MODE:
+                print 'sect=%d (%X) / len(fat)=%d' % (sect, sect, len(fat))
+            raise IOError, 'incorrect OLE FAT, sector index out of range'
+        # the run goes from sect to the next break, but it can not be
+        # longer than the remaining sectors of the stream:
+        last = int(breaks[np.searchsorted(breaks, sect)])
+        nb_run = min(last - int(sect) + 1, nb_sectors - nb_read)
+        extents.append((offset + sectorsize * int(sect), sectorsize * nb_run))
+        nb_read += nb_run
+        # jump to next sector in the FAT:
+        sect = fat[int(sect) + nb_run - 1]
+    # Last sector should be a "end of chain" marker:
+    if sect != ENDOFCHAIN:
+        raise IOError, 'incorrect last sector index in OLE stream'
+    # The last extent is truncated to the actual stream size:
+    if extents and not unknown_size:
+        extent_offset, length = extents[-1]
+        extents[-1] = (extent_offset, length - (nb_read * sectorsize - size))
+    return extents
+
+
+def _slice_extents(data, extents):
+    """
+    Return the content of a stream made of the given extents of a buffer
+    held in memory (such as the MiniStream).
+
+    data   : string containing the whole buffer
+    extents: list of (offset, length) tuples (see _chain_extents)
+    return : string
+    """
+    if len(extents) == 1:
+        extent_offset, length = extents[0]
+        return data[extent_offset:extent_offset+length]
+    return string.join([data[extent_offset:extent_offset+length]
+                        for extent_offset, length in extents], "")
+
+
+def _extents_range(extents, offset, size):
+    """
+    Return the extents holding a range of bytes of a stream.
+
+    extents: extents of the whole stream (see _chain_extents)
+    offset : offset of the range in the stream
+    size   : size of the range
+    return : list of (offset, length) tuples, covering at most size bytes
+    """
+    result = []
+    end = offset + size
+    position = 0
+    for extent_offset, length in extents:
+        if position >= end:
+            break
+        if position + length > offset:
+            start = max(offset - position, 0)
+            stop = min(end - position, length)
+            result.append((extent_offset + start, stop - start))
+        position += length
+    return result
+
+
 #=== CLASSES ==================================================================
 
+#--- _BlockReader -------------------------------------------------------------
+
+class _BlockReader(object):
+    """
+    Read-only file object wrapping the OLE container, through which all
+    the reads of OleFileIO are done. It implements the I/O strategy of
+    OleFileIO, to issue a few large reads instead of many small ones (on
+    network filesystems, each read is a round trip):
+
+    - min_read_size: small reads (header, FAT, directory) are served from
+      aligned blocks of min_read_size bytes, read at once from the file.
+      The last blocks read, up to BLOCK_CACHE_BYTES, are kept, so that the
+      next sectors are usually already read (read-ahead).
+      In read_extents, the extents of a stream are read directly, without
+      aligning them to blocks; the extents smaller than min_read_size are
+      read together with their neighbours in the file, as long as the read
+      stays within min_read_size bytes and at least half of it is data of
+      the stream. So streams are never read more than about twice.
+    - merge_gap: in read_extents, extents of a stream which are separated
+      in the file by at most merge_gap bytes are read at once.
+
+    The seeks, reads and bytes actually issued to the file are counted in
+    the stats dictionary.
+
+    Stream data is read with positional reads (read_at, read_extents), so
+    that streams can be read concurrently from several threads; seek and
+    read are only used to parse the header and the FAT.
+    """
+
+    def __init__(self, fp, min_read_size=0, merge_gap=0):
+        self.raw = fp
+        self.min_read_size = min_read_size
+        self.merge_gap = merge_gap
+        self.stats = {'seeks': 0, 'reads': 0, 'bytes': 0}
+        self._pos = 0
+        # position of the wrapped file, if known:
+        self._raw_pos = None
+        # cache of the last blocks read, by block index:
+        self._blocks = OrderedDict()
+        if min_read_size > 0:
+            self._max_blocks = max(2, BLOCK_CACHE_BYTES // min_read_size)
+        else:
+            self._max_blocks = 0
+        # positional reads (os.pread) are used when available, otherwise
+        # seek and read are done under a lock:
+        self._fileno = None
+        if hasattr(os, 'pread') and hasattr(fp, 'fileno'):
+            try:
+                self._fileno = fp.fileno()
+            except (AttributeError, IOError, ValueError):
+                pass
+        self._lock = threading.Lock()
+
+    def __getattr__(self, name):
+        # name, fileno, close... are those of the wrapped file
+        return getattr(self.raw, name)
+
+    def _raw_read_at(self, offset, size=-1):
+        fileno = self._fileno
+        if fileno is not None and size >= 0:
+            # positional read, which does not use the file position:
+            data = os.pread(fileno, size, offset)
+            with self._lock:
+                self.stats['reads'] += 1
+                self.stats['bytes'] += len(data)
+            return data
+        # seek and read, which must not be interleaved between threads:
+        with self._lock:
+            if self._raw_pos != offset:
+                self.raw.seek(offset)
+                self.stats['seeks'] += 1
+            data = self.raw.read(size)
+            self.stats['reads'] += 1
+            self.stats['bytes'] += len(data)
+            self._raw_pos = offset + len(data)
+        return data
+
+    def seek(self, offset, whence=0):
+        if whence == 0:
+            self._pos = offset
+        elif whence == 1:
+            self._pos += offset
+        else:
+            with self._lock:
+                self.raw.seek(offset, whence)
+                self.stats['seeks'] += 1
+                self._pos = self._raw_pos = self.raw.tell()
+
+    def tell(self):
+        return self._pos
+
+    def _get_block(self, index):
+        with self._lock:
+            block = self._blocks.pop(index, None)
+            if block is not None:
+                self._blocks[index] = block
+                return block
+        block = self._raw_read_at(index * self.min_read_size,
+                                  self.min_read_size)
+        with self._lock:
+            if len(self._blocks) >= self._max_blocks:
+                self._blocks.popitem(last=False)
+            self._blocks[index] = block
+        return block
+
+    def read_at(self, offset, size):
+        """
+        Read size bytes at the given offset, without using nor changing
+        the current position: read_at can be called concurrently from
+        several threads.
+        """
+        if 0 < size < self.min_read_size:
+            # small read, served from the blocks holding it (at most two):
+            first, block_offset = divmod(offset, self.min_read_size)
+            block = self._get_block(first)
+            data = block[block_offset:block_offset+size]
+            if len(data) < size and len(block) == self.min_read_size:
+                data += self._get_block(first + 1)[:size-len(data)]
+            return data
+        return self._raw_read_at(offset, size)
+
+    def read(self, size=-1):
+        pos = self._pos
+        if size < 0:
+            data = self._raw_read_at(pos)
+        else:
+            data = self.read_at(pos, size)
+        self._pos = pos + len(data)
+        return data
+
+    def read_extents(self, extents):
+        """
+        Read the extents of a stream, merging the extents which are close
+        in the file (see merge_gap and min_read_size) into single reads.
+        Like read_at, it can be called concurrently from several threads.
+
+        extents: list of (offset, length) tuples (see _chain_extents)
+        return: string containing the extents, in the order given
+        """
+        if len(extents) == 1:
+            extent_offset, length = extents[0]
+            return self._raw_read_at(extent_offset, length)
+        # groups of extents read at once: [start, end, data bytes, indexes]
+        groups = []
+        for i in sorted(range(len(extents)), key=lambda i: extents[i][0]):
+            extent_offset, length = extents[i]
+            if groups and self._merge(groups[-1], extent_offset, length):
+                groups[-1][1] = max(groups[-1][1], extent_offset + length)
+                groups[-1][2] += length
+                groups[-1][3].append(i)
+            else:
+                groups.append([extent_offset, extent_offset + length,
+                               length, [i]])
+        parts = [None] * len(extents)
+        for start, end, _, indexes in groups:
+            data = self._raw_read_at(start, end - start)
+            for i in indexes:
+                extent_offset, length = extents[i]
+                parts[i] = data[extent_offset-start:extent_offset-start+length]
+        return string.join(parts, "")
+
+    def _merge(self, group, extent_offset, length):
+        """Tell if an extent is read together with a group of extents"""
+        start, end, data_size, _ = group
+        if extent_offset - end <= self.merge_gap:
+            return True
+        # small extent, close to a small group:
+        span = max(end, extent_offset + length) - start
+        return (length < self.min_read_size and
+                span <= self.min_read_size and
+                span <= 2 * (data_size + length))
+
+
 #--- _OleStream ---------------------------------------------------------------
 
 class _OleStream(StringIO.StringIO):
@@ -220,7 +542,8 @@ class _OleStream(StringIO.StringIO):
     """
 
 
-    def __init__(self, fp, sect, size, offset, sectorsize, fat):
+    def __init__(self, fp, sect, size, offset, sectorsize, fat, breaks=None,
+                 extents=None):
         """
         Constructor for _OleStream class.
 
@@ -229,17 +552,16 @@ class _OleStream(StringIO.StringIO):
         size      : total size of the stream
         offset    : offset in bytes for the first FAT or MiniFAT sector
         sectorsize: size of one sector
-        fat       : array/list of sector indexes (FAT or MiniFAT)
+        fat       : array of sector indexes (FAT or MiniFAT)
+        breaks    : run breaks of the FAT (see _sector_breaks), computed
+                    from fat if not given
+        extents   : extents of the stream (see _chain_extents), computed
+                    from the sector chain if not given
         return    : a StringIO instance containing the OLE stream
         """
         if DEBUG_MODE:
             print '_OleStream.__init__:\n'
             print '  sect=%d (%X), size=%d, offset=%d, sectorsize=%d, len(fat)=%d, fp=%s \n\n' %(sect,sect,size,offset,sectorsize,len(fat), repr(fp))
-        # for debugging messages, size of file where stream is read:
-        if isinstance(fp, StringIO.StringIO):
-            filesize = len(fp.getvalue())   # file in MiniFAT
-        else:
-            filesize = os.path.getsize(fp.name) # file on disk
         #[PL] To detect malformed documents with FAT loops, we compute the
         # expected number of sectors in the stream:
         unknown_size = False
@@ -247,81 +569,42 @@ class _OleStream(StringIO.StringIO):
             # this is the case when called from OleFileIO._open(), and stream
             # size is not known in advance (for example when reading the
             # Directory stream). Then we can only guess maximum size:
-            size = len(fat)*sectorsize
-            # and we keep a record that size was unknown:
             unknown_size = True
             if DEBUG_MODE: print '  stream with UNKNOWN SIZE'
-        nb_sectors = (size + (sectorsize-1)) / sectorsize
-        #print 'nb_sectors = %d' % nb_sectors
-        # This number should (at least) be less than the total number of
-        # sectors in the given FAT:
-        if nb_sectors > len(fat):
-            raise IOError, 'malformed OLE document, stream too large'
-        # optimization(?): data is first a list of strings, and join() is called
-        # at the end to concatenate all in one string.
-        # (this may not be really useful with recent Python versions)
-        data = []
-        # if size is zero, then first sector index should be ENDOFCHAIN:
-        if size == 0 and sect != ENDOFCHAIN:
-            if DEBUG_MODE:
-                print 'size == 0 and sect != ENDOFCHAIN:'
-            raise IOError, 'incorrect OLE sector index for empty stream'
-        #[ A fixed-length for loop is used instead of an undefined while
-        # loop to avoid DoS attacks:
-        for i in xrange(nb_sectors):
-            # Sector index may be ENDOFCHAIN, but only if size was unknown
-            if sect == ENDOFCHAIN:
-                if unknown_size:
-                    break
-                else:
-                    # else this means that the stream is smaller than declared:
+        if extents is None:
+            if breaks is None:
+                breaks = _sector_breaks(fat)
+            extents = _chain_extents(sect, size, offset, sectorsize, fat,
+                                     breaks)
+        # Each extent is a run of contiguous sectors, read at once:
+        if isinstance(fp, StringIO.StringIO):
+            # the MiniStream is already in memory: extents are sliced
+            data = _slice_extents(fp.getvalue(), extents)
+        elif isinstance(fp, _BlockReader):
+            # the OLE container, read according to the OleFileIO I/O
+            # strategy
+            data = fp.read_extents(extents)
+        else:
+            data = []
+            for extent_offset, length in extents:
+                try:
+                    fp.seek(extent_offset)
+                except:
                     if DEBUG_MODE:
-                        print 'sect=ENDOFCHAIN before expected size'
-                    raise IOError, 'incomplete OLE stream'
-            # sector index should be within FAT:
-            if sect<0 or sect>=len(fat):
-                if DEBUG_MODE:
-                    print 'sect=%d (%X) / len(fat)=%d' % (sect, sect, len(fat))
-                    print 'i=%d / nb_sectors=%d' %(i, nb_sectors)
-
-                raise IOError, 'incorrect OLE FAT, sector index out of range'
-
-            try:
-                fp.seek(offset + sectorsize * sect)
-            except:
-                if DEBUG_MODE:
-                    print 'sect=%d, seek=%d, filesize=%d' % (sect, offset+sectorsize*sect, filesize)
-                raise IOError, 'OLE sector index out of range'
-            sector_data = fp.read(sectorsize)
-            # [PL] check if there was enough data:
-            # Note: if sector is the last of the file, sometimes it is not a
-            # complete sector (of 512 or 4K), so we may read less than
-            # sectorsize.
-            if len(sector_data)!=sectorsize and sect!=(len(fat)-1):
-                if DEBUG_MODE:
-                    print 'sect=%d / len(fat)=%d, seek=%d / filesize=%d, len read=%d' % (sect, len(fat), offset+sectorsize*sect, filesize, len(sector_data))
-                    print 'seek+len(read)=%d' % (offset+sectorsize*sect+len(sector_data))
-                raise IOError, 'incomplete OLE sector'
-            data.append(sector_data)
-            # jump to next sector in the FAT:
-            try:
-                sect = fat[sect]
-            except IndexError:
-                #  if pointer is out of the FAT an exception is raised
-                raise IOError, 'incorrect OLE FAT, sector index out of range'
-        # Last sector should be a "end of chain" marker:
-        if sect != ENDOFCHAIN:
-            raise IOError, 'incorrect last sector index in OLE stream'
-        data = string.join(data, "")
-        # Data is truncated to the actual stream size:
-        if len(data) >= size:
-            data = data[:size]
-            # actual stream size is stored for future use:
-            self.size = size
-        elif unknown_size:
+                        print 'seek=%d, length=%d' % (extent_offset, length)
+                    raise IOError, 'OLE sector index out of range'
+                data.append(fp.read(length))
+            data = string.join(data, "")
+        # Note: if sector is the last of the file, sometimes it is not a
+        # complete sector (of 512 or 4K), so we may read less than the
+        # extents length.
+        if unknown_size:
             # actual stream size was not known, now we know the size of read
             # data:
             self.size = len(data)
+        elif len(data) >= size:
+            # actual stream size is stored for future use:
+            self.size = size
         else:
             # read data is less than expected:
             if DEBUG_MODE:
@@ -334,6 +617,11 @@ class _OleStream(StringIO.StringIO):
 
 #--- _OleDirectoryEntry -------------------------------------------------------
 
+def _entry_name(entry):
+    "Sort key of directory entries (same order as _OleDirectoryEntry.__cmp__)"
+    return entry.name
+
+
 class _OleDirectoryEntry:
 
     """
@@ -386,6 +674,9 @@ class _OleDirectoryEntry:
         # flag used to detect if the entry is referenced more than once in
         # directory:
         self.used = False
+        # extents of the stream (list of (offset, length) runs of contiguous
+        # sectors), computed once when the stream is first opened:
+        self.extents = None
         # decode DirEntry
         (
             name,
@@ -487,7 +778,7 @@ class _OleDirectoryEntry:
             # in the OLE file, entries are sorted on (length, name).
             # for convenience, we sort them on name instead:
             # (see __cmp__ method in this class)
-            self.kids.sort()
+            self.kids.sort(key=_entry_name)
 
 
     def append_kids(self, child_sid):
@@ -521,7 +812,7 @@ class _OleDirectoryEntry:
         self.append_kids(child.sid_left)
         # Check if its name is not already used (case-insensitive):
         name_lower = child.name.lower()
-        if self.kids_dict.has_key(name_lower):
+        if name_lower in self.kids_dict:
             self.olefile._raise_defect(DEFECT_INCORRECT,
                 "Duplicate filename in OLE storage")
         # Then the child_sid _OleDirectoryEntry object is appended to the
@@ -589,7 +880,9 @@ class OleFileIO:
     TIFF files).
     """
 
-    def __init__(self, filename = None, raise_defects=DEFECT_FATAL):
+    def __init__(self, filename = None, raise_defects=DEFECT_FATAL,
+                 use_mmap=False, layout_cache=False, min_read_size=0,
+                 merge_gap=0):
         """
         Constructor for OleFileIO class.
 
@@ -597,12 +890,45 @@ class OleFileIO:
         raise_defects: minimal level for defects to be raised as exceptions.
         (use DEFECT_FATAL for a typical application, DEFECT_INCORRECT for a
         security-oriented application, see source code for details)
+        use_mmap: if True, the file is memory mapped when opened, and
+        openstream_buffers/openstream_buffer return zero-copy buffers over
+        the mapped file instead of copies of the stream data. The map is
+        closed by close().
+        layout_cache: if True, the layout of the file (header, directory,
+        stream extents and MiniStream) is read from its sidecar file
+        (see layout_cache_path) when it is up to date (same file name, size
+        and modification time), instead of being parsed; otherwise the file
+        is parsed and the sidecar is written.
+        min_read_size: minimum size of the reads issued to the file; the
+        extra data is kept to serve the following reads (read-ahead).
+        merge_gap: extents of a stream separated by at most this number of
+        bytes in the file are read at once. Both are useful on network
+        filesystems, where each read is a round trip; see get_io_stats.
+
+        Once the file is opened, its streams can be read concurrently from
+        several threads (openstream, read_stream, openstream_buffers...).
         """
         self._raise_defects_level = raise_defects
+        self.use_mmap = use_mmap
+        self.layout_cache = layout_cache
+        self.min_read_size = min_read_size
+        self.merge_gap = merge_gap
+        self._ministream_lock = threading.Lock()
+        self._mmap = None
         if filename:
             self.open(filename)
 
 
+    def get_io_stats(self):
+        """
+        Return the number of seeks, reads and bytes read issued to the
+        file since it was opened, as a dictionary with the 'seeks',
+        'reads' and 'bytes' keys. (Reads from the memory map, if use_mmap
+        is set, are not counted.)
+        """
+        return dict(self.fp.stats)
+
+
     def _raise_defect(self, defect_level, message):
         """
         This method should be called for any defect found during file parsing.
@@ -626,6 +952,11 @@ class OleFileIO:
         Close an OLE2 file.
 
         """
+        # The buffers returned by openstream_buffers over the memory map
+        # must not be used after this point.
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
         self.fp.close()
             
 
@@ -638,24 +969,41 @@ class OleFileIO:
         """
         # check if filename is a string-like or file-like object:
         # (it is better to check for a read() method)
+        layout = None
         if hasattr(filename, 'read'):
             # file-like object
-            self.fp = filename
+            fp = filename
+            filesize = os.path.getsize(filename)
         else:
             # string-like object
-            self.fp = open(filename, "rb")
+            fp = open(filename, "rb")
+            stat = os.fstat(fp.fileno())
+            filesize = stat.st_size
+            if self.layout_cache:
+                layout = self._load_layout(filename, stat)
+        # all the reads go through the I/O strategy:
+        self.fp = _BlockReader(fp, self.min_read_size, self.merge_gap)
         # old code fails if filename is not a plain string:   
         #if type(filename) == type(""):
         #    self.fp = open(filename, "rb")
         #else:
         #    self.fp = filename
 
-        # lists of streams in FAT and MiniFAT, to detect duplicate references
-        # (list of indexes of first sectors of each stream)
-        self._used_streams_fat = []
-        self._used_streams_minifat = []
+        # memory map of the whole container (only for real files on disk):
+        self._mmap = None
+        if self.use_mmap and hasattr(self.fp, 'fileno'):
+            self._mmap = mmap.mmap(self.fp.fileno(), 0,
+                                   access=mmap.ACCESS_READ)
 
-        header = self.fp.read(512)
+        # sets of streams in FAT and MiniFAT, to detect duplicate references
+        # (indexes of first sectors of each stream)
+        self._used_streams_fat = set()
+        self._used_streams_minifat = set()
+
+        if layout is not None:
+            header = layout['header']
+        else:
+            header = self.fp.read(512)
 
         if len(header) != 512 or header[:8] != MAGIC:
             self._raise_defect(DEFECT_FATAL, "not an OLE2 structured storage file")
@@ -725,43 +1073,17 @@ class OleFileIO:
         if self.Sig != '\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1':
             # OLE signature should always be present
             self._raise_defect(DEFECT_FATAL, "incorrect OLE signature")
-        if self.clsid != '\x00'*16:
-            # according to AAF specs, CLSID should always be zero
-            self._raise_defect(DEFECT_INCORRECT, "incorrect CLSID in OLE header")
-        #print  "MinorVersion = %d" , self.MinorVersion
-        #print  "DllVersion   = %d" , self.DllVersion 
-        if self.DllVersion not in [3, 4]:
-            # version 3: usual format, 512 bytes per sector
-            # version 4: large format, 4K per sector
-            self._raise_defect(DEFECT_INCORRECT, "incorrect DllVersion in OLE header")
-        if DEBUG_MODE: print "ByteOrder    = %X" % self.ByteOrder 
         if self.ByteOrder != 0xFFFE:
             # For now only common little-endian documents are handled correctly
             self._raise_defect(DEFECT_FATAL, "incorrect ByteOrder in OLE header")
-
         self.SectorSize = 2**self.SectorShift
-        if DEBUG_MODE: print "SectorSize   = %d" % self.SectorSize 
-        if self.SectorSize not in [512, 4096]:
-            self._raise_defect(DEFECT_INCORRECT, "incorrect SectorSize in OLE header")
-        if (self.DllVersion==3 and self.SectorSize!=512) \
-        or (self.DllVersion==4 and self.SectorSize!=4096):
-            self._raise_defect(DEFECT_INCORRECT, "SectorSize does not match DllVersion in OLE header")
         self.MiniSectorSize = 2**self.MiniSectorShift
-        if DEBUG_MODE: print "MiniSectorSize   = %d" % self.MiniSectorSize 
-        if self.MiniSectorSize not in [64]:
-            self._raise_defect(DEFECT_INCORRECT, "incorrect MiniSectorSize in OLE header")
-        if self.Reserved != 0 or self.Reserved1 != 0:
-            self._raise_defect(DEFECT_INCORRECT, "incorrect OLE header (non-null reserved bytes)")
-        if DEBUG_MODE: print "number of directory sectors csectDir     = %d" % self.csectDir 
-        if self.SectorSize==512 and self.csectDir!=0:
-            self._raise_defect(DEFECT_INCORRECT, "incorrect csectDir in OLE header")
-        #print  "csectFat     = %d" % self.csectFat 
-        #print  "sectDirStart = %X" % self.sectDirStart 
-        #print "signature    = %d" % self.signature 
-        # Signature should be zero, BUT some implementations do not follow this
-        # rule => only a potential defect:
-        if self.signature != 0:
-            self._raise_defect(DEFECT_POTENTIAL, "incorrect OLE header (signature>0)")
+        if DEBUG_MODE:
+            print "ByteOrder    = %X" % self.ByteOrder
+            print "SectorSize   = %d" % self.SectorSize
+            print "MiniSectorSize   = %d" % self.MiniSectorSize
+            print "number of directory sectors csectDir     = %d" % self.csectDir
+        self._check_header()
         if DEBUG_MODE: 
             print "MiniSectorCutoff = %d" % self.MiniSectorCutoff 
             print "MiniFatStart     = %X" % self.MiniFatStart 
@@ -771,7 +1093,6 @@ class OleFileIO:
 
         # calculate the number of sectors in the file
         # (-1 because header doesn't count)
-        filesize = os.path.getsize(filename)
         self.nb_sect = ( (filesize + self.SectorSize-1) / self.SectorSize) - 1
         #print "Number of sectors in the file:",  self.nb_sect 
 
@@ -791,13 +1112,52 @@ class OleFileIO:
         if self.csectDif:
             self._check_duplicate_stream(self.sectDifStart)
 
+        self.ministream = None
+        self.minifatsect = self.MiniFatStart #i32(header, 60)
+        if layout is not None:
+            self._restore_layout(layout)
+            return
         # Load file allocation tables
         self.loadfat(header)
         # Load direcory.  This sets both the direntries list (ordered by sid)
         # and the root (ordered by hierarchy) members.
         self.loaddirectory(self.sectDirStart)#i32(header, 48))
-        self.ministream = None
-        self.minifatsect = self.MiniFatStart #i32(header, 60)
+        if self.layout_cache and not hasattr(filename, 'read'):
+            self._save_layout(filename, stat, header)
+
+
+    def _check_header(self):
+        """
+        Check the header fields which are not needed to read the file, for
+        defects. (open helper)
+        """
+        if self.clsid != '\x00'*16:
+            # according to AAF specs, CLSID should always be zero
+            self._raise_defect(DEFECT_INCORRECT, "incorrect CLSID in OLE header")
+        #print  "MinorVersion = %d" , self.MinorVersion
+        #print  "DllVersion   = %d" , self.DllVersion 
+        if self.DllVersion not in [3, 4]:
+            # version 3: usual format, 512 bytes per sector
+            # version 4: large format, 4K per sector
+            self._raise_defect(DEFECT_INCORRECT, "incorrect DllVersion in OLE header")
+        if self.SectorSize not in [512, 4096]:
+            self._raise_defect(DEFECT_INCORRECT, "incorrect SectorSize in OLE header")
+        if (self.DllVersion==3 and self.SectorSize!=512) \
+        or (self.DllVersion==4 and self.SectorSize!=4096):
+            self._raise_defect(DEFECT_INCORRECT, "SectorSize does not match DllVersion in OLE header")
+        if self.MiniSectorSize not in [64]:
+            self._raise_defect(DEFECT_INCORRECT, "incorrect MiniSectorSize in OLE header")
+        if self.Reserved != 0 or self.Reserved1 != 0:
+            self._raise_defect(DEFECT_INCORRECT, "incorrect OLE header (non-null reserved bytes)")
+        if self.SectorSize==512 and self.csectDir!=0:
+            self._raise_defect(DEFECT_INCORRECT, "incorrect csectDir in OLE header")
+        #print  "csectFat     = %d" % self.csectFat 
+        #print  "sectDirStart = %X" % self.sectDirStart 
+        #print "signature    = %d" % self.signature 
+        # Signature should be zero, BUT some implementations do not follow this
+        # rule => only a potential defect:
+        if self.signature != 0:
+            self._raise_defect(DEFECT_POTENTIAL, "incorrect OLE header (signature>0)")
 
 
     def _check_duplicate_stream(self, first_sect, minifat=False):
@@ -821,7 +1181,7 @@ class OleFileIO:
         if first_sect in used_streams:
             self._raise_defect(DEFECT_INCORRECT, 'Stream referenced twice')
         else:
-            used_streams.append(first_sect)
+            used_streams.add(first_sect)
 
 
     def dumpfat(self, fat, firstindex=0):
@@ -887,42 +1247,34 @@ class OleFileIO:
     def sect2array(self, sect):
         """
         convert a sector to an array of 32 bits unsigned integers,
-        swapping bytes on big endian CPUs such as PowerPC (old Macs)
+        (little endian, whatever the byte order of the CPU)
         """
-        a = array.array(UINT32, sect)
-        # if CPU is big endian, swap bytes:
-        if sys.byteorder == 'big':
-            a.byteswap()
-        return a        
+        return np.frombuffer(sect, dtype='<u4')
 
 
     def loadfat_sect(self, sect):
         """
-        Adds the indexes of the given sector to the FAT
+        Adds the indexes of the FAT sectors listed in the given sector to
+        the FAT sectors to be loaded (see loadfat).
         sect: string containing the first FAT sector, or array of long integers
         return: index of last FAT sector.
         """
         # a FAT sector is an array of ulong integers.
-        if isinstance(sect, array.array):
+        if isinstance(sect, np.ndarray):
             # if sect is already an array it is directly used
             fat1 = sect
         else:
             # if it's a raw sector, it is parsed in an array
             fat1 = self.sect2array(sect)
-            self.dumpsect(sect)
-        # The FAT is a sector chain starting at the first index of itself.
-        for isect in fat1:
-            #print "isect = %X" % isect
-            if isect == ENDOFCHAIN or isect == FREESECT:
-                # the end of the sector chain has been reached
-                break
-            # read the FAT sector
-            s = self.getsect(isect)
-            # parse it as an array of 32 bits integers, and add it to the
-            # global FAT array
-            nextfat = self.sect2array(s)
-            self.fat = self.fat + nextfat
-        return isect
+            if DEBUG_MODE: self.dumpsect(sect)
+        # The FAT is a sector chain starting at the first index of itself,
+        # up to the first ENDOFCHAIN or FREESECT index:
+        end = np.flatnonzero((fat1 == ENDOFCHAIN) | (fat1 == FREESECT))
+        if len(end):
+            fat1 = fat1[:end[0]]
+        self._fat_sects.append(fat1)
+        if len(fat1):
+            return fat1[-1]
 
 
     def loadfat(self, header):
@@ -937,8 +1289,9 @@ class OleFileIO:
 
         # [PL] FAT is an array of 32 bits unsigned ints, it's more effective
         # to use an array than a list in Python.
-        # It's initialized as empty first:
-        self.fat = array.array(UINT32)
+        # The indexes of all the FAT sectors are gathered first, and the FAT
+        # is then read at once:
+        self._fat_sects = []
         self.loadfat_sect(sect)
 
         if self.csectDif != 0:
@@ -964,7 +1317,7 @@ class OleFileIO:
 
                 sector_difat = self.getsect(isect_difat)
                 difat = self.sect2array(sector_difat)
-                self.dumpsect(sector_difat)
+                if DEBUG_MODE: self.dumpsect(sector_difat)
                 self.loadfat_sect(difat[:127])
                 # last DIFAT pointer is next DIFAT sector:
                 isect_difat = difat[127]
@@ -974,6 +1327,14 @@ class OleFileIO:
                 # last DIFAT pointer value must be ENDOFCHAIN or FREESECT
                 raise IOError, 'incorrect end of DIFAT'
 
+        # FAT sectors are usually contiguous in the file: each run of
+        # contiguous FAT sectors is read with a single read.
+        fat_sects = np.concatenate(self._fat_sects).astype(np.int64)
+        del self._fat_sects
+        runs = np.split(fat_sects, np.flatnonzero(np.diff(fat_sects) != 1)+1)
+        self.fat = self.sect2array(string.join(
+            [self.getsect(run[0], len(run)) for run in runs if len(run)], ""))
+
         # since FAT is read from fixed-size sectors, it may contain more values
         # than the actual number of sectors in the file.
         
@@ -982,8 +1343,11 @@ class OleFileIO:
         if len(self.fat) > self.nb_sect:
             if DEBUG_MODE: print 'len(fat)=%d, shrunk to nb_sect=%d' % (len(self.fat), self.nb_sect)
             self.fat = self.fat[:self.nb_sect]
-        if DEBUG_MODE: print'\nFAT:'
-        self.dumpfat(self.fat)
+        # run breaks of the FAT, to walk sector chains run by run:
+        self.fat_breaks = _sector_breaks(self.fat)
+        if DEBUG_MODE:
+            print'\nFAT:'
+            self.dumpfat(self.fat)
         
 
 
@@ -1017,14 +1381,17 @@ class OleFileIO:
         # Then shrink the array to used size, to avoid indexes out of MiniStream:
         if DEBUG_MODE: print 'MiniFAT shrunk from %d to %d sectors' % (len(self.minifat), nb_minisectors)
         self.minifat = self.minifat[:nb_minisectors]
+        self.minifat_breaks = _sector_breaks(self.minifat)
         if DEBUG_MODE: print 'loadminifat(): len=%d' % len(self.minifat)
-        if DEBUG_MODE: print '\nMiniFAT:'
-        self.dumpfat(self.minifat)
+        if DEBUG_MODE:
+            print '\nMiniFAT:'
+            self.dumpfat(self.minifat)
 
-    def getsect(self, sect):
+    def getsect(self, sect, count=1):
         """
         Read given sector from file on disk.
         sect: sector index
+        count: number of contiguous sectors to read, starting at sect
         returns a string containing the sector data.
         """
         # [PL] this original code was wrong when sectors are 4KB instead of
@@ -1038,8 +1405,8 @@ class OleFileIO:
             if DEBUG_MODE: print ('getsect(): sect=%X, seek=%d, filesize=%d' %
                 (sect, self.sectorsize*(sect+1), os.path.getsize(self.fp.name)))
             self._raise_defect(DEFECT_FATAL, 'OLE sector index out of range')
-        sector = self.fp.read(self.sectorsize)
-        if len(sector) != self.sectorsize:
+        sector = self.fp.read(self.sectorsize * count)
+        if len(sector) != self.sectorsize * count:
             if DEBUG_MODE: print ('getsect(): sect=%X, read=%d, sectorsize=%d' %
                 (sect, len(sector), self.sectorsize))
             self._raise_defect(DEFECT_FATAL, 'incomplete OLE sector')
@@ -1061,12 +1428,18 @@ class OleFileIO:
         # self.csectDir * self.sectorsize
         
         self.directory_fp = self._open(sect)
-        
-        
+        self._build_directory()
 
+
+    def _build_directory(self):
+        """
+        Build the directory entries, the storage tree and the path index
+        from the directory stream. (loaddirectory helper)
+        """
         #[PL] to detect malformed documents and avoid DoS attacks, the maximum
         # number of directory entries can be calculated:
         max_entries = self.directory_fp.size / 128
+        self._directory_data = self.directory_fp.getvalue()
         if DEBUG_MODE: print 'loaddirectory: size=%d, max_entries=%d' % (self.directory_fp.size, max_entries)
 
         # Create list of directory entries
@@ -1081,6 +1454,136 @@ class OleFileIO:
         # read and build all storage trees, starting from the root:
         self.root.build_storage_tree()
 
+        # index of all the entries by their full path in lowercase, used to
+        # find an entry without walking the storage tree:
+        self._path_index = {}
+        self._index_kids(self.root, '')
+
+
+    def _load_layout(self, filename, stat):
+        """
+        Read the layout cache sidecar file of an OLE file. (open helper)
+
+        filename: path of the OLE file
+        stat: os.stat result of the OLE file
+        return: layout dictionary, or None if the sidecar does not exist, is
+        corrupt or is out of date (then the file has to be parsed).
+        """
+        try:
+            f = open(layout_cache_path(filename), 'rb')
+            try:
+                data = f.read()
+            finally:
+                f.close()
+            header_size = len(LAYOUT_CACHE_MAGIC) + 20
+            if data[:len(LAYOUT_CACHE_MAGIC)] != LAYOUT_CACHE_MAGIC \
+                    or hashlib.sha1(data[header_size:]).digest() \
+                    != data[len(LAYOUT_CACHE_MAGIC):header_size]:
+                return None
+            layout = marshal.loads(data[header_size:])
+            if layout['version'] == LAYOUT_CACHE_VERSION \
+                    and layout['name'] == os.path.basename(filename) \
+                    and layout['size'] == stat.st_size \
+                    and layout['mtime'] == stat.st_mtime \
+                    and len(layout['header']) == 512:
+                return layout
+        except Exception:
+            # missing, unreadable or corrupt sidecar
+            pass
+        return None
+
+
+    def _restore_layout(self, layout):
+        """
+        Restore the directory, the extents of the streams and the MiniStream
+        from a layout read by _load_layout, instead of loading the FAT and
+        the directory from the file. (open helper)
+
+        layout: layout dictionary
+        """
+        # Streams are only read through their cached extents, so the FAT
+        # and the MiniFAT are not needed:
+        self.fat = self.minifat = np.zeros(0, np.uint32)
+        self.fat_breaks = self.minifat_breaks = _sector_breaks(self.fat)
+        self.directory_fp = StringIO.StringIO(layout['directory'])
+        self.directory_fp.size = len(layout['directory'])
+        self._build_directory()
+        for sid, extents in layout['extents'].iteritems():
+            self.direntries[sid].extents = list(extents)
+        self.ministream_data = layout['ministream']
+        self.ministream = StringIO.StringIO(self.ministream_data)
+
+
+    def _save_layout(self, filename, stat, header):
+        """
+        Write the layout cache sidecar file of an OLE file, once it has been
+        parsed. The sidecar is not written if the extents of a stream can
+        not be computed, and errors writing it are ignored (read-only
+        folders for instance). (open helper)
+
+        filename: path of the OLE file
+        stat: os.stat result of the OLE file
+        header: header of the OLE file (512 bytes)
+        """
+        extents = {}
+        try:
+            for entry in self.direntries:
+                if entry is not None and entry.entry_type == STGTY_STREAM:
+                    extents[entry.sid] = tuple(self._get_extents(entry))
+        except IOError:
+            return
+        if self.ministream:
+            ministream_data = self.ministream_data
+        else:
+            ministream_data = ''
+        layout = {
+            'version': LAYOUT_CACHE_VERSION,
+            'name': os.path.basename(filename),
+            'size': stat.st_size,
+            'mtime': stat.st_mtime,
+            'header': header,
+            'directory': self.directory_fp.getvalue(),
+            'extents': extents,
+            'ministream': ministream_data,
+        }
+        # The sidecar is written to a temporary file and then renamed, so
+        # that a reader never sees a partially written layout:
+        path = layout_cache_path(filename)
+        tmp_path = '%s.%d.tmp' % (path, os.getpid())
+        try:
+            data = marshal.dumps(layout)
+            digest = hashlib.sha1(data).digest()
+            f = open(tmp_path, 'wb')
+            try:
+                f.write(LAYOUT_CACHE_MAGIC + digest + data)
+            finally:
+                f.close()
+            if os.name == 'nt' and os.path.exists(path):
+                os.remove(path)
+            os.rename(tmp_path, path)
+        except (IOError, OSError):
+            if os.path.exists(tmp_path):
+                try:
+                    os.remove(tmp_path)
+                except OSError:
+                    pass
+
+
+    def _index_kids(self, node, prefix):
+        """
+        Add the children of a storage to the path index. (recursive method)
+
+        node: storage (_OleDirectoryEntry object)
+        prefix: lowercase path of the storage, ending with '/' (except root)
+        """
+        for kid in node.kids:
+            path = prefix + kid.name.lower()
+            # in case of duplicate names, the first kid is kept, as the
+            # former tree walk did:
+            self._path_index.setdefault(path, kid.sid)
+            if kid.kids:
+                self._index_kids(kid, path + '/')
+
 
     def _load_direntry (self, sid):
         """
@@ -1101,8 +1604,7 @@ class OleFileIO:
             # if exception not raised, return the object
             return self.direntries[sid]
         #print "dir enntry sid = ", sid
-        self.directory_fp.seek(sid * 128)
-        entry = self.directory_fp.read(128)
+        entry = self._directory_data[sid * 128:(sid + 1) * 128]
         self.direntries[sid] = _OleDirectoryEntry(entry, sid, self)
         return self.direntries[sid]
 
@@ -1114,7 +1616,32 @@ class OleFileIO:
         self.root.dump()
 
 
-    def _open(self, start, size = 0x7FFFFFFF, force_FAT=False):
+    def _load_ministream(self):
+        """
+        Load the MiniFAT and the MiniStream, if it wasn't already done.
+        """
+        if self.ministream:
+            return
+        # streams may be read from several threads: the MiniStream is
+        # loaded once, and published only when it is complete
+        with self._ministream_lock:
+            if self.ministream:
+                return
+            self.loadminifat()
+            # The first sector index of the miniFAT stream is stored in the
+            # root directory entry:
+            size_ministream = self.root.size
+            if DEBUG_MODE: print ('Opening MiniStream: sect=%d, size=%d' %
+                (self.root.isectStart, size_ministream))
+            ministream = self._open(self.root.isectStart,
+                size_ministream, force_FAT=True)
+            # the whole MiniStream is kept in a single buffer, from which
+            # the streams stored in the MiniFAT are sliced:
+            self.ministream_data = ministream.getvalue()
+            self.ministream = ministream
+
+
+    def _open(self, start, size = 0x7FFFFFFF, force_FAT=False, extents=None):
         """
         Open a stream, either in FAT or MiniFAT according to its size.
         (openstream helper)
@@ -1123,29 +1650,45 @@ class OleFileIO:
         size: size of stream (or nothing if size is unknown)
         force_FAT: if False (default), stream will be opened in FAT or MiniFAT
                    according to size. If True, it will always be opened in FAT.
+        extents: extents of the stream, if already known (see _get_extents)
         """
         #print 'OleFileIO.open(): sect=%d, size=%d, force_FAT=%s' % (start, size, str(force_FAT))
         # stream size is compared to the MiniSectorCutoff threshold:
         if size < self.minisectorcutoff and not force_FAT:
             # ministream object
-            if not self.ministream:
-                # load MiniFAT if it wasn't already done:
-                self.loadminifat()
-                # The first sector index of the miniFAT stream is stored in the
-                # root directory entry:
-                size_ministream = self.root.size
-                if DEBUG_MODE: print ('Opening MiniStream: sect=%d, size=%d' %
-                    (self.root.isectStart, size_ministream))
-                self.ministream = self._open(self.root.isectStart,
-                    size_ministream, force_FAT=True)
+            self._load_ministream()
             return _OleStream(self.ministream, start, size, 0,
-                              self.minisectorsize, self.minifat)
+                              self.minisectorsize, self.minifat,
+                              self.minifat_breaks, extents)
         else:
             # standard stream
 #            return _OleStream(self.fp, start, size, 512,
 #                              self.sectorsize, self.fat)
             return _OleStream(self.fp, start, size, self.sectorsize,
-                              self.sectorsize, self.fat)
+                              self.sectorsize, self.fat, self.fat_breaks,
+                              extents)
+
+
+    def _get_extents(self, entry):
+        """
+        Return the extents of a stream: the list of (offset, length) runs of
+        contiguous sectors it is made of, in stream order. Offsets are given
+        in the OLE file for standard streams, and in the MiniStream for
+        streams stored in the MiniFAT. Extents are computed once per stream.
+
+        entry: _OleDirectoryEntry of the stream
+        """
+        if entry.extents is None:
+            if entry.size < self.minisectorcutoff:
+                self._load_ministream()
+                entry.extents = _chain_extents(
+                    entry.isectStart, entry.size, 0, self.minisectorsize,
+                    self.minifat, self.minifat_breaks)
+            else:
+                entry.extents = _chain_extents(
+                    entry.isectStart, entry.size, self.sectorsize,
+                    self.sectorsize, self.fat, self.fat_breaks)
+        return entry.extents
 
     def _list(self, files, prefix, node):
         """
@@ -1185,20 +1728,24 @@ class OleFileIO:
         raise IOError if file not found
         """
 
-        # if filename is a string instead of a list, split it on slashes to
-        # convert to a list:
-        if isinstance(filename, basestring):
-            filename = filename.split('/')
-        # walk across storage tree, following given path:
-        node = self.root
-        for name in filename:
-            for kid in node.kids:
-                if kid.name.lower() == name.lower():
-                    break
-            else:
-                raise IOError, "file not found"
-            node = kid
-        return node.sid
+        try:
+            return self._path_index[self._path_key(filename)]
+        except KeyError:
+            raise IOError, "file not found"
+
+
+    def _path_key(self, filename):
+        """
+        Return the key of given filename in the path index. (_find helper)
+
+        filename: path of stream in storage tree (see _find for syntax)
+        return: path as a lowercase string using Unix path syntax
+        """
+        # if filename is a list instead of a string, join it with slashes to
+        # convert to a string:
+        if not isinstance(filename, basestring):
+            filename = '/'.join(filename)
+        return filename.lower()
 
 
     def openstream(self, filename):
@@ -1217,7 +1764,109 @@ class OleFileIO:
         entry = self.direntries[sid]
         if entry.entry_type != STGTY_STREAM:
             raise IOError, "this file is not a stream"
-        return self._open(entry.isectStart, entry.size)
+        return self._open(entry.isectStart, entry.size,
+                          extents=self._get_extents(entry))
+
+
+    def _stream_range(self, filename, offset, size):
+        """
+        Find a stream and the extents of a range of its bytes in the file.
+        (helper for read_stream and openstream_buffers)
+
+        return: (directory entry, extents, size of the range)
+        raise IOError if filename not found, if this is not a stream, or if
+        the range is out of the stream.
+        """
+        sid = self._find(filename)
+        entry = self.direntries[sid]
+        if entry.entry_type != STGTY_STREAM:
+            raise IOError, "this file is not a stream"
+        extents = self._get_extents(entry)
+        if size is None:
+            size = max(entry.size - offset, 0)
+        if offset or size != entry.size:
+            if offset < 0 or size < 0 or offset + size > entry.size:
+                raise IOError, "range out of OLE stream"
+            extents = _extents_range(extents, offset, size)
+        return entry, extents, size
+
+
+    def openstream_buffers(self, filename, offset=0, size=None):
+        """
+        Open a stream, or a range of its bytes, as a list of read-only
+        buffers.
+
+        If the file was opened with use_mmap=True, each buffer is a zero-copy
+        view over one run of contiguous sectors of the mapped file, so that
+        the data can be wrapped with numpy.frombuffer and decoded without
+        being copied first. Streams stored in the MiniFAT, or files which
+        are not memory mapped, are returned as a single buffer over the
+        data read in memory. Buffers over the mapped file (and the arrays
+        wrapping them) must not be used after close().
+
+        filename: path of stream in storage tree (see openstream for syntax)
+        offset: offset of the first byte in the stream
+        size: number of bytes (None up to the end of the stream)
+        return: list of buffer objects, in stream order
+        raise IOError if filename not found, or if this is not a stream.
+        """
+        entry, extents, size = self._stream_range(filename, offset, size)
+        if self._mmap is None or entry.size < self.minisectorcutoff:
+            return [buffer(self.read_stream(filename, offset, size))]
+        buffers = [buffer(self._mmap, extent_offset, length)
+                   for extent_offset, length in extents]
+        if sum(len(b) for b in buffers) != size:
+            # the last sector of the file is incomplete
+            raise IOError, 'OLE stream size is less than declared'
+        return buffers
+
+
+    def openstream_buffer(self, filename, offset=0, size=None):
+        """
+        Open a stream, or a range of its bytes, as a single read-only
+        buffer.
+
+        The buffer is a zero-copy view over the mapped file when the file is
+        memory mapped and the range is stored in contiguous sectors;
+        otherwise the data is joined in memory (see openstream_buffers).
+
+        filename: path of stream in storage tree (see openstream for syntax)
+        offset: offset of the first byte in the stream
+        size: number of bytes (None up to the end of the stream)
+        return: buffer object
+        raise IOError if filename not found, or if this is not a stream.
+        """
+        buffers = self.openstream_buffers(filename, offset, size)
+        if len(buffers) == 1:
+            return buffers[0]
+        return buffer(string.join([str(b) for b in buffers], ""))
+
+
+    def read_stream(self, filename, offset=0, size=None):
+        """
+        Return the content of a stream, without wrapping it in a file
+        object. Streams stored in the MiniFAT are sliced from the MiniStream,
+        which is loaded only once. The data is always copied in a string,
+        use openstream_buffer to decode it from the memory map.
+
+        filename: path of stream in storage tree (see openstream for syntax)
+        offset: offset of the first byte to read in the stream
+        size: number of bytes to read (None to read up to the end of the
+        stream). Only the sectors holding these bytes are read.
+        return: string containing the stream data
+        raise IOError if filename not found, or if this is not a stream.
+        """
+        entry, extents, size = self._stream_range(filename, offset, size)
+        if entry.size < self.minisectorcutoff:
+            return _slice_extents(self.ministream_data, extents)
+        if self._mmap is not None:
+            data = _slice_extents(self._mmap, extents)
+            if len(data) != size:
+                # the last sector of the file is incomplete
+                raise IOError, 'OLE stream size is less than declared'
+            return data
+        return self._open(entry.isectStart, size, force_FAT=True,
+                          extents=extents).getvalue()
 
 
     def get_type(self, filename):
@@ -1231,12 +1880,10 @@ class OleFileIO:
             - STGTY_STORAGE: a storage
             - STGTY_ROOT: the root entry
         """
-        try:
-            sid = self._find(filename)
-            entry = self.direntries[sid]
-            return entry.entry_type
-        except:
+        sid = self._path_index.get(self._path_key(filename))
+        if sid is None:
             return False
+        return self.direntries[sid].entry_type
 
 
     def exists(self, filename):
@@ -1247,11 +1894,7 @@ class OleFileIO:
         filename: path of stream in storage tree. (see openstream for syntax)
         return: True if object exist, else False.
         """
-        try:
-            sid = self._find(filename)
-            return True
-        except:
-            return False
+        return self._path_key(filename) in self._path_index
 
 
     def get_size(self, filename):
@@ -27,6 +27,7 @@ import cv2
 import h5py
 import numpy as np
 from util import align
+from txm2nexuslib.storage import dataset_options
 
 
 class Image(object):
@@ -46,8 +47,7 @@ class Image(object):
 
     def extract_single_image_from_h5(self, data_set="data"):
         image = self.f_h5_handler[data_set].value
-        data_type = type(image[0][0])
-        self.data_type = data_type
+        self.data_type = image.dtype.type
         self.image = np.array(image, dtype=self.data_type)
         try:
             self.image_dataset = self.f_h5_handler[data_set].attrs["dataset"]
@@ -61,7 +61,9 @@ class Image(object):
         self.workflow_step = precedent_step + 1
         if dataset == "default":
             dataset = "data_" + str(self.workflow_step)
-        self.f_h5_handler.create_dataset(dataset, data=image)
+        self.f_h5_handler.create_dataset(
+            dataset, data=image,
+            **dataset_options(np.shape(image), np.asarray(image).dtype))
         self.f_h5_handler[dataset].attrs["step"] = self.workflow_step
         self.f_h5_handler[dataset].attrs["dataset"] = dataset
         self.f_h5_handler[dataset].attrs["description"] = description
@@ -119,13 +121,14 @@ class Image(object):
     def crop(self, roi={"top": 26, "bottom": 24, "left": 21, "right": 19}):
         """Crop an image. The roi indicates the pixels to be cut off.
         A default ROI is given to cut
-        the image borders"""
-        [rows, columns] = np.shape(self.image)
+        the image borders. The frames of a stack of images (as the
+        containers) are all cropped by the same roi."""
+        [rows, columns] = np.shape(self.image)[-2:]
         rows_from = roi["top"]
         rows_to = rows - roi["bottom"]
         columns_from = roi["left"]
         columns_to = columns - roi["right"]
-        image_cropped = self.image[rows_from:rows_to,
+        image_cropped = self.image[..., rows_from:rows_to,
                                    columns_from:columns_to]
         description = ("Image " + self.image_dataset +
                        " cropped by " + str(roi))
@@ -176,7 +179,8 @@ def store_single_image_in_new_h5(h5_filename, image, description="default",
     """Store a single image in a new hdf5 file"""
     f = h5py.File(h5_filename, 'w')
     data_type = type(image[0][0])
-    f.create_dataset(data_set, data=image, dtype=data_type)
+    f.create_dataset(data_set, data=image,
+                     **dataset_options(np.shape(image), data_type))
     f.flush()
     f.close()
 
@@ -364,13 +368,15 @@ def average_images(image_filenames, dataset_for_average="data",
                    description="", store=False,
                    output_h5_fn="default", dataset_store="data"):
     """Average images"""
-    image_obj = Image(h5_image_filename=image_filenames[0])
+    # the images are opened read-only, so that they are not modified
+    image_obj = Image(h5_image_filename=image_filenames[0], mode="r")
     average_image = np.zeros(np.shape(image_obj.image),
                              dtype=type(np.float32))
+    image_obj.close_h5()
     num_imgs = len(image_filenames)
     for image_fn in image_filenames:
         image_obj = Image(h5_image_filename=image_fn,
-                          image_data_set=dataset_for_average)
+                          image_data_set=dataset_for_average, mode="r")
         average_image += image_obj.image
         image_obj.close_h5()
     # Average of images that have been beforehand normalized by a constant
@@ -399,15 +405,17 @@ def divide_by_constant_and_average_images(image_filenames, constant=None,
     the normalized images.
     If the constant is not indicated, as default, the constant is
     the exposure time multiplied by the machine current. If the images shall
-    not be normalized, set the constant to 1."""
-    image_obj = Image(h5_image_filename=image_filenames[0])
+    not be normalized, set the constant to 1.
+    The images are opened read-only if nothing is stored in them."""
+    image_obj = Image(h5_image_filename=image_filenames[0], mode="r")
     image_norm_by_constant = image_obj.normalize_by_constant(constant)
     average_image = np.zeros(np.shape(image_obj.image),
                              dtype=type(image_norm_by_constant[0][0]))
     image_obj.close_h5()
     num_imgs = len(image_filenames)
+    mode = "r+" if store_normalized_by_constant else "r"
     for image_fn in image_filenames:
-        image_obj = Image(h5_image_filename=image_fn)
+        image_obj = Image(h5_image_filename=image_fn, mode=mode)
         image_norm_by_constant = image_obj.normalize_by_constant(
             constant, store_normalized_by_constant)
         average_image += image_norm_by_constant
@@ -430,18 +438,19 @@ def divide_by_constant_and_average_images(image_filenames, constant=None,
 
 def get_normalized_ff(ff_img_filenames):
     if isinstance(ff_img_filenames, list):
-        ff_img_obj = Image(h5_image_filename=ff_img_filenames[0])
+        ff_img_obj = Image(h5_image_filename=ff_img_filenames[0], mode="r")
     else:
-        ff_img_obj = Image(h5_image_filename=ff_img_filenames)
-
+        ff_img_obj = Image(h5_image_filename=ff_img_filenames, mode="r")
+    ff_img_obj.close_h5()
     return ff_img_obj.image
 
 
 def normalize_ff(ff_img_filenames):
+    # A single FF image is not modified: it is opened read-only
     if isinstance(ff_img_filenames, list):
-        ff_img_obj = Image(h5_image_filename=ff_img_filenames[0])
+        ff_img_obj = Image(h5_image_filename=ff_img_filenames[0], mode="r")
     else:
-        ff_img_obj = Image(h5_image_filename=ff_img_filenames)
+        ff_img_obj = Image(h5_image_filename=ff_img_filenames, mode="r")
 
     if isinstance(ff_img_filenames, list) and len(ff_img_filenames) > 1:
         ff_img_obj.close_h5()
@@ -453,6 +462,7 @@ def normalize_ff(ff_img_filenames):
     else:
         # Normalize FF image by exposure_time and machine_current
         ff_norm_image = ff_img_obj.normalize_by_constant()
+        ff_img_obj.close_h5()
 
     return ff_norm_image
 
@@ -25,13 +25,105 @@ import sys
 import h5py
 import numpy as np
 from txm2nexuslib.xrmnex import XradiaFile
+from txm2nexuslib.storage import dataset_options
+
+
+def read_xrm_metadata(xrm_file, xrm_filename, h5_filename):
+    """Read the metadata stored in the hdf5 files (see
+    Xrm2H5Converter.metadata_datasets) from an opened xrm file.
+    The fields which cannot be read are reported and skipped.
+    :return: dictionary of metadata fields
+    """
+    metadata = {}
+    readers = (
+        ('angle', lambda: xrm_file.get_angles()[0]),
+        ('energy', lambda: xrm_file.get_energies()[0]),
+        ('exposure_time', lambda: xrm_file.get_exp_times()[0]),
+        ('machine_current', lambda: xrm_file.get_machine_currents()[0]),
+        ('pixel_size', lambda: xrm_file.pixel_size),
+        ('magnification', xrm_file.get_xray_magnification),
+        ('image_width', xrm_file.get_image_width),
+        ('image_height', xrm_file.get_image_height),
+        ('x_position', lambda: xrm_file.get_x_positions()[0]),
+        ('y_position', lambda: xrm_file.get_y_positions()[0]),
+        ('z_position', lambda: xrm_file.get_z_positions()[0]),
+        ('data_type', lambda: xrm_file.data_type),
+        ('sample_name', lambda: xrm_filename.split('_')[1]),
+        ('date_time', xrm_file.get_single_date),
+    )
+    for field, reader in readers:
+        try:
+            metadata[field] = reader()
+        except Exception:
+            print("%s could not be converted from xrm to hdf5" % field)
+    metadata['FF'] = '_FF' in xrm_filename or '_ff_' in xrm_filename
+
+    # Instrument and Source
+    metadata['instrument'] = "BL09 @ ALBA"
+    metadata['source'] = "ALBA"
+    metadata['source_probe'] = "X-Ray"
+    metadata['source_type'] = "Sychrotron X-Ray Source"
+
+    # Applied program and command to convert the data
+    metadata['program_name'] = "xrm2h5"
+    metadata['command'] = (metadata['program_name'] + ' ' +
+                           ' '.join(sys.argv[1:]))
+
+    # Input and output files
+    metadata['input_file'] = os.path.basename(xrm_filename)
+    metadata['output_file'] = os.path.basename(h5_filename)
+    return metadata
+
+
+def write_h5_metadata(metadata_h5, metadata):
+    """Write the metadata read by read_xrm_metadata in the metadata group
+    of an hdf5 file (see Xrm2H5Converter.metadata_datasets)"""
+    for field, name, units in Xrm2H5Converter.metadata_datasets:
+        if field in metadata:
+            dataset = metadata_h5.create_dataset(name, data=metadata[field])
+            if units is not None:
+                dataset.attrs["units"] = units
 
 
 class Xrm2H5Converter(object):
 
-    def __init__(self, xrm_filename, h5_filename=None):
+    # Metadata datasets of the hdf5 file, in order of creation:
+    # (metadata field, dataset name, units)
+    metadata_datasets = (
+        ('angle', 'angle', 'degrees'),
+        ('energy', 'energy', 'eV'),
+        ('exposure_time', 'exposure_time', 's'),
+        ('machine_current', 'machine_current', 'mA'),
+        ('pixel_size', 'pixel_size', 'um'),
+        ('magnification', 'magnification', None),
+        ('image_width', 'image_width', 'pixels'),
+        ('image_height', 'image_height', 'pixels'),
+        ('x_position', 'x_position', 'um'),
+        ('y_position', 'y_position', 'um'),
+        ('z_position', 'z_position', 'um'),
+        ('data_type', 'data_type', None),
+        ('sample_name', 'sample_name', None),
+        ('FF', 'FF', None),
+        ('date_time', 'date_time_acquisition', None),
+        ('instrument', 'instrument', None),
+        ('source', 'source', None),
+        ('source_probe', 'source_probe', None),
+        ('source_type', 'source_type', None),
+        ('program_name', 'program_name', None),
+        ('command', 'command', None),
+        ('input_file', 'input_file', None),
+        ('output_file', 'output_file', None),
+    )
+
+    def __init__(self, xrm_filename, h5_filename=None, roi=None):
+        """
+        :param roi: optional dictionary with the number of pixels to cut
+        off at the "top", "bottom", "left" and "right" of the image; the
+        image is then cropped while it is read from the xrm file.
+        """
         self.xrm_filename = xrm_filename
         self.h5_filename = h5_filename
+        self.roi = roi
         if h5_filename is None:
             self.h5_filename = os.path.splitext(xrm_filename)[0] + '.hdf5'
         self.h5_handler = h5py.File(self.h5_filename, 'w')
@@ -40,203 +132,147 @@ class Xrm2H5Converter(object):
         self.data = {}
         self.full_data = {}
 
-    def _convert_metadata_from_xrm_to_h5(self):
-
-        with XradiaFile(self.xrm_filename) as xrm_file:
-            try:
-                self.metadata['angle'] = xrm_file.get_angles()[0]
-                self.metadata_h5.create_dataset(
-                    "angle",
-                    data=self.metadata['angle'])
-                self.metadata_h5["angle"].attrs["units"] = "degrees"
-            except Exception:
-                print("angle could not be converted from xrm to hdf5")
-
-            try:
-                self.metadata['energy'] = xrm_file.get_energies()[0]
-                self.metadata_h5.create_dataset(
-                    "energy",
-                    data=self.metadata['energy'])
-                self.metadata_h5["energy"].attrs["units"] = "eV"
-            except Exception:
-                print("energy could not be converted from xrm to hdf5")
-
-            try:
-                self.metadata['exposure_time'] = xrm_file.get_exp_times()[0]
-                self.metadata_h5.create_dataset(
-                    "exposure_time",
-                    data=self.metadata['exposure_time'])
-                self.metadata_h5["exposure_time"].attrs["units"] = "s"
-            except Exception:
-                print("exposure_time could not be converted from xrm to hdf5")
-
-            try:
-                self.metadata['machine_current'] = \
-                    xrm_file.get_machine_currents()[0]
-                self.metadata_h5.create_dataset(
-                    "machine_current",
-                    data=self.metadata['machine_current'])
-                self.metadata_h5["machine_current"].attrs["units"] = "mA"
-            except Exception:
-                print("machine_current could not be "
-                      "converted from xrm to hdf5")
-
-            try:
-                self.metadata['pixel_size'] = xrm_file.pixel_size
-                self.metadata_h5.create_dataset(
-                    "pixel_size",
-                    data=self.metadata['pixel_size'])
-                self.metadata_h5["pixel_size"].attrs["units"] = "um"
-            except Exception:
-                print("pixel_size could not be converted from xrm to hdf5")
+    def _read_metadata_from_xrm(self, xrm_file):
+        """Read the metadata of the opened xrm file in self.metadata.
+        The fields which cannot be read are reported and skipped."""
+        self.metadata.update(read_xrm_metadata(xrm_file, self.xrm_filename,
+                                               self.h5_filename))
+        return self.metadata
 
-            try:
-                self.metadata['magnification'] = \
-                    xrm_file.get_xray_magnification()
-                self.metadata_h5.create_dataset(
-                    "magnification",
-                    data=self.metadata['magnification'])
-            except Exception:
-                print("magnification could not be converted from xrm to hdf5")
+    def _read_raw_image_from_xrm(self, xrm_file):
+        try:
+            self.data['data'] = xrm_file.get_raw_image_2D(roi=self.roi)
+        except Exception:
+            print("image raw data could not be converted from xrm to hdf5")
+        return self.data
 
-            try:
-                self.metadata['image_width'] = xrm_file.get_image_width()
-                self.metadata_h5.create_dataset(
-                    "image_width",
-                    data=self.metadata['image_width'])
-                self.metadata_h5["image_width"].attrs["units"] = "pixels"
-            except Exception:
-                print("image_width could not be converted from xrm to hdf5")
+    def _write_metadata_to_h5(self):
+        """Write all the metadata read from the xrm file at once"""
+        write_h5_metadata(self.metadata_h5, self.metadata)
 
-            try:
-                self.metadata['image_height'] = xrm_file.get_image_height()
-                self.metadata_h5.create_dataset(
-                    "image_height",
-                    data=self.metadata['image_height'])
-                self.metadata_h5["image_height"].attrs["units"] = "pixels"
-            except Exception:
-                print("image_height could not be converted from xrm to hdf5")
+    def _write_raw_image_to_h5(self):
+        if 'data' not in self.data:
+            return
+        workflow_step = 1
+        dataset = "data_" + str(workflow_step)
+        image = self.data['data']
+        data = self.h5_handler.create_dataset(
+            dataset, data=image,
+            **dataset_options(image.shape, np.uint16, raw=True))
+        data.attrs["step"] = workflow_step
+        data.attrs["dataset"] = dataset
+        if self.roi is None:
+            data.attrs["description"] = "raw data"
+        else:
+            data.attrs["description"] = (
+                "raw data cropped by " + str(self.roi))
+        self.h5_handler["data"] = h5py.SoftLink(dataset)
 
-            try:
-                self.metadata['x_position'] = xrm_file.get_x_positions()[0]
-                self.metadata_h5.create_dataset(
-                    "x_position",
-                    data=self.metadata['x_position'])
-                self.metadata_h5["x_position"].attrs["units"] = "um"
-            except Exception:
-                print("x_position could not be converted from xrm to hdf5")
-
-            try:
-                self.metadata['y_position'] = xrm_file.get_y_positions()[0]
-                self.metadata_h5.create_dataset(
-                    "y_position",
-                    data=self.metadata['y_position'])
-                self.metadata_h5["y_position"].attrs["units"] = "um"
-            except Exception:
-                print("y_position could not be converted from xrm to hdf5")
+    def convert_xrm_to_h5_file(self):
+        # the xrm file is opened once: its metadata and image are read in
+        # a single pass, and then written to the hdf5 file
+        with XradiaFile(self.xrm_filename) as xrm_file:
+            self._read_metadata_from_xrm(xrm_file)
+            self._read_raw_image_from_xrm(xrm_file)
+        self._write_metadata_to_h5()
+        self._write_raw_image_to_h5()
+        self.full_data["metadata"] = self.metadata
+        self.full_data["data"] = self.data
+        self.h5_handler.flush()
+        self.h5_handler.close()
 
-            try:
-                self.metadata['z_position'] = xrm_file.get_z_positions()[0]
-                self.metadata_h5.create_dataset(
-                    "z_position",
-                    data=self.metadata['z_position'])
-                self.metadata_h5["z_position"].attrs["units"] = "um"
-            except Exception:
-                print("z_position could not be converted from xrm to hdf5")
 
-            try:
-                self.metadata['data_type'] = xrm_file.data_type
-                self.metadata_h5.create_dataset(
-                    "data_type",
-                    data=self.metadata['data_type'])
-            except Exception:
-                print("data_type could not be converted from xrm to hdf5")
+class Xrm2H5ContainerConverter(object):
+    """Convert many single image xrm files (usually the images of an
+    acquisition: same date, sample, energy...) into a single hdf5 file,
+    the container. The images are stored, in the given order, as the
+    frames of a 3D dataset (data_1, linked as data), and each metadata
+    dataset of the single image hdf5 files becomes an array with one
+    value per frame; metadata/input_file gives the xrm file of each
+    frame. The xrm files which cannot be read are reported and skipped."""
 
-            try:
-                self.metadata['sample_name'] = self.xrm_filename.split('_')[1]
-                self.metadata_h5.create_dataset(
-                    "sample_name",
-                    data=self.metadata['sample_name'])
-            except Exception:
-                print("sample_name could not be converted from xrm to hdf5")
+    # Metadata which has the same value for all the frames
+    constant_fields = ('instrument', 'source', 'source_probe', 'source_type',
+                       'program_name', 'command', 'output_file')
 
-            try:
-                if ('_FF' in self.xrm_filename or
-                        '_ff_' in self.xrm_filename):
-                    self.metadata['FF'] = True
-                    self.metadata_h5.create_dataset("FF",
-                                                   data=self.metadata['FF'])
-                else:
-                    self.metadata['FF'] = False
-                    self.metadata_h5.create_dataset("FF",
-                                                   data=self.metadata['FF'])
-            except Exception:
-                print("FF information could not be retrieved")
-
-            # Get acquisition time
-            try:
-                self.metadata['date_time'] = xrm_file.get_single_date()
-                self.metadata_h5.create_dataset(
-                    "date_time_acquisition", data=self.metadata['date_time'])
-            except Exception:
-                print("acquisition date and time could not be converted "
-                      "from xrm to hdf5")
-
-            # Instrument and Source
-            self.metadata['instrument'] = "BL09 @ ALBA"
-            self.metadata_h5.create_dataset("instrument",
-                                           data=self.metadata['instrument'])
-            self.metadata['source'] = "ALBA"
-            self.metadata_h5.create_dataset("source",
-                                           data=self.metadata['source'])
-            self.metadata['source_probe'] = "X-Ray"
-            self.metadata_h5.create_dataset("source_probe",
-                                           data=self.metadata['source_probe'])
-            self.metadata['source_type'] = "Sychrotron X-Ray Source"
-
-            # Applied program and command to convert the data
-            self.metadata_h5.create_dataset("source_type",
-                                           data=self.metadata['source_type'])
-            self.metadata['program_name'] = "xrm2h5"
-            self.metadata_h5.create_dataset("program_name",
-                                           data=self.metadata['program_name'])
-            command = (self.metadata['program_name'] + ' ' +
-                       ' '.join(sys.argv[1:]))
-            self.metadata['command'] = command
-            self.metadata_h5.create_dataset("command",
-                                           data=self.metadata['command'])
-
-            # Input and output files
-            self.metadata['input_file'] = os.path.basename(self.xrm_filename)
-            self.metadata_h5.create_dataset("input_file",
-                                           data=self.metadata['input_file'])
-            self.metadata['output_file'] = os.path.basename(self.h5_filename)
-            self.metadata_h5.create_dataset("output_file",
-                                           data=self.metadata['output_file'])
-        return self.metadata
+    def __init__(self, xrm_filenames, h5_filename, roi=None):
+        """
+        :param roi: see Xrm2H5Converter
+        """
+        self.xrm_filenames = xrm_filenames
+        self.h5_filename = h5_filename
+        self.roi = roi
 
-    def _convert_raw_image_from_xrm_to_h5(self):
-        with XradiaFile(self.xrm_filename) as self.xrm_file:
-            try:
-                self.data['data'] = self.xrm_file.get_image_2D()
-                self.h5_handler.create_dataset(
-                    "data_1",
-                    dtype=np.uint16,
-                    data=self.data['data'])
-                workflow_step = 1
-                dataset = "data_" + str(workflow_step)
-                self.h5_handler[dataset].attrs["step"] = workflow_step
-                self.h5_handler[dataset].attrs["dataset"] = dataset
-                self.h5_handler[dataset].attrs["description"] = "raw data"
-                self.h5_handler["data"] = h5py.SoftLink(dataset)
-            except Exception:
-                print("image raw data could not be converted from xrm to hdf5")
-        return self.data
+    def _write_metadata_to_h5(self, metadata_h5, frames_metadata):
+        for field, name, units in Xrm2H5Converter.metadata_datasets:
+            values = [metadata.get(field) for metadata in frames_metadata]
+            if None in values:
+                print("%s could not be converted from xrm to hdf5" % field)
+                continue
+            if field in self.constant_fields:
+                dataset = metadata_h5.create_dataset(name, data=values[0])
+            elif isinstance(values[0], basestring):
+                dataset = metadata_h5.create_dataset(
+                    name, data=np.array(values, dtype=object),
+                    dtype=h5py.special_dtype(vlen=unicode))
+            else:
+                dataset = metadata_h5.create_dataset(name, data=values)
+            if units is not None:
+                dataset.attrs["units"] = units
 
     def convert_xrm_to_h5_file(self):
-        self._convert_metadata_from_xrm_to_h5()
-        self._convert_raw_image_from_xrm_to_h5()
-        self.full_data["metadata"] = self.metadata
-        self.full_data["data"] = self.data
-        self.h5_handler.flush()
-        self.h5_handler.close()
+        """
+        :return: xrm files converted, in the order of their frames
+        """
+        n_frames = len(self.xrm_filenames)
+        h5_handler = h5py.File(self.h5_filename, 'w')
+        workflow_step = 1
+        dataset = "data_" + str(workflow_step)
+        data = None
+        frames_metadata = []
+        converted_filenames = []
+        for xrm_filename in self.xrm_filenames:
+            try:
+                with XradiaFile(xrm_filename) as xrm_file:
+                    metadata = read_xrm_metadata(xrm_file, xrm_filename,
+                                                 self.h5_filename)
+                    image = xrm_file.get_raw_image_2D(roi=self.roi)
+                if data is not None and image.shape != data.shape[1:]:
+                    raise ValueError("image shape %s instead of %s" % (
+                        image.shape, data.shape[1:]))
+            except Exception as e:
+                print("%s could not be converted from xrm to hdf5: %s" % (
+                    xrm_filename, e))
+                continue
+            if data is None:
+                num_rows, num_columns = image.shape
+                shape = (n_frames, num_rows, num_columns)
+                data = h5_handler.create_dataset(
+                    dataset, shape=shape, maxshape=(None,) + shape[1:],
+                    **dataset_options(shape, np.uint16,
+                                      chunks=(1, num_rows, num_columns),
+                                      raw=True))
+            data[len(converted_filenames)] = image
+            frames_metadata.append(metadata)
+            converted_filenames.append(xrm_filename)
+        if data is None:
+            h5_handler.close()
+            os.remove(self.h5_filename)
+            return converted_filenames
+        n_frames = len(converted_filenames)
+        if n_frames < data.shape[0]:
+            data.resize(n_frames, axis=0)
+        data.attrs["step"] = workflow_step
+        data.attrs["dataset"] = dataset
+        data.attrs["Number of Frames"] = n_frames
+        if self.roi is None:
+            data.attrs["description"] = "raw data"
+        else:
+            data.attrs["description"] = (
+                "raw data cropped by " + str(self.roi))
+        h5_handler["data"] = h5py.SoftLink(dataset)
+        self._write_metadata_to_h5(h5_handler.create_group("metadata"),
+                                   frames_metadata)
+        h5_handler.flush()
+        h5_handler.close()
+        return converted_filenames
@@ -36,7 +36,9 @@ from tinydb.middlewares import CachingMiddleware
 from tinydb.storages import MemoryStorage
 
 from txm2nexuslib.parser import get_file_paths
-from txm2nexuslib.images.util import filter_file_index, dict2hdf5
+from txm2nexuslib.storage import dataset_options
+from txm2nexuslib.images.util import (filter_file_index, dict2hdf5,
+                                      check_single_image_records)
 
 
 def create_structure_dict(type_struct="normalized"):
@@ -205,11 +207,12 @@ def data_2_hdf5(h5_stack_file_handler,
         if num_img == 0:
             n_frames = len(data_filenames)
             num_rows, num_columns = np.shape(f[dataset].value)
+            shape = (n_frames, num_rows, num_columns)
             h5_stack_file_handler[main_grp].create_dataset(
                 main_dataset,
-                shape=(n_frames, num_rows, num_columns),
-                chunks=(1, num_rows, num_columns),
-                dtype='float32')
+                shape=shape,
+                **dataset_options(shape, 'float32',
+                                  chunks=(1, num_rows, num_columns)))
             h5_stack_file_handler[main_grp][main_dataset].attrs[
                 'Number of Frames'] = n_frames
         h5_stack_file_handler[main_grp][main_dataset][
@@ -225,11 +228,12 @@ def data_2_hdf5(h5_stack_file_handler,
             if num_img_ff == 0:
                 n_ff_frames = len(ff_filenames)
                 num_rows, num_columns = np.shape(f[dataset].value)
+                shape = (n_ff_frames, num_rows, num_columns)
                 h5_stack_file_handler[main_grp].create_dataset(
                     ff_dataset,
-                    shape=(n_ff_frames, num_rows, num_columns),
-                    chunks=(1, num_rows, num_columns),
-                    dtype='float32')
+                    shape=shape,
+                    **dataset_options(shape, 'float32',
+                                      chunks=(1, num_rows, num_columns)))
                 h5_stack_file_handler[main_grp][ff_dataset].attrs[
                     'Number of Frames'] = n_ff_frames
             h5_stack_file_handler[main_grp][ff_dataset][
@@ -328,6 +332,7 @@ def many_images_to_h5_stack(file_index_fn, table_name="hdf5_proc",
 
     root_path = os.path.dirname(os.path.abspath(file_index_fn))
     all_file_records = file_index_db.all()
+    check_single_image_records(all_file_records, "many_images_to_h5_stack")
     stack_table = db.table("hdf5_stacks")
     stack_table.purge()
     files_list = []
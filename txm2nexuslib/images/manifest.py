@@ -0,0 +1,206 @@
+#!/usr/bin/python
+
+"""
+(C) Copyright 2018 ALBA-CELLS
+Authors: Marc Rosanes, Carlos Falcon, Zbigniew Reszela, Carlos Pascual
+The program is distributed under the terms of the
+GNU General Public License (or the Lesser GPL).
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+
+import os
+import hashlib
+
+from joblib import Parallel
+
+
+# Table of the files index DB where the manifest is stored
+MANIFEST_TABLE = "manifest"
+
+# Number of files processed between two writes of the manifest: an
+# interrupted stage is resumed from the last write
+MANIFEST_FLUSH_SIZE = 256
+
+# Size of the blocks read at the beginning and at the end of the files by
+# fast_hash
+HASH_BLOCK_SIZE = 1 << 20
+
+
+def fast_hash(filename):
+    """Hash of the size, first block and last block of a file: it detects
+    files rewritten with different contents without reading them
+    completely"""
+    size = os.path.getsize(filename)
+    file_hash = hashlib.md5(str(size))
+    with open(filename, "rb") as f:
+        file_hash.update(f.read(HASH_BLOCK_SIZE))
+        if size > HASH_BLOCK_SIZE:
+            f.seek(max(size - HASH_BLOCK_SIZE, HASH_BLOCK_SIZE))
+            file_hash.update(f.read())
+    return file_hash.hexdigest()
+
+
+def file_signature(filename, use_hash=False):
+    """Size and modification time of a file, and its fast_hash if
+    use_hash is True"""
+    stat = os.stat(filename)
+    signature = {'size': stat.st_size, 'mtime': stat.st_mtime}
+    if use_hash:
+        signature['hash'] = fast_hash(filename)
+    return signature
+
+
+class Manifest(object):
+    """Record of the processing stages completed on each output file of a
+    files index DB, stored in its manifest table.
+
+    A stage with a source file (as xrm -> hdf5, or hdf5 -> _proc copy),
+    or with a list of source files (as the average of images), creates
+    its output: its entry records the signature of the sources, and a
+    stage done again on the output replaces the entry. A stage without a
+    source (as the crop, the normalization or the alignment) modifies its
+    output in place: it is added to the stages of the entry. Each entry
+    also records the signature of the output after its last stage; an
+    output modified by a stage not recorded in the manifest is no longer
+    up to date for any stage, so it is produced again from its source.
+    """
+
+    def __init__(self, db, root_path, use_hash=False):
+        """
+        :param db: files index DB (TinyDB)
+        :param root_path: folder of the files index DB; the paths of the
+        files are recorded relative to it
+        :param use_hash: if True, the sources are also identified by their
+        fast_hash, and not only by their size and modification time
+        """
+        self.db = db
+        self.root_path = root_path
+        self.use_hash = use_hash
+        self.table = db.table(MANIFEST_TABLE)
+        self.entries = dict((entry['output'], entry)
+                            for entry in self.table.all())
+
+    def _key(self, filename):
+        return os.path.relpath(os.path.abspath(filename), self.root_path)
+
+    def _source_changed(self, entry, source):
+        recorded = entry.get('source_signature')
+        if recorded is None:
+            return True
+        if isinstance(source, list):
+            if entry['source'] != [self._key(name) for name in source]:
+                return True
+            return any(self._signature_changed(signature, name)
+                       for signature, name in zip(recorded, source))
+        if entry['source'] != self._key(source):
+            return True
+        return self._signature_changed(recorded, source)
+
+    def _signature_changed(self, recorded, source):
+        if self.use_hash and 'hash' in recorded:
+            # a source copied again with the same contents is unchanged
+            return (recorded['size'] != os.path.getsize(source) or
+                    recorded['hash'] != fast_hash(source))
+        signature = file_signature(source)
+        return (recorded['size'] != signature['size'] or
+                recorded['mtime'] != signature['mtime'])
+
+    def is_consistent(self, output):
+        """True if the output is recorded, and it has not been modified
+        since its last recorded stage"""
+        entry = self.entries.get(self._key(output))
+        return (entry is not None and os.path.isfile(output) and
+                entry['signature'] == file_signature(output))
+
+    def is_up_to_date(self, stage, output, source=None):
+        """True if the stage has been completed on the output and neither
+        the output nor its source have been modified since"""
+        entry = self.entries.get(self._key(output))
+        if entry is None or stage not in entry['stages']:
+            return False
+        if source is not None and self._source_changed(entry, source):
+            return False
+        return self.is_consistent(output)
+
+    def record(self, stage, output, source=None):
+        """Record that the stage has been completed on the output"""
+        key = self._key(output)
+        if isinstance(source, list):
+            entry = {'output': key,
+                     'source': [self._key(name) for name in source],
+                     'source_signature': [
+                         file_signature(name, use_hash=self.use_hash)
+                         for name in source],
+                     'stages': [stage]}
+        elif source is not None:
+            entry = {'output': key, 'source': self._key(source),
+                     'source_signature': file_signature(
+                         source, use_hash=self.use_hash),
+                     'stages': [stage]}
+        else:
+            entry = self.entries[key]
+            if stage not in entry['stages']:
+                entry['stages'].append(stage)
+        entry['signature'] = file_signature(output)
+        self.entries[key] = entry
+
+    def forget(self, output):
+        """Remove the entry of an output whose stages are not known"""
+        self.entries.pop(self._key(output), None)
+
+    def flush(self):
+        """Write the manifest to the files index DB file"""
+        self.table.purge()
+        self.table.insert_multiple(self.entries.values())
+        self.db.storage.flush()
+
+
+def stage_name(stage, roi=None):
+    """Name of a stage recorded in the manifest: the roi used, if any, is
+    part of it, so that the stage is done again if the roi changes"""
+    if roi is None:
+        return stage
+    return stage + " " + str(sorted(roi.items()))
+
+
+def run_stage(manifest, stage, jobs, cores=-2):
+    """Run, in parallel, the jobs of a stage whose output is not up to
+    date, and record them in the manifest as they are completed.
+    :param jobs: list of (source, output, task) tuples, where task is the
+    joblib delayed call doing the job, and source is None for the jobs
+    that modify their output in place (or a list of files for the jobs
+    with many sources)
+    :return: number of jobs run
+    """
+    pending = [(source, output, task) for source, output, task in jobs
+               if not manifest.is_up_to_date(stage, output, source=source)]
+    # the stages done on the outputs modified in place are only kept if
+    # they are all known
+    consistent = set(output for source, output, _ in pending
+                     if source is None and manifest.is_consistent(output))
+    for start in range(0, len(pending), MANIFEST_FLUSH_SIZE):
+        chunk = pending[start:start + MANIFEST_FLUSH_SIZE]
+        # The backend parameter can be either "threading" or
+        # "multiprocessing".
+        Parallel(n_jobs=cores, backend="multiprocessing")(
+            task for _, _, task in chunk)
+        for source, output, _ in chunk:
+            if source is not None or output in consistent:
+                manifest.record(stage, output, source=source)
+            else:
+                manifest.forget(output)
+        manifest.flush()
+    return len(pending)
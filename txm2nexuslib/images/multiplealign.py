@@ -32,7 +32,13 @@ from tinydb.storages import MemoryStorage
 from util import create_subset_db
 from txm2nexuslib.parser import get_file_paths
 from txm2nexuslib.image.image_operate_lib import Image
-from txm2nexuslib.images.util import filter_file_index
+from txm2nexuslib.images.util import (filter_file_index,
+                                      check_single_image_records)
+from txm2nexuslib.images.manifest import Manifest, run_stage
+
+
+# Stage of the manifest recorded for the aligned images
+ALIGN_STAGE = "align"
 
 
 def align_and_store_from_fn(couple_imgs_to_align_filenames,
@@ -61,12 +67,14 @@ def align_images(file_index_fn, table_name="hdf5_proc",
                  roi_size=0.5, variable="zpz",
                  align_method='cv2.TM_CCOEFF_NORMED',
                  date=None, sample=None, energy=None, cores=-2,
-                 query=None, jj=True):
+                 query=None, jj=True, incremental=True):
     """Align images of one experiment by zpz.
     If date, sample and/or energy are indicated, only the corresponding
     images for the given date, sample and/or energy are cropped.
     The crop of the different images will be done in parallel: all cores
     but one used (Value=-2). Each file, contains a single image to be cropped.
+    If incremental is True, the images recorded in the manifest of the DB
+    as already aligned are not aligned again (see Manifest).
     """
 
     start_time = time.time()
@@ -86,8 +94,7 @@ def align_images(file_index_fn, table_name="hdf5_proc",
         file_records = file_index_db.search(query)
     else:
         file_records = file_index_db.all()
-
-    n_files = len(file_records)
+    check_single_image_records(file_records, ALIGN_STAGE)
 
     couples_to_align = []
     # The goal in this case is to align all the images for a same date,
@@ -190,17 +197,32 @@ def align_images(file_index_fn, table_name="hdf5_proc",
             #    pobj.pprint(rec["filename"])
             _get_couples_to_align(couples_to_align, h5_records, root_path)
 
-    if couples_to_align:
-        Parallel(n_jobs=cores, backend="multiprocessing")(
-            delayed(align_and_store_from_fn)(
-                couple_to_align,
-                dataset_reference=dataset_reference,
-                dataset_for_aligning=dataset_for_aligning,
-                align_method=align_method,
-                roi_size=roi_size) for couple_to_align in couples_to_align)
-
-    print("--- Align %d files took %s seconds ---\n" %
-          (n_files, (time.time() - start_time)))
+    if incremental:
+        manifest = Manifest(db, root_path)
+        # the image aligned is the second one of each couple
+        jobs = [(None, couple_to_align[1],
+                 delayed(align_and_store_from_fn)(
+                     couple_to_align,
+                     dataset_reference=dataset_reference,
+                     dataset_for_aligning=dataset_for_aligning,
+                     align_method=align_method,
+                     roi_size=roi_size))
+                for couple_to_align in couples_to_align]
+        n_aligned = run_stage(manifest, ALIGN_STAGE, jobs, cores=cores)
+    else:
+        if couples_to_align:
+            Parallel(n_jobs=cores, backend="multiprocessing")(
+                delayed(align_and_store_from_fn)(
+                    couple_to_align,
+                    dataset_reference=dataset_reference,
+                    dataset_for_aligning=dataset_for_aligning,
+                    align_method=align_method,
+                    roi_size=roi_size) for couple_to_align in couples_to_align)
+        n_aligned = len(couples_to_align)
+
+    print("--- Align %d files (%d up to date) took %s seconds ---\n" %
+          (n_aligned, len(couples_to_align) - n_aligned,
+           (time.time() - start_time)))
     db.close()
 
 
@@ -31,13 +31,24 @@ from tinydb.middlewares import CachingMiddleware
 from txm2nexuslib.image.image_operate_lib import Image
 from txm2nexuslib.parser import get_file_paths
 from txm2nexuslib.image.image_operate_lib import average_images
-from txm2nexuslib.images.util import filter_file_index
+from txm2nexuslib.images.util import (filter_file_index,
+                                      check_single_image_records)
+from txm2nexuslib.images.manifest import Manifest, run_stage
+
+
+# Stage of the manifest recorded for the averages of the groups of images
+AVERAGE_STAGE = "average"
 
 
 def average_and_store(group_to_average_image_filenames,
                       dataset_for_averaging="data",
                       variable="zpz", description="",
-                      dataset_store="data", jj=True):
+                      dataset_store="data", jj=True, store=True):
+    """Average a group of images into a new hdf5 file (see
+    average_image_groups), with the metadata of the first image.
+    If store is False, the average is not done: only its record is given.
+    :return: record of the average file
+    """
 
     if variable == "zpz":
         zp_central = group_to_average_image_filenames[0]
@@ -53,11 +64,12 @@ def average_and_store(group_to_average_image_filenames,
                      "_" + str(angle) + "_" +
                      str(zp_central) + "_avg_zpz.hdf5")
         output_complete_fn = dir_name + "/" + output_fn
-        average_images(images_to_average_filenames,
-                       dataset_for_average=dataset_for_averaging,
-                       description=description, store=True,
-                       output_h5_fn=output_complete_fn,
-                       dataset_store=dataset_store)
+        if store:
+            average_images(images_to_average_filenames,
+                           dataset_for_average=dataset_for_averaging,
+                           description=description, store=True,
+                           output_h5_fn=output_complete_fn,
+                           dataset_store=dataset_store)
 
         # Store metadata
         # TODO: Do average of values of each group of images to be averaged
@@ -89,11 +101,12 @@ def average_and_store(group_to_average_image_filenames,
                      "_" + str(jj_offset) + "_" + str(angle) +
                      "_avg_repetitions.hdf5")
         output_complete_fn = dir_name + "/" + output_fn
-        average_images(images_to_average_filenames,
-                       dataset_for_average=dataset_for_averaging,
-                       description=description, store=True,
-                       output_h5_fn=output_complete_fn,
-                       dataset_store=dataset_store)
+        if store:
+            average_images(images_to_average_filenames,
+                           dataset_for_average=dataset_for_averaging,
+                           description=description, store=True,
+                           output_h5_fn=output_complete_fn,
+                           dataset_store=dataset_store)
 
         # Store metadata: extracting metadata from repetition 0
         record = {"filename": output_fn, "extension": ".hdf5",
@@ -117,11 +130,12 @@ def average_and_store(group_to_average_image_filenames,
         output_fn = (str(date) + "_" + str(sample) + "_" + str(energy) +
                      "_avg_repetitions.hdf5")
         output_complete_fn = dir_name + "/" + output_fn
-        average_images(images_to_average_filenames,
-                       dataset_for_average=dataset_for_averaging,
-                       description=description, store=True,
-                       output_h5_fn=output_complete_fn,
-                       dataset_store=dataset_store)
+        if store:
+            average_images(images_to_average_filenames,
+                           dataset_for_average=dataset_for_averaging,
+                           description=description, store=True,
+                           output_h5_fn=output_complete_fn,
+                           dataset_store=dataset_store)
 
         # Store metadata: extracting metadata from repetition 0
         record = {"filename": output_fn, "extension": ".hdf5",
@@ -129,6 +143,9 @@ def average_and_store(group_to_average_image_filenames,
                   "average": True, "avg_by": "repetition",
                   "num_repetitions": num_repetitions}
 
+    if not store:
+        return record
+
     img_in_obj = Image(images_to_average_filenames[0], mode="r")
     h5_in = img_in_obj.f_h5_handler
     img_avg_obj = Image(output_complete_fn)
@@ -202,6 +219,7 @@ def average_image_group_by_energy(file_index_fn, table_name="hdf5_proc",
                                       energy=energy, ff=False)
 
     all_file_records = file_index_db.all()
+    check_single_image_records(all_file_records, AVERAGE_STAGE)
     averages_table = db.table("hdf5_averages")
 
     # We only have files for a single energy
@@ -279,6 +297,7 @@ def average_image_group_by_angle(file_index_fn, table_name="hdf5_proc",
                                       energy=energy, angle=angle, ff=False)
 
     all_file_records = file_index_db.all()
+    check_single_image_records(all_file_records, AVERAGE_STAGE)
     averages_table = db.table("hdf5_averages")
 
     # We only have files for a single angle
@@ -342,13 +361,16 @@ def average_image_groups(file_index_fn, table_name="hdf5_proc",
                          dataset_for_averaging="data", variable="zpz",
                          description="", dataset_store="data",
                          date=None, sample=None, energy=None, cores=-2,
-                         jj=True):
+                         jj=True, incremental=True):
     """Average images of one experiment by zpz.
     If date, sample and/or energy are indicated, only the corresponding
     images for the given date, sample and/or energy are processed.
     The average of the different groups of images will be done in parallel:
     all cores but one used (Value=-2). All data images of the same angle,
     for the different ZPz are averaged.
+    If incremental is True, the averages recorded in the manifest of the
+    DB as done from the current images of their group are not done again
+    (see Manifest).
     """
 
     """
@@ -378,6 +400,7 @@ def average_image_groups(file_index_fn, table_name="hdf5_proc",
                                       energy=energy, ff=False)
 
     all_file_records = file_index_db.all()
+    check_single_image_records(all_file_records, AVERAGE_STAGE)
     n_files = len(all_file_records)
 
     averages_table = db.table("hdf5_averages")
@@ -488,7 +511,25 @@ def average_image_groups(file_index_fn, table_name="hdf5_proc",
             complete_group_to_average.append(date_sample_energy)
             groups_to_average.append(complete_group_to_average)
 
-    if groups_to_average[0][1]:
+    n_groups = len(groups_to_average)
+    if incremental and groups_to_average[0][1]:
+        manifest = Manifest(db, root_path)
+        records = []
+        jobs = []
+        for group_to_average in groups_to_average:
+            record = average_and_store(group_to_average, variable=variable,
+                                       jj=jj, store=False)
+            records.append(record)
+            images = group_to_average[1]
+            output = os.path.join(os.path.dirname(images[0]),
+                                  record["filename"])
+            jobs.append((images, output, delayed(average_and_store)(
+                group_to_average,
+                dataset_for_averaging=dataset_for_averaging,
+                variable=variable, description=description,
+                dataset_store=dataset_store, jj=jj)))
+        n_groups = run_stage(manifest, AVERAGE_STAGE, jobs, cores=cores)
+    elif groups_to_average[0][1]:
         records = Parallel(n_jobs=cores, backend="multiprocessing")(
             delayed(average_and_store)(
                 group_to_average,
@@ -498,8 +539,9 @@ def average_image_groups(file_index_fn, table_name="hdf5_proc",
             ) for group_to_average in groups_to_average)
     averages_table.insert_multiple(records)
 
-    print("--- Average %d files by groups, took %s seconds ---\n" %
-          (n_files, (time.time() - start_time)))
+    print("--- Average %d files by groups (%d groups up to date), took %s "
+          "seconds ---\n" % (n_files, len(groups_to_average) - n_groups,
+                              (time.time() - start_time)))
 
     # import pprint
     # pobj = pprint.PrettyPrinter(indent=4)
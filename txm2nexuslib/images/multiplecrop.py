@@ -29,7 +29,8 @@ from tinydb.storages import JSONStorage
 from tinydb.middlewares import CachingMiddleware
 from tinydb.storages import MemoryStorage
 
-from util import create_subset_db
+from util import create_subset_db, unique_file_paths
+from txm2nexuslib.images.manifest import Manifest, run_stage, stage_name
 from txm2nexuslib.parser import get_file_paths
 from txm2nexuslib.image.image_operate_lib import Image
 
@@ -65,12 +66,17 @@ def filter_file_index(file_index_db, date=None, sample=None, energy=None,
 
 def crop_images(file_index_fn, table_name="hdf5_proc", dataset="data",
                 roi={"top": 26, "bottom": 24, "left": 21, "right": 19},
-                date=None, sample=None, energy=None, cores=-2, query=None):
+                date=None, sample=None, energy=None, cores=-2, query=None,
+                incremental=True):
     """Crop images of one experiment.
     If date, sample and/or energy are indicated, only the corresponding
     images for the given date, sample and/or energy are cropped.
     The crop of the different images will be done in parallel: all cores
-    but one used (Value=-2). Each file, contains a single image to be cropped.
+    but one used (Value=-2). Each file, contains a single image to be cropped,
+    or all the frames of a container (see multiple_xrm_2_hdf5).
+    If incremental is True, the files recorded in the manifest of the DB
+    as already cropped by the same roi are not cropped again (see
+    Manifest).
     """
     start_time = time.time()
     file_index_db = TinyDB(file_index_fn,
@@ -89,14 +95,23 @@ def crop_images(file_index_fn, table_name="hdf5_proc", dataset="data",
         file_records = file_index_db.search(query)
     else:
         file_records = file_index_db.all()
-    files = get_file_paths(file_records, root_path)
-    if files:
+    files = unique_file_paths(get_file_paths(file_records, root_path))
+    if incremental:
+        manifest = Manifest(db, root_path)
+        jobs = [(None, h5_file,
+                 delayed(crop_and_store)(h5_file, dataset=dataset, roi=roi))
+                for h5_file in files]
+        n_files = run_stage(manifest, stage_name("crop", roi), jobs,
+                            cores=cores)
+    elif files:
         Parallel(n_jobs=cores, backend="multiprocessing")(
             delayed(crop_and_store)(h5_file, dataset=dataset,
                                     roi=roi) for h5_file in files)
-    n_files = len(files)
-    print("--- Crop %d files took %s seconds ---\n" %
-          (n_files, (time.time() - start_time)))
+        n_files = len(files)
+    else:
+        n_files = 0
+    print("--- Crop %d files (%d up to date) took %s seconds ---\n" %
+          (n_files, len(files) - n_files, (time.time() - start_time)))
     db.close()
 
 
@@ -28,16 +28,60 @@ from tinydb.storages import JSONStorage
 from tinydb.middlewares import CachingMiddleware
 from tinydb.storages import MemoryStorage
 
-from util import create_subset_db
+from util import create_subset_db, check_single_image_records
 from txm2nexuslib.parser import get_file_paths
 from txm2nexuslib.image.image_operate_lib import (normalize_image,
                                                   get_normalized_ff,
                                                   normalize_ff)
+from txm2nexuslib.images.manifest import Manifest, run_stage
+
+
+# Stage of the manifest recorded for the normalized images, and for the
+# FF images normalized by their exposure time and machine current
+NORMALIZE_STAGE = "normalize"
+
+
+def normalize_recorded_ff(manifest, files_ff):
+    """Normalize the FF images of a date, sample and energy (see
+    normalize_ff), unless their normalization is already recorded in the
+    manifest, and record it.
+    :return: average normalized FF image
+    """
+    recorded = [ff_file for ff_file in files_ff
+                if manifest.is_up_to_date(NORMALIZE_STAGE, ff_file)]
+    if len(files_ff) > 1 and len(recorded) == len(files_ff):
+        # the average is stored in the first FF file
+        return get_normalized_ff(files_ff)
+    if len(files_ff) > 1 and recorded:
+        # The FF images already normalized cannot be averaged again with
+        # the new ones: they are copied for processing again by the next
+        # run of the workflow
+        for ff_file in recorded:
+            manifest.forget(ff_file)
+        manifest.flush()
+        msg = ("FlatFields %s have been added since the normalization of "
+               "%s: run the workflow again to normalize them together" %
+               (sorted(set(files_ff) - set(recorded)), sorted(recorded)))
+        raise Exception(msg)
+    # the stages done on the FF files are only kept if they are all known
+    consistent = [manifest.is_consistent(ff_file) for ff_file in files_ff]
+    ff_norm_image = normalize_ff(files_ff)
+    for ff_file, is_consistent in zip(files_ff, consistent):
+        if is_consistent:
+            manifest.record(NORMALIZE_STAGE, ff_file)
+        else:
+            manifest.forget(ff_file)
+    manifest.flush()
+    return ff_norm_image
 
 
 def average_ff(file_index_fn, table_name="hdf5_proc",
                      date=None, sample=None, energy=None,
-                     cores=-2, query=None, jj=False):
+                     cores=-2, query=None, jj=False, incremental=True):
+    """Normalize the FF images of one experiment by their exposure time
+    and machine current, and average them by date, sample and energy.
+    If incremental is True, the FF images recorded in the manifest of the
+    DB as already normalized are not normalized again (see Manifest)."""
     start_time = time.time()
     file_index_db = TinyDB(file_index_fn,
                            storage=CachingMiddleware(JSONStorage))
@@ -62,8 +106,10 @@ def average_ff(file_index_fn, table_name="hdf5_proc",
         file_index_db = temp_db
 
     root_path = os.path.dirname(os.path.abspath(file_index_fn))
+    manifest = Manifest(db, root_path)
 
     file_records = file_index_db.all()
+    check_single_image_records(file_records, "average_ff")
 
     dates_samples_energies = []
     for record in file_records:
@@ -99,18 +145,27 @@ def average_ff(file_index_fn, table_name="hdf5_proc",
 
         h5_ff_records = file_index_db.search(query_cmd_ff)
         files_ff = get_file_paths(h5_ff_records, root_path)
-        normalize_ff(files_ff)
+        if incremental:
+            normalize_recorded_ff(manifest, files_ff)
+        else:
+            normalize_ff(files_ff)
+
+    db.close()
 
 
 def normalize_images(file_index_fn, table_name="hdf5_proc",
                      date=None, sample=None, energy=None,
                      average_ff=True, cores=-2, query=None, jj=False,
-                     read_norm_ff=False):
+                     read_norm_ff=False, incremental=True):
     """Normalize images of one experiment.
     If date, sample and/or energy are indicated, only the corresponding
     images for the given date, sample and/or energy are normalized.
     The normalization of different images will be done in parallel. Each
     file, contains a single image to be normalized.
+    If incremental is True, the images and FF images recorded in the
+    manifest of the DB as already normalized are not normalized again
+    (see Manifest): as the normalization is done in place, normalizing
+    an image twice would divide it twice.
     .. todo: This method should be divided in two. One should calculate
      the average FF, and the other (normalize_images), should receive
      as input argument, the averaged FF image (or the single FF image).
@@ -142,9 +197,11 @@ def normalize_images(file_index_fn, table_name="hdf5_proc",
         file_index_db = temp_db
 
     root_path = os.path.dirname(os.path.abspath(file_index_fn))
+    manifest = Manifest(db, root_path)
 
 
     file_records = file_index_db.all()
+    check_single_image_records(file_records, NORMALIZE_STAGE)
     #print(file_records)
 
     dates_samples_energies = []
@@ -160,6 +217,7 @@ def normalize_images(file_index_fn, table_name="hdf5_proc",
 
     dates_samples_energies = list(set(dates_samples_energies))
     num_files_total = 0
+    num_files_normalized = 0
     for date_sample_energy in dates_samples_energies:
         date = date_sample_energy[0]
         sample = date_sample_energy[1]
@@ -212,7 +270,21 @@ def normalize_images(file_index_fn, table_name="hdf5_proc",
         # prettyprinter.pprint(files)
         # prettyprinter.pprint(files_ff)
 
-        if average_ff:
+        if average_ff and incremental:
+            # The FF images are normalized, and averaged, once; the
+            # images already normalized are skipped
+            if read_norm_ff is True:
+                ff_norm_image = get_normalized_ff(files_ff)
+            else:
+                ff_norm_image = normalize_recorded_ff(manifest, files_ff)
+            jobs = [(None, h5_file,
+                     delayed(normalize_image)(
+                         h5_file, average_normalized_ff_img=ff_norm_image))
+                    for h5_file in files]
+            num_files_normalized += run_stage(manifest, NORMALIZE_STAGE,
+                                              jobs, cores=cores)
+        elif average_ff:
+            num_files_normalized += n_files
             # Average the FF files and use always the same average (for a
             # same date, sample, energy and jj's)
             # Normally the case of magnetism
@@ -238,8 +310,9 @@ def normalize_images(file_index_fn, table_name="hdf5_proc",
             # TODO
             pass
 
-    print("--- Normalize %d files took %s seconds ---\n" %
-          (num_files_total, (time.time() - start_time)))
+    print("--- Normalize %d files (%d up to date) took %s seconds ---\n" %
+          (num_files_normalized, num_files_total - num_files_normalized,
+           (time.time() - start_time)))
 
     db.close()
 
@@ -22,6 +22,7 @@ along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 import os
 import time
+from collections import OrderedDict
 
 from joblib import Parallel, delayed
 from tinydb import TinyDB
@@ -29,19 +30,110 @@ from tinydb.storages import JSONStorage
 from tinydb.middlewares import CachingMiddleware
 
 from txm2nexuslib.parser import get_db, get_file_paths
-from txm2nexuslib.image.xrm2hdf5 import Xrm2H5Converter
+from txm2nexuslib.image.xrm2hdf5 import (Xrm2H5Converter,
+                                         Xrm2H5ContainerConverter)
 from txm2nexuslib.images import util
+from txm2nexuslib.images.manifest import Manifest, run_stage, stage_name
 
 
+# Fields of the file records which identify the images gathered in a
+# container (see multiple_xrm_2_hdf5); zpz, jj_d and jj_u are only used
+# if the records have them.
+CONTAINER_FIELDS = ('date', 'sample', 'energy', 'zpz', 'jj_d', 'jj_u')
 
-def convert_xrm2h5(xrm_file):
-    xrm2h5_converter = Xrm2H5Converter(xrm_file)
+
+def convert_xrm2h5(xrm_file, roi=None):
+    xrm2h5_converter = Xrm2H5Converter(xrm_file, roi=roi)
     xrm2h5_converter.convert_xrm_to_h5_file()
 
 
+def convert_xrm2container(xrm_files, h5_file, roi=None):
+    converter = Xrm2H5ContainerConverter(xrm_files, h5_file, roi=roi)
+    return converter.convert_xrm_to_h5_file()
+
+
+def get_container_name(record):
+    """Name of the container hdf5 file of the image of a file record:
+    date_sample_energy[_zpz][_jj_d_jj_u][_FF].hdf5"""
+    fields = [record[field] for field in CONTAINER_FIELDS if field in record]
+    if record.get('FF'):
+        fields.append('FF')
+    return '_'.join(str(field) for field in fields) + '.hdf5'
+
+
+def group_container_records(file_records):
+    """Group the file records by container (see get_container_name),
+    keeping their order. FF images and images of different subfolders are
+    never gathered with other images.
+    :return: list of (container name, subfolder, records) tuples"""
+    groups = OrderedDict()
+    for record in file_records:
+        key = (get_container_name(record), record.get('subfolder'))
+        groups.setdefault(key, []).append(record)
+    return [(name, subfolder, records)
+            for (name, subfolder), records in groups.items()]
+
+
+def multiple_xrm_2_container(db, file_records, root_path, subfolders=False,
+                             cores=-2, update_db=True, roi=None):
+    """Convert the xrm files of the records into container hdf5 files,
+    one for each group of images of an acquisition (see
+    group_container_records), instead of one hdf5 file per xrm file.
+    The records of the hdf5_raw table then give the container of each
+    image ('filename'), its frame in the container ('frame') and its
+    xrm file ('xrm_filename'). The xrm files which cannot be read are
+    left out of the containers and of the table.
+    :return: number of xrm files converted"""
+    jobs = []
+    for name, subfolder, records in group_container_records(file_records):
+        paths = get_file_paths(records, root_path, use_subfolders=subfolders)
+        paths = dict((os.path.basename(path), path) for path in paths)
+        records = [record for record in records
+                   if record['filename'] in paths]
+        if not records:
+            continue
+        xrm_files = [paths[record['filename']] for record in records]
+        h5_file = os.path.join(os.path.dirname(xrm_files[0]), name)
+        jobs.append((name, records, xrm_files, h5_file))
+
+    # The backend parameter can be either "threading" or "multiprocessing".
+    converted = Parallel(n_jobs=cores, backend="multiprocessing")(
+        delayed(convert_xrm2container)(xrm_files, h5_file, roi=roi)
+        for _, _, xrm_files, h5_file in jobs)
+
+    container_records = []
+    for (name, records, xrm_files, _), converted_files in zip(jobs,
+                                                              converted):
+        frames = dict((xrm_file, frame)
+                      for frame, xrm_file in enumerate(converted_files))
+        for record, xrm_file in zip(records, xrm_files):
+            if xrm_file not in frames:
+                continue
+            record = dict(record)
+            record.update({'filename': name, 'extension': '.hdf5',
+                           'frame': frames[xrm_file], 'container': True,
+                           'xrm_filename': record['filename']})
+            container_records.append(record)
+
+    if update_db:
+        table = db.table("hdf5_raw")
+        table.purge()
+        table.insert_multiple(container_records)
+    return len(container_records)
+
+
 def multiple_xrm_2_hdf5(file_index_db, subfolders=False, cores=-2,
-                        update_db=True, query=None):
-    """Using all cores but one for the computations"""
+                        update_db=True, query=None, roi=None,
+                        container=False, incremental=True, use_hash=False):
+    """Using all cores but one for the computations.
+    If a roi is given, the images are cropped while they are converted
+    (see Xrm2H5Converter).
+    If container is True, the images of each acquisition are gathered in
+    a single hdf5 file (see multiple_xrm_2_container).
+    If incremental is True, the hdf5 files recorded in the manifest of the
+    DB as converted from their current xrm file are not converted again
+    (see Manifest; use_hash to identify the xrm files by their contents).
+    The containers are always converted."""
 
     start_time = time.time()
     db = TinyDB(file_index_db, storage=CachingMiddleware(JSONStorage))
@@ -55,18 +147,37 @@ def multiple_xrm_2_hdf5(file_index_db, subfolders=False, cores=-2,
     # printer = pprint.PrettyPrinter(indent=4)
     # printer.pprint(file_records)
     root_path = os.path.dirname(os.path.abspath(file_index_db))
+    if container:
+        n_files = multiple_xrm_2_container(
+            db, file_records, root_path, subfolders=subfolders,
+            cores=cores, update_db=update_db, roi=roi)
+        db.close()
+        print("--- Convert from xrm to hdf5 containers %d files took %s "
+              "seconds ---\n" % (n_files, (time.time() - start_time)))
+        return db
+
     files = get_file_paths(file_records, root_path,
                            use_subfolders=subfolders)
 
-    # The backend parameter can be either "threading" or "multiprocessing".
-    Parallel(n_jobs=cores, backend="multiprocessing")(
-        delayed(convert_xrm2h5)(xrm_file) for xrm_file in files)
+    if incremental:
+        manifest = Manifest(db, root_path, use_hash=use_hash)
+        jobs = [(xrm_file, os.path.splitext(xrm_file)[0] + '.hdf5',
+                 delayed(convert_xrm2h5)(xrm_file, roi=roi))
+                for xrm_file in files]
+        n_files = run_stage(manifest, stage_name("hdf5_raw", roi), jobs,
+                            cores=cores)
+    else:
+        # The backend parameter can be either "threading" or
+        # "multiprocessing".
+        Parallel(n_jobs=cores, backend="multiprocessing")(
+            delayed(convert_xrm2h5)(xrm_file, roi=roi) for xrm_file in files)
+        n_files = len(files)
 
     if update_db:
         util.update_db_func(db, "hdf5_raw", file_records)
     db.close()
 
-    n_files = len(files)
-    print("--- Convert from xrm to hdf5 %d files took %s seconds ---\n" %
-          (n_files, (time.time() - start_time)))
+    print("--- Convert from xrm to hdf5 %d files (%d up to date) took %s "
+          "seconds ---\n" % (n_files, len(files) - n_files,
+                              (time.time() - start_time)))
     return db
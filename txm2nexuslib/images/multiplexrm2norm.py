@@ -0,0 +1,342 @@
+#!/usr/bin/python
+
+"""
+(C) Copyright 2018 ALBA-CELLS
+Authors: Marc Rosanes, Carlos Falcon, Zbigniew Reszela, Carlos Pascual
+The program is distributed under the terms of the
+GNU General Public License (or the Lesser GPL).
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import os
+import sys
+import time
+
+import h5py
+import numpy as np
+from joblib import Parallel, delayed
+from tinydb import TinyDB
+from tinydb.storages import JSONStorage
+from tinydb.middlewares import CachingMiddleware
+
+from txm2nexuslib.parser import get_file_paths
+from txm2nexuslib.xrmnex import XradiaFile
+from txm2nexuslib.image.xrm2hdf5 import (Xrm2H5Converter,
+                                         read_xrm_metadata,
+                                         write_h5_metadata)
+from txm2nexuslib.images.util import update_db_func
+from txm2nexuslib.images.manifest import (Manifest, stage_name,
+                                          MANIFEST_FLUSH_SIZE)
+from txm2nexuslib.storage import dataset_options
+
+
+# Stage recorded in the manifest for the processed files written by
+# multiple_xrm_2_normalized, and program name of their metadata
+XRM2NORM_STAGE = "xrm2norm"
+
+# Fields of the file records giving the FF images with which an image is
+# normalized (as done by normalize_images); jj_u and jj_d are added if jj
+FF_FIELDS = ('date', 'sample', 'energy')
+
+
+def crop_image(image, roi):
+    """Crop an image as done by Image.crop"""
+    if roi is None:
+        return image
+    rows, columns = np.shape(image)[-2:]
+    return image[..., roi["top"]:rows - roi["bottom"],
+                 roi["left"]:columns - roi["right"]]
+
+
+def read_xrm_image(xrm_file, proc_file, roi=None, keep_raw=False):
+    """Read the metadata and the image of an xrm file, cropped by roi.
+    If keep_raw is True, the raw hdf5 file is also written (as done by
+    multiple_xrm_2_hdf5), with the image not cropped.
+    :return: (metadata, image): metadata of the processed file (see
+    read_xrm_metadata) and image
+    """
+    if keep_raw:
+        converter = Xrm2H5Converter(xrm_file)
+        converter.convert_xrm_to_h5_file()
+        metadata = dict(converter.metadata)
+        image = crop_image(converter.data.get('data'), roi)
+    else:
+        with XradiaFile(xrm_file) as xrm:
+            metadata = read_xrm_metadata(xrm, xrm_file, proc_file)
+            image = xrm.get_raw_image_2D(roi=roi)
+    if image is None:
+        raise Exception("Image of %s could not be read" % xrm_file)
+    metadata['program_name'] = XRM2NORM_STAGE
+    metadata['command'] = XRM2NORM_STAGE + ' ' + ' '.join(sys.argv[1:])
+    metadata['output_file'] = os.path.basename(proc_file)
+    return metadata, image
+
+
+def write_proc_file(proc_file, metadata, images, ff_files=None):
+    """Write a processed file with the metadata of its xrm file and the
+    given images, as the datasets data_1, data_2... of its workflow steps;
+    data is linked to the last one.
+    :param images: list of (image, description) tuples
+    :param ff_files: names of the FF xrm files with which the last image
+    has been normalized, stored in its metadata group
+    """
+    f = h5py.File(proc_file, 'w')
+    write_h5_metadata(f.create_group("metadata"), metadata)
+    for step, (image, description) in enumerate(images, 1):
+        dataset = "data_" + str(step)
+        f.create_dataset(dataset, data=image,
+                         **dataset_options(image.shape, image.dtype))
+        f[dataset].attrs["step"] = step
+        f[dataset].attrs["dataset"] = dataset
+        f[dataset].attrs["description"] = description
+    f["data"] = h5py.SoftLink(dataset)
+    if ff_files:
+        f.create_group("metadata_" + dataset).create_dataset(
+            "ff_files", data=np.array(ff_files, dtype=object),
+            dtype=h5py.special_dtype(vlen=unicode))
+    f.flush()
+    f.close()
+
+
+def _source_description(xrm_file, roi):
+    description = "raw data of " + os.path.basename(xrm_file)
+    if roi is not None:
+        description += " cropped by " + str(roi)
+    return description
+
+
+def normalize_xrm_ff(ff_xrm_files, ff_proc_files, roi=None, keep_raw=False):
+    """Normalize the FF images of a date, sample and energy by their
+    exposure time and machine current, and average them (as done by
+    normalize_ff). If there are many FF images, each processed FF file
+    stores its normalized FF image, and the first one also the average; a
+    single FF image is stored not normalized, as normalize_ff leaves it.
+    :return: average normalized FF image
+    """
+    if len(ff_xrm_files) == 1:
+        metadata, image = read_xrm_image(ff_xrm_files[0], ff_proc_files[0],
+                                         roi=roi, keep_raw=keep_raw)
+        write_proc_file(ff_proc_files[0], metadata,
+                        [(image, _source_description(ff_xrm_files[0], roi))])
+        constant = metadata['exposure_time'] * metadata['machine_current']
+        return image / constant
+    average_image = None
+    first_ff = None
+    for ff_xrm_file, ff_proc_file in zip(ff_xrm_files, ff_proc_files):
+        metadata, image = read_xrm_image(ff_xrm_file, ff_proc_file, roi=roi,
+                                         keep_raw=keep_raw)
+        constant = metadata['exposure_time'] * metadata['machine_current']
+        image_norm_by_constant = image / constant
+        description = (_source_description(ff_xrm_file, roi) +
+                       " normalized by its exposure time and machine "
+                       "current")
+        if average_image is None:
+            average_image = np.zeros(np.shape(image_norm_by_constant),
+                                     dtype=image_norm_by_constant.dtype)
+            # written with the average, once it is calculated
+            first_ff = (metadata, [(image_norm_by_constant, description)])
+        else:
+            write_proc_file(ff_proc_file, metadata,
+                            [(image_norm_by_constant, description)])
+        average_image += image_norm_by_constant
+    average_image /= len(ff_xrm_files)
+    metadata, images = first_ff
+    # the average is read from the first FF file (see imagestostack)
+    images.append((average_image,
+                   "Average image calculated after normalizing each of the "
+                   "FF images by its exposure time and machine current"))
+    ff_files = [os.path.basename(f) for f in ff_xrm_files]
+    write_proc_file(ff_proc_files[0], metadata, images, ff_files=ff_files)
+    return average_image
+
+
+def read_normalized_ff(ff_proc_files):
+    """Average normalized FF image stored by normalize_xrm_ff"""
+    f = h5py.File(ff_proc_files[0], 'r')
+    ff_image = f["data"].value
+    if len(ff_proc_files) == 1:
+        ff_image = ff_image / (f["metadata"]["exposure_time"].value *
+                               f["metadata"]["machine_current"].value)
+    f.close()
+    return ff_image
+
+
+def normalize_xrm(xrm_file, proc_file, average_normalized_ff_img,
+                  roi=None, keep_raw=False, ff_files=None):
+    """Read an xrm image, crop it, normalize it by its exposure time and
+    machine current and by the average normalized FF image (as done by
+    normalize_image), and write the normalized image in the processed
+    file"""
+    metadata, image = read_xrm_image(xrm_file, proc_file, roi=roi,
+                                     keep_raw=keep_raw)
+    constant = metadata['exposure_time'] * metadata['machine_current']
+    normalized_image = image / constant / average_normalized_ff_img
+    description = (_source_description(xrm_file, roi) +
+                   " normalized by average FF, using exposure time "
+                   "and machine current. To calculate the average "
+                   "FF, each FF image has been, beforehand, "
+                   "normalized by its exposure time and "
+                   "machine current")
+    write_proc_file(proc_file, metadata, [(normalized_image, description)],
+                    ff_files=ff_files)
+
+
+def group_ff_records(file_records, jj=False):
+    """Group the file records by the FF images with which they are
+    normalized (see FF_FIELDS), keeping their order.
+    :return: list of (images records, FF records) tuples"""
+    fields = FF_FIELDS
+    if jj:
+        fields += ('jj_u', 'jj_d')
+    groups = {}
+    keys = []
+    for record in file_records:
+        key = tuple(record[field] for field in fields)
+        if key not in groups:
+            groups[key] = ([], [])
+            keys.append(key)
+        groups[key][1 if record.get('FF') else 0].append(record)
+    return [groups[key] for key in keys]
+
+
+def _record_outputs(manifest, stage, outputs, keep_raw):
+    for xrm_file, proc_file in outputs:
+        manifest.record(stage, proc_file, source=xrm_file)
+        if keep_raw:
+            manifest.record(stage_name("hdf5_raw"),
+                            os.path.splitext(xrm_file)[0] + ".hdf5",
+                            source=xrm_file)
+
+
+def multiple_xrm_2_normalized(file_index_fn, roi={"top": 26, "bottom": 24,
+                                                  "left": 21, "right": 19},
+                              suffix="_proc", keep_raw=False,
+                              subfolders=False, cores=-2, update_db=True,
+                              query=None, jj=False, incremental=True,
+                              use_hash=False):
+    """Fused version of multiple_xrm_2_hdf5, copy2proc_multiple,
+    crop_images and normalize_images: each xrm image is read, cropped by
+    roi (not cropped if roi is None) and normalized in memory, and only
+    the processed file with the normalized image (data) and the metadata
+    of the xrm file is written. The processed FF files store the FF
+    images normalized by their exposure times and machine currents, and
+    the first one of each date, sample and energy their average; a single
+    FF image is stored cropped but not normalized (as normalize_images
+    does).
+    The raw hdf5 files are only written if keep_raw is True. The hdf5_proc
+    table (and the hdf5_raw table, if keep_raw) are updated as done by
+    the separated stages.
+    If incremental is True, the processed files recorded in the manifest
+    of the DB as produced from their current xrm file are not produced
+    again, unless the FF images of their date, sample and energy are
+    processed again (see Manifest).
+    """
+    start_time = time.time()
+    db = TinyDB(file_index_fn, storage=CachingMiddleware(JSONStorage))
+    if query is not None:
+        file_records = db.search(query)
+    else:
+        file_records = db.all()
+    root_path = os.path.dirname(os.path.abspath(file_index_fn))
+    manifest = Manifest(db, root_path, use_hash=use_hash)
+    stage = stage_name(XRM2NORM_STAGE, roi)
+
+    def proc_path(xrm_file):
+        return os.path.splitext(xrm_file)[0] + suffix + ".hdf5"
+
+    def is_up_to_date(xrm_file):
+        if not incremental:
+            return False
+        return (manifest.is_up_to_date(stage, proc_path(xrm_file),
+                                       source=xrm_file) and
+                (not keep_raw or manifest.is_up_to_date(
+                    stage_name("hdf5_raw"),
+                    os.path.splitext(xrm_file)[0] + ".hdf5",
+                    source=xrm_file)))
+
+    # FF images: each date, sample and energy whose FF images are not up
+    # to date is processed again, with all its images
+    groups = []
+    ff_jobs = []
+    for image_records, ff_records in group_ff_records(file_records, jj=jj):
+        files = get_file_paths(image_records, root_path,
+                               use_subfolders=subfolders)
+        files_ff = get_file_paths(ff_records, root_path,
+                                  use_subfolders=subfolders)
+        if files and not files_ff:
+            msg = "FlatFields are not present, images cannot be normalized"
+            raise Exception(msg)
+        if not files_ff:
+            continue
+        ff_proc_files = [proc_path(ff_file) for ff_file in files_ff]
+        if all(is_up_to_date(ff_file) for ff_file in files_ff):
+            groups.append((files, files_ff,
+                           read_normalized_ff(ff_proc_files)))
+        else:
+            groups.append((files, files_ff, None))
+            ff_jobs.append((len(groups) - 1, files_ff, ff_proc_files))
+
+    ff_images = Parallel(n_jobs=cores, backend="multiprocessing")(
+        delayed(normalize_xrm_ff)(files_ff, ff_proc_files, roi=roi,
+                                  keep_raw=keep_raw)
+        for _, files_ff, ff_proc_files in ff_jobs)
+    for (index, files_ff, ff_proc_files), ff_image in zip(ff_jobs,
+                                                          ff_images):
+        files = groups[index][0]
+        groups[index] = (files, files_ff, ff_image)
+        _record_outputs(manifest, stage, zip(files_ff, ff_proc_files),
+                        keep_raw)
+        for xrm_file in files:
+            manifest.forget(proc_path(xrm_file))
+    manifest.flush()
+
+    # Images
+    jobs = []
+    for files, files_ff, ff_image in groups:
+        ff_names = [os.path.basename(ff_file) for ff_file in files_ff]
+        for xrm_file in files:
+            if is_up_to_date(xrm_file):
+                continue
+            jobs.append(((xrm_file, proc_path(xrm_file)),
+                         delayed(normalize_xrm)(
+                             xrm_file, proc_path(xrm_file), ff_image,
+                             roi=roi, keep_raw=keep_raw, ff_files=ff_names)))
+    for start in range(0, len(jobs), MANIFEST_FLUSH_SIZE):
+        chunk = jobs[start:start + MANIFEST_FLUSH_SIZE]
+        # The backend parameter can be either "threading" or
+        # "multiprocessing".
+        Parallel(n_jobs=cores, backend="multiprocessing")(
+            task for _, task in chunk)
+        _record_outputs(manifest, stage, [outputs for outputs, _ in chunk],
+                        keep_raw)
+        manifest.flush()
+
+    if update_db:
+        if keep_raw:
+            update_db_func(db, "hdf5_raw", file_records)
+        raw_records = [dict(record, extension=".hdf5",
+                            filename=os.path.splitext(
+                                record['filename'])[0] + ".hdf5")
+                       for record in file_records]
+        update_db_func(db, "hdf5_proc", raw_records, suffix=suffix,
+                       purge=query is None)
+    db.close()
+
+    n_files = len(jobs) + sum(len(files_ff) for _, files_ff, _ in ff_jobs)
+    n_total = sum(len(files) + len(files_ff)
+                  for files, files_ff, _ in groups)
+    print("--- Convert from xrm to normalized hdf5 %d files (%d up to "
+          "date) took %s seconds ---\n" % (n_files, n_total - n_files,
+                                           (time.time() - start_time)))
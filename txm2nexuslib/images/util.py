@@ -34,6 +34,7 @@ from tinydb.middlewares import CachingMiddleware
 from joblib import Parallel, delayed
 
 from txm2nexuslib.parser import get_file_paths
+from txm2nexuslib.images.manifest import Manifest, run_stage
 
 
 def filter_file_index(file_index_db, files_query,
@@ -103,6 +104,33 @@ def create_subset_db(file_index_fn, subset_file_index_fn,
     return subset_file_index_db
 
 
+def unique_file_paths(files):
+    """Remove the repeated paths of a list of files, keeping its order.
+    Used for the records of the images stored in containers (see
+    multiple_xrm_2_hdf5), which share the same file."""
+    unique_files = []
+    seen = set()
+    for filename in files:
+        if filename not in seen:
+            seen.add(filename)
+            unique_files.append(filename)
+    return unique_files
+
+
+def check_single_image_records(records, stage):
+    """Raise a ValueError if any of the records is an image stored in a
+    container (see multiple_xrm_2_hdf5): the given stage only processes
+    single image files."""
+    for record in records:
+        if "frame" in record:
+            raise ValueError(
+                "%s is a container of images (frame %s of %s): %s only "
+                "works on single image files, convert the xrm files "
+                "without the container mode" % (
+                    record["filename"], record["frame"],
+                    record.get("xrm_filename"), stage))
+
+
 def copy_2_proc(filename, suffix):
     """Copy a raw file into another file which can be used  processed file"""
     base, extension = os.path.splitext(filename)
@@ -115,7 +143,9 @@ def update_db_func(files_db, table_name, files_records, suffix=None, purge=True)
     extension to hdf5), or with records of processed files (adding a suffix).
     If suffix is not given (suffix None), the new DB will contain the same
     file names as the original DB but with .hdf5 extension; otherwise,
-    a suffix is added to the already hdf5 filenames."""
+    a suffix is added to the already hdf5 filenames.
+    If purge is False, the records of the files already in the table are
+    replaced, so that a stage run again does not repeat them."""
     table = files_db.table(table_name)
     if purge is True:
         table.purge()
@@ -131,6 +161,9 @@ def update_db_func(files_db, table_name, files_records, suffix=None, purge=True)
             record.update({'processed': True})
         record.update({'filename': filename})
         records.append(record)
+    if purge is not True and records:
+        filenames = sorted(set(record['filename'] for record in records))
+        table.remove(Query().filename.one_of(filenames))
     table.insert_multiple(records)
 
 
@@ -138,8 +171,13 @@ def copy2proc_multiple(file_index_db, table_in_name="hdf5_raw",
                        table_out_name="hdf5_proc", suffix="_proc",
                        use_subfolders=False, cores=-1, update_db=True,
                        query=None, purge=False,
-                       magnetism_partial=False):
-    """Copy many files to processed files"""
+                       magnetism_partial=False, incremental=True,
+                       use_hash=False):
+    """Copy many files to processed files.
+    If incremental is True, the processed files recorded in the manifest of
+    the DB as copied from their current raw file, and not modified since
+    by a stage unknown to the manifest, are not copied again (see
+    Manifest)."""
     # printer = pprint.PrettyPrinter(indent=4)
 
     start_time = time.time()
@@ -170,18 +208,30 @@ def copy2proc_multiple(file_index_db, table_in_name="hdf5_raw",
     root_path = os.path.dirname(os.path.abspath(file_index_db))
     files = get_file_paths(hdf5_records, root_path,
                            use_subfolders=use_subfolders)
-
-    # The backend parameter can be either "threading" or "multiprocessing"
-
-    Parallel(n_jobs=cores, backend="multiprocessing")(
-        delayed(copy_2_proc)(h5_file, suffix) for h5_file in files)
+    # the records of the images of a container share its file
+    files = unique_file_paths(files)
+
+    if incremental:
+        manifest = Manifest(db, root_path, use_hash=use_hash)
+        jobs = []
+        for h5_file in files:
+            base, extension = os.path.splitext(h5_file)
+            jobs.append((h5_file, base + suffix + extension,
+                         delayed(copy_2_proc)(h5_file, suffix)))
+        n_files = run_stage(manifest, table_out_name, jobs, cores=cores)
+    else:
+        # The backend parameter can be either "threading" or
+        # "multiprocessing"
+        Parallel(n_jobs=cores, backend="multiprocessing")(
+            delayed(copy_2_proc)(h5_file, suffix) for h5_file in files)
+        n_files = len(files)
 
     if update_db:
         update_db_func(db, table_out_name, hdf5_records, suffix, purge=purge)
 
-    n_files = len(files)
-    print("--- Copy for processing %d files took %s seconds ---\n" %
-          (n_files, (time.time() - start_time)))
+    print("--- Copy for processing %d files (%d up to date) took %s "
+          "seconds ---\n" % (n_files, len(files) - n_files,
+                              (time.time() - start_time)))
 
     #print(db.table(table_out_name).all())
     db.close()
@@ -0,0 +1,155 @@
+#!/usr/bin/python
+
+"""
+(C) Copyright 2018 ALBA-CELLS
+Authors: Marc Rosanes, Carlos Falcon, Zbigniew Reszela, Carlos Pascual
+The program is distributed under the terms of the
+GNU General Public License (or the Lesser GPL).
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+
+import os
+import time
+import fnmatch
+import datetime
+
+from joblib import Parallel, delayed
+from tinydb import TinyDB
+from tinydb.storages import JSONStorage
+from tinydb.middlewares import CachingMiddleware
+
+from txm2nexuslib.parser import ParserTXMScript
+from txm2nexuslib.xrmnex import XradiaFile
+
+
+# Motors whose position is stored in the index, with the TXM script
+# parameter they correspond to, and the axis names they can have.
+INDEX_MOTORS = (
+    ('zpz', ('ZPz', 'Zone Plate Z')),
+    ('jj_u', ('phx',)),
+    ('jj_d', ('phy',)),
+)
+
+# Fields which identify a series of repeated acquisitions (as done by
+# ParserTXMScript)
+REPETITION_FIELDS = ('date', 'sample', 'energy', 'angle', 'zpz',
+                     'jj_d', 'jj_u', 'FF')
+
+
+def find_xrm_files(root_path, pattern="*.xrm"):
+    """Find the files matching pattern in root_path and its subfolders"""
+    files = []
+    for dir_path, _, file_names in os.walk(root_path):
+        for file_name in sorted(fnmatch.filter(file_names, pattern)):
+            files.append(os.path.join(dir_path, file_name))
+    return files
+
+
+def _date_to_iso(date):
+    date = date.strip("\x00 ")
+    return datetime.datetime.strptime(date, "%m/%d/%y %H:%M:%S").isoformat()
+
+
+def read_index_record(xrm_file_name, root_path):
+    """Record of the file index for an xrm file. The date, sample and FF
+    fields are deduced from the file name, as done when parsing the TXM
+    script; the other fields are the values recorded in the metadata
+    streams of the file (the image data is not read)."""
+    parser = ParserTXMScript()
+    parser.filename = os.path.basename(xrm_file_name)
+    parser.parameters['filename'] = parser.filename
+    parser.is_FF()
+    parser.parse_extension()
+    parser.parse_sample_and_date()
+    record = parser.parameters
+    subfolder = os.path.relpath(os.path.dirname(xrm_file_name), root_path)
+    if subfolder != os.curdir:
+        record['subfolder'] = subfolder
+
+    with XradiaFile(xrm_file_name) as xrm_file:
+        metadata = xrm_file.read_all_metadata()
+        first_values = (('energy', 'energies', 1),
+                        ('angle', 'angles', 1),
+                        ('exposure_time', 'exp_times', None),
+                        ('machine_current', 'machine_currents', None),
+                        ('x_position', 'x_positions', None),
+                        ('y_position', 'y_positions', None),
+                        ('z_position', 'z_positions', None))
+        for field, metadata_field, decimals in first_values:
+            if metadata[metadata_field] is not None:
+                value = float(metadata[metadata_field][0])
+                if decimals is not None:
+                    value = round(value, decimals)
+                record[field] = value
+        if metadata['dates'] is not None:
+            try:
+                record['date_time'] = _date_to_iso(metadata['dates'][0])
+            except ValueError:
+                pass
+        if metadata['axes_names'] is not None:
+            axes_names = metadata['axes_names']
+            for field, names in INDEX_MOTORS:
+                for name in names:
+                    if name in axes_names:
+                        axis = axes_names.index(name)
+                        record[field] = round(
+                            float(xrm_file.motor_positions[0, axis]), 1)
+                        break
+    record['processed'] = False
+    return record
+
+
+def set_repetitions(records):
+    """Number the repetitions of consecutive acquisitions with the same
+    parameters, in order of acquisition"""
+    records.sort(key=lambda record: (record.get('date_time', ''),
+                                     record['filename']))
+    previous = None
+    repetition = 0
+    for record in records:
+        parameters = [record.get(field) for field in REPETITION_FIELDS]
+        if parameters == previous:
+            repetition += 1
+        else:
+            repetition = 0
+        record['repetition'] = repetition
+        previous = parameters
+
+
+def index_xrm_files(root_path, db_filename=None, pattern="*.xrm",
+                    cores=-2):
+    """Create the file index DB (index.json) of the xrm files found in
+    root_path and its subfolders, from their recorded metadata instead
+    of from the TXM script. The files are read in parallel: all cores
+    but one used (Value=-2). The DB is returned closed."""
+    start_time = time.time()
+    root_path = os.path.abspath(root_path)
+    if db_filename is None:
+        db_filename = os.path.join(root_path, "index.json")
+    files = find_xrm_files(root_path, pattern=pattern)
+
+    records = Parallel(n_jobs=cores, backend="multiprocessing")(
+        delayed(read_index_record)(xrm_file, root_path) for xrm_file in files)
+    set_repetitions(records)
+
+    db = TinyDB(db_filename, storage=CachingMiddleware(JSONStorage))
+    db.purge()
+    db.insert_multiple(records)
+    db.close()
+
+    print("--- Index %d xrm files took %s seconds ---\n" %
+          (len(files), (time.time() - start_time)))
+    return db
@@ -0,0 +1,501 @@
+#!/usr/bin/python
+
+"""
+(C) Copyright 2018 ALBA-CELLS
+Authors: Marc Rosanes, Carlos Falcon, Zbigniew Reszela, Carlos Pascual
+The program is distributed under the terms of the
+GNU General Public License (or the Lesser GPL).
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+
+import os
+import time
+import signal
+import traceback
+from multiprocessing import Pool
+
+from tinydb import TinyDB
+from tinydb.storages import JSONStorage
+from tinydb.middlewares import CachingMiddleware
+
+try:
+    import pyinotify
+except ImportError:
+    pyinotify = None
+
+from txm2nexuslib.parser import ParserTXMScript
+from txm2nexuslib.images.xrmindex import (find_xrm_files, read_index_record,
+                                          set_repetitions)
+from txm2nexuslib.images.multiplexrm2h5 import convert_xrm2h5
+from txm2nexuslib.images.multiplecrop import crop_and_store
+from txm2nexuslib.images.util import copy_2_proc, update_db_func
+from txm2nexuslib.images.manifest import Manifest, stage_name
+from txm2nexuslib.images.multiplenormalization import NORMALIZE_STAGE
+from txm2nexuslib.image.image_operate_lib import (
+    normalize_image, divide_by_constant_and_average_images)
+
+
+# Number of times the processing of a file is attempted; a file which
+# still fails is only processed again if it is modified
+MAX_ATTEMPTS = 3
+
+# Fields of the file records giving the FF images with which an image is
+# normalized (as done by normalize_images); jj_u and jj_d are added if jj
+FF_FIELDS = ('date', 'sample', 'energy')
+
+
+def _ignore_interrupt():
+    # Ctrl+C stops the watcher, which terminates the workers
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+
+def process_xrm_file(xrm_file, root_path, read_record=True, roi=None,
+                     suffix=None, crop_roi=None):
+    """Job run by the workers of XrmWatcher for each new xrm file: convert
+    it to hdf5 and, if a suffix is given, copy the hdf5 file for
+    processing and crop the copy if crop_roi is given.
+    :return: (record, h5_file, proc_file): index record read from the
+    metadata of the xrm file (if read_record), hdf5 file and processed
+    file (None if no suffix is given)
+    """
+    record = None
+    if read_record:
+        record = read_index_record(xrm_file, root_path)
+    convert_xrm2h5(xrm_file, roi=roi)
+    h5_file = os.path.splitext(xrm_file)[0] + ".hdf5"
+    proc_file = None
+    if suffix is not None:
+        copy_2_proc(h5_file, suffix)
+        base, extension = os.path.splitext(h5_file)
+        proc_file = base + suffix + extension
+        if crop_roi is not None:
+            crop_and_store(proc_file, roi=crop_roi)
+    return record, h5_file, proc_file
+
+
+class _CloseEvents(object):
+    """Files of a folder tree closed after being written, or moved into it,
+    as reported by inotify"""
+
+    def __init__(self, root_path):
+        self.closed = set()
+        self.watch_manager = pyinotify.WatchManager()
+        self.notifier = pyinotify.Notifier(self.watch_manager,
+                                           self._process_event)
+        mask = pyinotify.IN_CLOSE_WRITE | pyinotify.IN_MOVED_TO
+        self.watch_manager.add_watch(root_path, mask, rec=True,
+                                     auto_add=True)
+
+    def _process_event(self, event):
+        self.closed.add(event.pathname)
+
+    def wait(self, timeout):
+        """Wait up to timeout seconds for new events; return the files
+        closed since the last call"""
+        if self.notifier.check_events(timeout=int(timeout * 1000)):
+            self.notifier.read_events()
+            self.notifier.process_events()
+        closed, self.closed = self.closed, set()
+        return closed
+
+    def close(self):
+        self.notifier.stop()
+
+
+class _NoEvents(object):
+    """Replacement of _CloseEvents when inotify is not available: the
+    files are only found by polling the folder"""
+
+    def wait(self, timeout):
+        time.sleep(timeout)
+        return set()
+
+    def close(self):
+        pass
+
+
+class XrmWatcher(object):
+    """Process the xrm files of an acquisition folder as they are written
+    by the microscope: each new xrm file is converted to hdf5 as soon as
+    it is closed and its records are added to the files index DB (default
+    and hdf5_raw tables). If normalize is True, the hdf5 file is also
+    copied for processing (hdf5_proc table), cropped, and normalized as
+    soon as the FF images of its date, sample and energy are processed.
+
+    A file is known to be closed by an inotify event (if pyinotify is
+    installed), or when its size and modification time have not changed
+    for settle_time seconds. The files are processed by a pool of worker
+    processes, with at most two jobs per worker queued at a time.
+
+    The stages done on each file are recorded in the manifest of the DB
+    (see Manifest), with the same names as the batch programs
+    (multiple_xrm_2_hdf5, copy2proc_multiple, crop_images): a watcher
+    started again, or the batch programs run afterwards, do not process
+    again the files already processed.
+
+    If a TXM script is given, the index records are the ones of the
+    script (as done by create_db), which is parsed again whenever it is
+    modified: the files not in the script wait until they are added to
+    it, and the images are normalized once all the FF images of the
+    script for their date, sample and energy are processed. Without a
+    TXM script, the records are read from the metadata of the files (as
+    done by index_xrm_files), and the images are normalized with the FF
+    images of their date, sample and energy processed so far.
+    The average normalized FF image of each date, sample and energy is
+    computed by the workers, and computed again whenever new FF images
+    are processed. The FF files are not modified: their normalized
+    images are stored by normalize_images, if it is run afterwards.
+    """
+
+    def __init__(self, root_path, txm_txt_script=None, db_filename=None,
+                 pattern="*.xrm", roi=None, normalize=False, crop=True,
+                 crop_roi={"top": 26, "bottom": 24, "left": 21,
+                           "right": 19},
+                 suffix="_proc", jj=False, workers=2, poll_interval=2.0,
+                 settle_time=None, use_inotify=True):
+        """
+        :param root_path: acquisition folder (xrm files in it and in its
+        subfolders)
+        :param txm_txt_script: TXM script of the acquisition, if any
+        :param db_filename: files index DB (default: index.json in
+        root_path)
+        :param roi: roi of the images cropped during the conversion (see
+        Xrm2H5Converter)
+        :param normalize: copy for processing, crop and normalize the
+        images
+        :param crop: crop the processed images with crop_roi
+        :param jj: the FF images used to normalize an image also have its
+        jj_u and jj_d (as in normalize_images)
+        :param workers: number of worker processes
+        :param poll_interval: seconds between two scans of the folder
+        :param settle_time: seconds after which a file not modified is
+        considered closed (default: poll_interval)
+        :param use_inotify: use inotify, if available, to know when the
+        files are closed
+        """
+        self.root_path = os.path.abspath(root_path)
+        self.txm_txt_script = txm_txt_script
+        if db_filename is None:
+            db_filename = os.path.join(self.root_path, "index.json")
+        self.pattern = pattern
+        self.roi = roi
+        self.normalize = normalize
+        self.crop_roi = crop_roi if crop else None
+        self.suffix = suffix
+        self.jj = jj
+        self.workers = workers
+        self.poll_interval = poll_interval
+        if settle_time is None:
+            settle_time = poll_interval
+        self.settle_time = settle_time
+
+        self.db = TinyDB(db_filename, storage=CachingMiddleware(JSONStorage))
+        self.manifest = Manifest(self.db, self.root_path)
+        self.convert_stage = stage_name("hdf5_raw", roi)
+        self.crop_stage = None
+        if self.crop_roi is not None:
+            self.crop_stage = stage_name("crop", self.crop_roi)
+
+        self.records = self.db.all()
+        self.index_records = dict((record['filename'], record)
+                                  for record in self.records)
+        self.raw_records = dict((record['filename'], record) for record in
+                                self.db.table("hdf5_raw").all())
+        self.proc_records = dict((record['filename'], record) for record in
+                                 self.db.table("hdf5_proc").all())
+        self.script_mtime = None
+        self.script_records = None
+
+        # xrm files, by path: signatures seen in the last scan, and files
+        # processed (with their signature)
+        self.signatures = {}
+        self.done = {}
+        # Number of attempts (and signature of the file) of the failing
+        # jobs, by job
+        self.attempts = {}
+        # FF groups (see _ff_key): processed images (and the ones
+        # normalized), processed FF images (and their xrm files), and
+        # average normalized FF image (and the FF files averaged)
+        self.groups = {}
+
+        # Jobs submitted to the workers: (result, record, signature), by
+        # job ('process', xrm file), ('ff', FF group key) or ('normalize',
+        # processed file)
+        self.pending = {}
+        self.running = False
+        if use_inotify and pyinotify is not None:
+            self.events = _CloseEvents(self.root_path)
+        else:
+            self.events = _NoEvents()
+        self.pool = Pool(workers, _ignore_interrupt)
+
+    def _proc_file(self, h5_file):
+        base, extension = os.path.splitext(h5_file)
+        return base + self.suffix + extension
+
+    def _ff_key(self, record):
+        fields = FF_FIELDS
+        if self.jj:
+            fields += ('jj_u', 'jj_d')
+        return tuple(record.get(field) for field in fields)
+
+    def _group(self, record):
+        return self.groups.setdefault(self._ff_key(record), {
+            'images': set(), 'normalized': set(), 'ff': set(),
+            'ff_names': set(), 'ff_image': None, 'ff_averaged': None})
+
+    def _read_script(self):
+        """Parse the TXM script again if it has been modified, and replace
+        the records of the default table by the ones of the script"""
+        if (self.txm_txt_script is None or
+                not os.path.isfile(self.txm_txt_script)):
+            return
+        mtime = os.path.getmtime(self.txm_txt_script)
+        if mtime == self.script_mtime:
+            return
+        self.script_mtime = mtime
+        self.records = ParserTXMScript().parse_script(self.txm_txt_script)
+        self.script_records = dict((record['filename'], record)
+                                   for record in self.records)
+        self.index_records = self.script_records
+        table = self.db.table("_default")
+        table.purge()
+        table.insert_multiple(self.records)
+        self.db.storage.flush()
+
+    def _add_records(self, record, proc_file):
+        """Add the records of a processed file to the DB tables, and its
+        processed file to its FF group"""
+        h5_name = os.path.splitext(record['filename'])[0] + ".hdf5"
+        if record['filename'] not in self.index_records:
+            self.index_records[record['filename']] = record
+            self.records.append(record)
+            set_repetitions(self.records)
+            table = self.db.table("_default")
+            table.purge()
+            table.insert_multiple(self.records)
+        if h5_name not in self.raw_records:
+            update_db_func(self.db, "hdf5_raw", [record], purge=False)
+            self.raw_records[h5_name] = record
+        if proc_file is None:
+            return
+        proc_name = os.path.basename(self._proc_file(h5_name))
+        if proc_name not in self.proc_records:
+            raw_record = dict(record, filename=h5_name, extension=".hdf5")
+            update_db_func(self.db, "hdf5_proc", [raw_record],
+                           suffix=self.suffix, purge=False)
+            self.proc_records[proc_name] = record
+        group = self._group(record)
+        if record.get('FF'):
+            group['ff'].add(proc_file)
+            group['ff_names'].add(record['filename'])
+        else:
+            group['images'].add(proc_file)
+            if self.manifest.is_up_to_date(NORMALIZE_STAGE, proc_file):
+                group['normalized'].add(proc_file)
+
+    def _is_done(self, xrm_file):
+        """True if all the stages of an xrm file are recorded in the
+        manifest, and its records in the DB"""
+        h5_file = os.path.splitext(xrm_file)[0] + ".hdf5"
+        if (os.path.basename(h5_file) not in self.raw_records or
+                not self.manifest.is_up_to_date(self.convert_stage, h5_file,
+                                                source=xrm_file)):
+            return False
+        if not self.normalize:
+            return True
+        proc_file = self._proc_file(h5_file)
+        return (os.path.basename(proc_file) in self.proc_records and
+                self.manifest.is_up_to_date("hdf5_proc", proc_file,
+                                            source=h5_file) and
+                (self.crop_stage is None or
+                 self.manifest.is_up_to_date(self.crop_stage, proc_file)))
+
+    def _submit(self, key, function, args, kwargs, record=None,
+                signature=None):
+        attempts = self.attempts.get(key)
+        if attempts is not None:
+            if attempts[1] != signature:
+                del self.attempts[key]
+            elif attempts[0] >= MAX_ATTEMPTS:
+                return
+        result = self.pool.apply_async(function, args, kwargs)
+        self.pending[key] = (result, record, signature)
+
+    def _scan(self, closed):
+        """Submit the jobs of the xrm files closed since the last scan"""
+        if self.txm_txt_script is not None and self.script_records is None:
+            # TXM script not written yet
+            return
+        now = time.time()
+        for xrm_file in find_xrm_files(self.root_path, pattern=self.pattern):
+            if len(self.pending) >= 2 * self.workers:
+                break
+            if ('process', xrm_file) in self.pending:
+                continue
+            try:
+                stat = os.stat(xrm_file)
+            except OSError:
+                continue
+            signature = (stat.st_size, stat.st_mtime)
+            previous = self.signatures.get(xrm_file)
+            self.signatures[xrm_file] = signature
+            if self.done.get(xrm_file) == signature:
+                continue
+            if xrm_file not in closed and (
+                    previous != signature or
+                    now - stat.st_mtime < self.settle_time):
+                continue
+            name = os.path.basename(xrm_file)
+            if self.script_records is not None and \
+                    name not in self.script_records:
+                # not acquired by the TXM script, or script not updated yet
+                continue
+            record = self.index_records.get(name)
+            if record is not None and self._is_done(xrm_file):
+                self.done[xrm_file] = signature
+                if self.normalize:
+                    h5_file = os.path.splitext(xrm_file)[0] + ".hdf5"
+                    self._add_records(record, self._proc_file(h5_file))
+                continue
+            if self.script_records is None:
+                # the record is read again from the file by the worker
+                record = None
+            self._submit(('process', xrm_file), process_xrm_file,
+                         (xrm_file, self.root_path),
+                         {'read_record': record is None, 'roi': self.roi,
+                          'suffix': self.suffix if self.normalize else None,
+                          'crop_roi': self.crop_roi},
+                         record=record, signature=signature)
+
+    def _normalize(self):
+        """Submit the normalization of the processed images whose FF images
+        are ready"""
+        for key, group in self.groups.items():
+            images = [image for image in
+                      sorted(group['images'] - group['normalized'])
+                      if ('normalize', image) not in self.pending]
+            if not images or not group['ff']:
+                continue
+            if self.script_records is not None:
+                expected = set(
+                    name for name, record in self.script_records.items()
+                    if record.get('FF') and self._ff_key(record) == key)
+                if not expected <= group['ff_names']:
+                    continue
+            ff_files = sorted(group['ff'])
+            if group['ff_averaged'] != ff_files:
+                # average not computed yet, or new FF images processed
+                if (('ff', key) not in self.pending and
+                        len(self.pending) < 2 * self.workers):
+                    self._submit(('ff', key),
+                                 divide_by_constant_and_average_images,
+                                 (ff_files,), {}, record=ff_files,
+                                 signature=tuple(ff_files))
+                continue
+            for image in images:
+                if len(self.pending) >= 2 * self.workers:
+                    return
+                self._submit(('normalize', image), normalize_image, (image,),
+                             {'average_normalized_ff_img':
+                              group['ff_image']})
+
+    def _collect(self):
+        """Record the jobs completed
+        :return: number of jobs completed"""
+        completed = 0
+        for key, (result, record, signature) in self.pending.items():
+            if not result.ready():
+                continue
+            del self.pending[key]
+            kind, filename = key
+            try:
+                output = result.get()
+            except Exception:
+                traceback.print_exc()
+                attempts = self.attempts.get(key, (0, None))[0] + 1
+                self.attempts[key] = (attempts, signature)
+                print("Job %s of %s failed (attempt %d)" %
+                      (kind, filename, attempts))
+                continue
+            completed += 1
+            if kind == 'ff':
+                group = self.groups[filename]
+                group['ff_image'] = output
+                group['ff_averaged'] = record
+                continue
+            if kind == 'normalize':
+                self.manifest.record(NORMALIZE_STAGE, filename)
+                self._group(self.proc_records[os.path.basename(filename)])[
+                    'normalized'].add(filename)
+                print("%s normalized" % os.path.basename(filename))
+                continue
+            worker_record, h5_file, proc_file = output
+            if record is None:
+                record = worker_record
+            self.manifest.record(self.convert_stage, h5_file,
+                                 source=filename)
+            if proc_file is not None:
+                self.manifest.record("hdf5_proc", proc_file, source=h5_file)
+                if self.crop_stage is not None:
+                    self.manifest.record(self.crop_stage, proc_file)
+            self._add_records(record, proc_file)
+            self.done[filename] = signature
+            print("%s converted" % os.path.basename(filename))
+        return completed
+
+    def poll(self, timeout=None):
+        """Wait for new files up to timeout seconds (default:
+        poll_interval), submit the jobs of the files found and record the
+        jobs completed
+        :return: number of jobs completed
+        """
+        if timeout is None:
+            timeout = self.poll_interval
+        closed = self.events.wait(timeout)
+        self._read_script()
+        completed = self._collect()
+        self._scan(closed)
+        if self.normalize:
+            self._normalize()
+        if completed:
+            self.manifest.flush()
+        return completed
+
+    def run(self, idle_timeout=None):
+        """Process the files until stop is called, or until no job has been
+        completed or is running for idle_timeout seconds"""
+        self.running = True
+        last_activity = time.time()
+        print("Watching %s" % self.root_path)
+        while self.running:
+            if self.poll() or self.pending:
+                last_activity = time.time()
+            elif (idle_timeout is not None and
+                  time.time() - last_activity > idle_timeout):
+                break
+
+    def stop(self):
+        self.running = False
+
+    def close(self):
+        """Stop the workers (the jobs running are lost, and done again
+        when the watcher is started again), and write the DB"""
+        self.pool.terminate()
+        self.pool.join()
+        self.events.close()
+        self.manifest.flush()
+        self.db.close()
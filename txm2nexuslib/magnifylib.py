@@ -23,6 +23,8 @@ import cv2
 import h5py
 import numpy as np
 
+from txm2nexuslib.storage import dataset_options
+
 
 class Magnify(object):
 
@@ -161,15 +163,12 @@ class Magnify(object):
         return magnified_img
 
     def create_image_storage_dataset(self):
+        shape = (self.nFrames, self.numrows, self.numcols)
         self.magnified.create_dataset(
             self.img_stack,
-            shape=(self.nFrames,
-                   self.numrows,
-                   self.numcols),
-            chunks=(1,
-                    self.numrows,
-                    self.numcols),
-            dtype='float32')
+            shape=shape,
+            **dataset_options(shape, 'float32',
+                              chunks=(1, self.numrows, self.numcols)))
 
         self.magnified[self.img_stack].attrs[
             'Number of Frames'] = self.nFrames
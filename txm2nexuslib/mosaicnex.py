@@ -28,6 +28,9 @@ import datetime
 import time
 import argparse
 
+from txm2nexuslib import reading
+from txm2nexuslib.storage import dataset_options
+
 
 class MosaicNex:
 
@@ -139,7 +142,7 @@ class MosaicNex:
         print("Trying to convert xrm metadata to NeXus HDF5.")
         
         # Opening the .xrm files as Ole structures
-        ole = OleFileIO(self.mosaic_file_xrm)
+        ole = OleFileIO(self.mosaic_file_xrm, **reading.ole_options())
 
         # xrm files have been opened
         self.mosaic_grp['program_name'] = self.programname
@@ -226,7 +229,8 @@ class MosaicNex:
 
         # FF data size
         if self.brightexists == 1:
-            oleFF = OleFileIO(self.mosaic_file_FF_xrm)
+            oleFF = OleFileIO(self.mosaic_file_FF_xrm,
+                              **reading.ole_options())
             if (ole.exists('ImageInfo/NoOfImages') 
                 and oleFF.exists('ImageInfo/ImageWidth') 
                 and oleFF.exists('ImageInfo/ImageHeight')):                  
@@ -460,14 +464,16 @@ class MosaicNex:
         print("Converting mosaic image data from xrm to NeXus HDF5.")
 
         # Opening the mosaic .xrm file as an Ole structure.
-        olemosaic = OleFileIO(self.mosaic_file_xrm)
+        olemosaic = OleFileIO(self.mosaic_file_xrm,
+                              **reading.ole_options())
 
         # Mosaic data image
+        shape = (self.numrows, self.numcols)
         self.inst_sample_grp.create_dataset(
             "data",
-            shape=(self.numrows, self.numcols),
-            chunks=(1, self.numcols),
-            dtype=self.datatype)
+            shape=shape,
+            **dataset_options(shape, self.datatype,
+                              chunks=(1, self.numcols), raw=True))
 
         self.inst_sample_grp['data'].attrs['Data Type'] = self.datatype
         self.inst_sample_grp['data'].attrs['Number of Subimages'] = \
@@ -508,7 +514,8 @@ class MosaicNex:
         # FF Data
         if self.index_FF_file != -1:
             
-            oleFF = OleFileIO(self.mosaic_file_FF_xrm)
+            oleFF = OleFileIO(self.mosaic_file_FF_xrm,
+                              **reading.ole_options())
             print ("Trying to convert FF xrm image to NeXus HDF5.")
 
             # Mosaic FF data image
@@ -23,6 +23,8 @@ along with this program.  If not, see <http://www.gnu.org/licenses/>.
 import numpy as np
 import h5py
 
+from txm2nexuslib.storage import dataset_options
+
 
 class MosaicNormalize:
 
@@ -111,11 +113,12 @@ class MosaicNormalize:
 
             rel_cols_mosaic_to_FF = int(self.numcols / self.numcolsFF)
 
+            shape = (self.numrows, self.numcols)
             self.norm_grp.create_dataset(
                 "mosaic_normalized",
-                shape=(self.numrows, self.numcols),
-                chunks=(1, self.numcols),
-                dtype='float32')
+                shape=shape,
+                **dataset_options(shape, 'float32',
+                                  chunks=(1, self.numcols)))
 
             self.norm_grp['mosaic_normalized'].attrs[
                 'Pixel Rows'] = self.numrows
@@ -0,0 +1,144 @@
+#!/usr/bin/python
+
+"""
+(C) Copyright 2018 ALBA-CELLS
+Authors: Marc Rosanes, Carlos Falcon, Zbigniew Reszela, Carlos Pascual
+The program is distributed under the terms of the
+GNU General Public License (or the Lesser GPL).
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+
+import os
+import json
+
+
+# Environment variable through which the read policy set by a script is
+# passed to the programs it calls (os.system, subprocess) and to the
+# worker processes
+READ_POLICY_ENV = "TXM2NEXUS_READ_POLICY"
+
+
+class ReadPolicy(object):
+    """Options of the OleFileIO with which the xrm/txrm files are read.
+
+    The default policy reads the files as they have always been read: with
+    plain file reads, the data of each stream being copied in memory.
+    """
+
+    def __init__(self, use_mmap=False, layout_cache=False, min_read_size=0,
+                 merge_gap=0):
+        """
+        :param use_mmap: memory map the files, so that the images are
+        decoded directly from the mapped file (see
+        OleFileIO.openstream_buffer) instead of being read in memory first
+        :param layout_cache: keep the layout of each file (directory and
+        extents of its streams) in a sidecar file next to it (.xrmidx), so
+        that the files opened again, by the following steps of a workflow,
+        are not parsed again (see OleFileIO)
+        :param min_read_size: minimum size of the reads issued to the
+        files, in bytes; the extra data serves the following reads
+        :param merge_gap: pieces of a stream separated by at most this
+        number of bytes in the file are read at once. min_read_size and
+        merge_gap reduce the number of reads, which matters on network
+        filesystems, where each read is a round trip
+        """
+        if min_read_size < 0 or merge_gap < 0:
+            raise ValueError("min_read_size and merge_gap can not be "
+                             "negative")
+        self.use_mmap = use_mmap
+        self.layout_cache = layout_cache
+        self.min_read_size = min_read_size
+        self.merge_gap = merge_gap
+
+    def __repr__(self):
+        return "ReadPolicy(%s)" % ", ".join(
+            "%s=%r" % item for item in sorted(self.to_dict().items()))
+
+    def to_dict(self):
+        return {'use_mmap': self.use_mmap,
+                'layout_cache': self.layout_cache,
+                'min_read_size': self.min_read_size,
+                'merge_gap': self.merge_gap}
+
+    def ole_options(self):
+        """Keyword arguments of OleFileIO"""
+        return self.to_dict()
+
+
+_read_policy = None
+
+
+def get_read_policy():
+    """Read policy of the current process: the one set by set_read_policy,
+    or by the calling program, or the default one"""
+    global _read_policy
+    if _read_policy is None:
+        if os.environ.get(READ_POLICY_ENV):
+            _read_policy = ReadPolicy(
+                **json.loads(os.environ[READ_POLICY_ENV]))
+        else:
+            _read_policy = ReadPolicy()
+    return _read_policy
+
+
+def set_read_policy(policy):
+    """Set the read policy used to open the xrm/txrm files in this process,
+    in the worker processes and in the programs it calls"""
+    global _read_policy
+    _read_policy = policy
+    os.environ[READ_POLICY_ENV] = json.dumps(policy.to_dict())
+
+
+def ole_options():
+    """OleFileIO keyword arguments given by the current read policy"""
+    return get_read_policy().ole_options()
+
+
+def add_read_arguments(parser):
+    """Add the read policy options to an argparse parser"""
+
+    def str2bool(v):
+        return v.lower() in ("yes", "true", "t", "1")
+
+    group = parser.add_argument_group('xrm/txrm reading')
+    group.add_argument('--use_mmap', type=str2bool, default=False,
+                       help='Memory map the xrm/txrm files and decode the\n'
+                            'images directly from the mapped files\n'
+                            '(default: %(default)s)')
+    group.add_argument('--layout_cache', type=str2bool, default=False,
+                       help='Keep the layout of each xrm/txrm file in a\n'
+                            '.xrmidx file next to it, to open it faster\n'
+                            'the next times (default: %(default)s)')
+    group.add_argument('--min_read_size', type=int, default=0,
+                       help='Minimum size in bytes of the reads issued to '
+                            'the\nxrm/txrm files, as 65536 on network '
+                            'filesystems\n(default: %(default)s)')
+    group.add_argument('--merge_gap', type=int, default=0,
+                       help='Read at once the pieces of an image separated '
+                            'by\nat most this number of bytes in the file\n'
+                            '(default: %(default)s)')
+
+
+def set_read_policy_from_args(args):
+    """Set the read policy from the options added by add_read_arguments;
+    without options the policy inherited from the calling program, if any,
+    is kept"""
+    policy = ReadPolicy(use_mmap=args.use_mmap,
+                        layout_cache=args.layout_cache,
+                        min_read_size=args.min_read_size,
+                        merge_gap=args.merge_gap)
+    if policy.to_dict() != ReadPolicy().to_dict():
+        set_read_policy(policy)
@@ -23,6 +23,11 @@ along with this program.  If not, see <http://www.gnu.org/licenses/>.
 import argparse
 import os
 
+from txm2nexuslib.storage import (add_storage_arguments,
+                                   set_storage_policy_from_args)
+from txm2nexuslib.reading import (add_read_arguments,
+                                  set_read_policy_from_args)
+
 
 def main():
 
@@ -40,7 +45,11 @@ def main():
                              "subfolders 'mosaic', 'mosaic1', 'mosaic2' "
                              "and so on, are located.")
 
+    add_storage_arguments(parser)
+    add_read_arguments(parser)
     args = parser.parse_args()
+    set_storage_policy_from_args(args)
+    set_read_policy_from_args(args)
     general_folder = args.folder
 
     mosaic2nexus_program_name = 'mosaic2nexus'
@@ -23,6 +23,9 @@ along with this program.  If not, see <http://www.gnu.org/licenses/>.
 import argparse
 import os
 
+from txm2nexuslib.storage import (add_storage_arguments,
+                                   set_storage_policy_from_args)
+
 
 def main():
 
@@ -41,7 +44,9 @@ def main():
                              "subfolders 'tomo1' 'tomo2' and so on, "
                              "are located.")
 
+    add_storage_arguments(parser)
     args = parser.parse_args()
+    set_storage_policy_from_args(args)
     general_folder = args.folder
 
     normalize_program_name = 'normalize'
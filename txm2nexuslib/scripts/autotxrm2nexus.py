@@ -20,14 +20,81 @@ along with this program.  If not, see <http://www.gnu.org/licenses/>.
 """
 
 
-import argparse
 import os
+import sys
+import time
+import argparse
+import traceback
 
+from joblib import Parallel, delayed
 
-def main():
+from txm2nexuslib import txrmnex
+from txm2nexuslib.storage import (add_storage_arguments,
+                                   set_storage_policy_from_args)
+from txm2nexuslib.reading import (add_read_arguments,
+                                  set_read_policy_from_args)
+
+
+def find_tomo_folders(general_folder):
+    """Subfolders of the tomos ('tomo1', 'tomo2'... or 'TOMO1'...)"""
+    folders = []
+    for folder in sorted(os.listdir(general_folder)):
+        specific_folder = os.path.join(general_folder, folder)
+        if os.path.isdir(specific_folder) \
+                and (('tomo' in folder) or ('TOMO' in folder)):
+            folders.append(specific_folder)
+    return folders
+
+
+def find_txrm_files(folder):
+    """Tomography and FlatField txrm files of a tomo folder
+    :return: (tomography file, FlatField file); None if not found"""
+    tomo_txrm_file = None
+    flatfield_txrm_file = None
+    for filename in sorted(os.listdir(folder)):
+        if filename.endswith(".txrm"):
+            if 'FF' in filename:
+                flatfield_txrm_file = os.path.join(folder, filename)
+            else:
+                tomo_txrm_file = os.path.join(folder, filename)
+    return tomo_txrm_file, flatfield_txrm_file
+
+
+def convert_tomo_folder(folder):
+    """Convert the tomography of a tomo folder, and its FlatField if any,
+    to NeXus (as done by txrm2nexus). The errors are reported, and
+    returned instead of raised, so that the other folders are converted.
+    :return: (folder, seconds, error): error is None if the tomography
+    has been converted
+    """
+    start_time = time.time()
+    print('Converting tomos from folder ' + os.path.basename(folder))
+    files = [os.path.basename(filename) for filename in
+             find_txrm_files(folder) if filename is not None]
+    order_tomo_ff = 'sb'[:len(files)]
+    error = None
+    # the files are given relative to their folder, as done by txrm2nexus
+    # (the NXtomo title is the name of the tomography file)
+    initial_path = os.getcwd()
+    os.chdir(folder)
+    try:
+        nexus = txrmnex.txrmNXtomo(files, order_tomo_ff,
+                                   title='X-ray tomography')
+        if nexus.exitprogram == 1:
+            error = "wrong input files"
+        else:
+            nexus.NXtomo_structure()
+            nexus.convert_metadata()
+            nexus.convert_image_stack()
+    except Exception as e:
+        traceback.print_exc()
+        error = str(e) or e.__class__.__name__
+    finally:
+        os.chdir(initial_path)
+    return folder, time.time() - start_time, error
 
-    # Storage of current directory: initial path before executing the script.
-    intitialpath = os.getcwd()
+
+def main():
 
     parser = argparse.ArgumentParser(
         description='Automate the process of '
@@ -39,53 +106,44 @@ def main():
                         help="Indicates the folder adress where "
                              "the subfolders 'tomo1' 'tomo2' and so on, "
                              "are located.")
-
+    parser.add_argument('-c', '--cores', type=int,
+                        default=-2,
+                        help="Number of tomo folders converted at the same "
+                             "time (default is all the available CPUs "
+                             "but one: -2)")
+
+    add_storage_arguments(parser)
+    add_read_arguments(parser)
     args = parser.parse_args()
-    general_folder = args.folder
-
-    txrm2nexus_program_name = 'txrm2nexus'
-
-    for folder in os.listdir(general_folder):
-
-        specific_folder = os.path.join(general_folder, folder)
-        # Checking if the subfolder is a subfolder of tomos.
-        if os.path.isdir(specific_folder) \
-                and (('tomo' in folder) or ('TOMO' in folder)):
-
-            os.chdir(specific_folder)
-            print('Converting tomos from folder '+ folder)
-            for files in os.listdir("."):
-                if files.endswith(".txrm"):    
-                    if 'FF' in files:
-                        flatfield_txrm_file = files
-                    if 'FF' not in files:
-                        tomo_txrm_file = files
-                    
-            if tomo_txrm_file != 'None':
-                if flatfield_txrm_file == 'None':
-                    order_tomo_FF = 's'
-                    call_txrm2nexus = txrm2nexus_program_name + ' ' + \
-                                      tomo_txrm_file + ' ' + '-o=' + \
-                                      order_tomo_FF
-                    os.system(call_txrm2nexus)
-                else:
-                    order_tomo_FF = 'sb'
-                    call_txrm2nexus = txrm2nexus_program_name + ' ' + \
-                                      tomo_txrm_file + ' ' + \
-                                      flatfield_txrm_file + ' ' + \
-                                      '-o=' + order_tomo_FF
-                    print(call_txrm2nexus)
-                    os.system(call_txrm2nexus)
-
-            tomo_txrm_file = 'None'
-            flatfield_txrm_file = 'None'
-            os.chdir(general_folder)
-
-    # Return to initial path, the one that we had before executing the script.
-    os.chdir(intitialpath)
+    set_storage_policy_from_args(args)
+    set_read_policy_from_args(args)
+    start_time = time.time()
+
+    folders = []
+    for folder in find_tomo_folders(os.path.abspath(args.folder)):
+        if find_txrm_files(folder)[0] is None:
+            print('No tomography txrm file in folder ' +
+                  os.path.basename(folder))
+        else:
+            folders.append(folder)
+
+    # Each folder is converted by a worker process; a folder which cannot
+    # be converted does not stop the conversion of the others
+    results = Parallel(n_jobs=args.cores, backend="multiprocessing")(
+        delayed(convert_tomo_folder)(folder) for folder in folders)
+
+    failed = 0
+    print("\n%-30s %10s  %s" % ("folder", "seconds", "result"))
+    for folder, seconds, error in results:
+        if error is not None:
+            failed += 1
+        print("%-30s %10.1f  %s" % (os.path.basename(folder), seconds,
+                                    "failed: " + error if error else "ok"))
+    print("--- Convert %d tomo folders (%d failed) took %s seconds ---\n" %
+          (len(results), failed, time.time() - start_time))
+    if failed:
+        sys.exit(1)
 
 
 if __name__ == "__main__":
     main()
-
-
@@ -71,12 +71,29 @@ def main():
                         help='DB output table of raw hdf5 file records\n'
                              '(default: hdf5_proc)')
 
+    parser.add_argument('-i', '--incremental', type='bool',
+                        default='True',
+                        help='- If True: Skip the files already copied '
+                             'from their\n'
+                             '  current raw hdf5 file (see the DB manifest)\n'
+                             '- If False: Copy all the files\n'
+                             '(default: True)')
+
+    parser.add_argument('--hash', type='bool',
+                        default='False',
+                        help='Identify the raw hdf5 files by a hash of their '
+                             'contents,\n'
+                             'and not only by their size and modification '
+                             'time\n'
+                             '(default: False)')
+
     args = parser.parse_args()
 
     copy2proc_multiple(args.file_index_db, table_in_name=args.table_h5_in,
                        table_out_name=args.table_h5_out,
                        use_subfolders=args.subfolders, cores=args.cores,
-                       update_db=args.update_db)
+                       update_db=args.update_db,
+                       incremental=args.incremental, use_hash=args.hash)
 
     # printer.pprint(files)
 
@@ -26,6 +26,8 @@ import argparse
 from argparse import RawTextHelpFormatter
 
 from txm2nexuslib.image.image_operate_lib import *
+from txm2nexuslib.storage import (add_storage_arguments,
+                                   set_storage_policy_from_args)
 
 def str2bool(v):
     return v.lower() in ("yes", "true", "t", "1")
@@ -74,6 +76,14 @@ img commands:
         # use dispatch pattern to invoke method with same name
         getattr(self, args.command)()
 
+    def _parse_args(self, parser):
+        """Parse the arguments of a command, and set the storage policy of
+        the images it writes"""
+        add_storage_arguments(parser)
+        args = parser.parse_args(sys.argv[2:])
+        set_storage_policy_from_args(args)
+        return args
+
     def copy(self):
         parser = argparse.ArgumentParser(
             description='Copy a whole hdf5 file to a new file',
@@ -87,7 +97,7 @@ img commands:
         parser.add_argument('-s', '--suffix',
                             default='_proc',
                             type=str, help='suffix for new file name')
-        args = parser.parse_args(sys.argv[2:])
+        args = self._parse_args(parser)
         if args.output == "default":
             base_fn = os.path.splitext(args.input)[0]
             output_fn = base_fn + args.suffix + ".hdf5"
@@ -131,7 +141,7 @@ img commands:
                             default='data',
                             type=str, help='dataset name useful if storing'
                                            'in a freshly new hdf5')
-        args = parser.parse_args(sys.argv[2:])
+        args = self._parse_args(parser)
 
         roi = {"top": args.top, "bottom": args.bottom,
                "left": args.left, "right": args.right}
@@ -168,7 +178,7 @@ img commands:
                             default='default',
                             metavar='output',
                             type=str, help='output hdf5 filename')
-        args = parser.parse_args(sys.argv[2:])
+        args = self._parse_args(parser)
 
         add(args.addends, constant=args.constant,
             store=True, output_h5_fn=args.output)
@@ -192,7 +202,7 @@ img commands:
                             default='default',
                             metavar='output',
                             type=str, help='output hdf5 filename')
-        args = parser.parse_args(sys.argv[2:])
+        args = self._parse_args(parser)
 
         subtract(args.minuend_subtrahends, constant=args.constant,
                  store=True, output_h5_fn=args.output)
@@ -216,7 +226,7 @@ img commands:
                             default='default',
                             metavar='output',
                             type=str, help='output hdf5 filename')
-        args = parser.parse_args(sys.argv[2:])
+        args = self._parse_args(parser)
 
         multiply(args.factors, constant=args.constant,
                  store=True, output_h5_fn=args.output)
@@ -238,7 +248,7 @@ img commands:
                     default='default',
                     metavar='output',
                     type=str, help='output hdf5 filename')
-        args = parser.parse_args(sys.argv[2:])
+        args = self._parse_args(parser)
 
         divide(args.numerator, args.denominators,
                store=True, output_h5_fn=args.output)
@@ -270,7 +280,7 @@ img commands:
                             default='default',
                             metavar='output',
                             type=str, help='output hdf5 filename')
-        args = parser.parse_args(sys.argv[2:])
+        args = self._parse_args(parser)
 
         normalize_image(args.image_filename, args.ff_filenames,
                         store_normalized=True, output_h5_fn=args.output)
@@ -288,7 +298,7 @@ img commands:
                             type=str,
                             default="data",
                             help='dataset containing the image to clone')
-        args = parser.parse_args(sys.argv[2:])
+        args = self._parse_args(parser)
 
         image = Image(h5_image_filename=args.input_file,
                       image_data_set=args.dataset)
@@ -322,7 +332,7 @@ img commands:
                             default="data",
                             help='dataset containing the reference dataset\n'
                                  'Default: data')
-        args = parser.parse_args(sys.argv[2:])
+        args = self._parse_args(parser)
 
         image = Image(h5_image_filename=args.input_file,
                       image_data_set=args.dataset_for_aligning)
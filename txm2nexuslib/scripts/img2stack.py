@@ -25,6 +25,8 @@ import argparse
 from argparse import RawTextHelpFormatter
 
 from txm2nexuslib.images.imagestostack import many_images_to_h5_stack
+from txm2nexuslib.storage import (add_storage_arguments,
+                                   set_storage_policy_from_args)
 
 
 def main():
@@ -81,7 +83,9 @@ def main():
                              'conversion\n'
                              '(default: all CPUs but one are used: -2)')
 
+    add_storage_arguments(parser)
     args = parser.parse_args()
+    set_storage_policy_from_args(args)
     many_images_to_h5_stack(args.file_index_fn, table_name=args.table_h5,
                             type_struct=args.structure,
                             date=args.date, sample=args.sample,
@@ -21,6 +21,8 @@ along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 from txm2nexuslib import magnifylib
 import argparse
+from txm2nexuslib.storage import (add_storage_arguments,
+                                   set_storage_policy_from_args)
 
 
 class CustomFormatter(argparse.ArgumentDefaultsHelpFormatter,
@@ -43,7 +45,9 @@ def main():
     parser.add_argument('-s', '--spectroscopy', type=int, default=1,
                         help='Magnification of spectroscopy images (-s=1).')
 
+    add_storage_arguments(parser)
     args = parser.parse_args()
+    set_storage_policy_from_args(args)
 
     if args.spectroscopy == 1:
         print("\nMagnifying normalized images\n")
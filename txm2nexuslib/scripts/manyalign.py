@@ -25,6 +25,8 @@ import argparse
 from argparse import RawTextHelpFormatter
 
 from txm2nexuslib.images.multiplealign import align_images
+from txm2nexuslib.storage import (add_storage_arguments,
+                                   set_storage_policy_from_args)
 
 
 def main():
@@ -94,7 +96,9 @@ def main():
                         help='Number of cores used for the format conversion\n'
                              '(default is max of available CPUs but one: -2)')
 
+    add_storage_arguments(parser)
     args = parser.parse_args()
+    set_storage_policy_from_args(args)
 
     align_images(args.file_index_fn, args.table_h5,
                  dataset_for_aligning=args.dataset_for_aligning,
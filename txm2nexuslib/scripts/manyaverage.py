@@ -25,6 +25,8 @@ import argparse
 from argparse import RawTextHelpFormatter
 
 from txm2nexuslib.images.multipleaverage import average_image_groups
+from txm2nexuslib.storage import (add_storage_arguments,
+                                   set_storage_policy_from_args)
 
 
 def main():
@@ -88,7 +90,9 @@ def main():
                         help='Number of cores used for the format conversion\n'
                              '(default is max of available CPUs but one: -2)')
 
+    add_storage_arguments(parser)
     args = parser.parse_args()
+    set_storage_policy_from_args(args)
 
     average_image_groups(args.file_index_fn, table_name="hdf5_proc",
                          dataset_for_averaging="data", variable=args.variable,
@@ -25,6 +25,8 @@ import argparse
 from argparse import RawTextHelpFormatter
 
 from txm2nexuslib.images.multiplecrop import crop_images
+from txm2nexuslib.storage import (add_storage_arguments,
+                                   set_storage_policy_from_args)
 
 
 def main():
@@ -81,7 +83,9 @@ def main():
                         help='Number of cores used for the format conversion\n'
                              '(default: all cores but one: -2)')
 
+    add_storage_arguments(parser)
     args = parser.parse_args()
+    set_storage_policy_from_args(args)
 
     roi = {"top": args.top, "bottom": args.bottom,
            "left": args.left, "right": args.right}
@@ -25,6 +25,8 @@ import argparse
 from argparse import RawTextHelpFormatter
 
 from txm2nexuslib.images.multiplenormalization import normalize_images
+from txm2nexuslib.storage import (add_storage_arguments,
+                                   set_storage_policy_from_args)
 
 
 def main():
@@ -76,7 +78,9 @@ def main():
                         help='Number of cores used for the format conversion\n'
                              '(default is max of available CPUs: -1)')
 
+    add_storage_arguments(parser)
     args = parser.parse_args()
+    set_storage_policy_from_args(args)
 
     normalize_images(args.file_index_fn, table_name=args.table_h5,
                      date=args.date, sample=args.sample, energy=args.energy,
@@ -22,7 +22,12 @@ along with this program.  If not, see <http://www.gnu.org/licenses/>.
 import os
 import datetime
 import argparse
-from txm2nexuslib.xrmnex import xrmNXtomo, xrmReader
+from joblib import Parallel, delayed
+from txm2nexuslib.xrmnex import xrmNXtomo, xrmReader, xrmCachedReader
+from txm2nexuslib.storage import (add_storage_arguments,
+                                   set_storage_policy_from_args)
+from txm2nexuslib.reading import (add_read_arguments,
+                                  set_read_policy_from_args)
 
 
 def get_samples(dir_name):
@@ -53,6 +58,28 @@ def get_samples(dir_name):
     return samples
 
 
+def convert_tomo(tomo_files, ffreader, output_dir, title, sourcename,
+                 sourcetype, sourceprobe, instrument):
+    """Convert a tomo and the FF images of its sample (ffreader, usually
+    an xrmCachedReader shared by all the tomos of the sample) into a
+    NeXus hdf5 file"""
+    reader = xrmReader(tomo_files)
+    xrm = xrmNXtomo(reader, ffreader,
+                    'sb',  # TODO: Not need?
+                    'xrm2nexus',
+                    hdf5_output_path=output_dir,
+                    title=title,
+                    zero_deg_in=None,  # TODO Not well implemented
+                    zero_deg_final=None,  # TODO Not well implemented
+                    sourcename=sourcename,
+                    sourcetype=sourcetype,
+                    sourceprobe=sourceprobe,
+                    instrument=instrument,
+                    )
+    xrm.convert_metadata()
+    xrm.convert_tomography()
+
+
 def main():
 
     print("\n")
@@ -81,45 +108,47 @@ def main():
                              "'x-ray', 'neutron','electron'")
     parser.add_argument('--instrument-name', type=str, default='BL09 @ ALBA',
                         help="Sets the instrument name")
+    parser.add_argument('-c', '--cores', type=int, default=-2,
+                        help="Number of tomos converted at the same time "
+                             "(default is all the available CPUs but one: "
+                             "-2)")
 
+    add_storage_arguments(parser)
+    add_read_arguments(parser)
     args = parser.parse_args()
+    set_storage_policy_from_args(args)
+    set_read_policy_from_args(args)
 
     dir_name = args.input_dir_name
     output_dir = args.output_dir_name
     samples = get_samples(dir_name)
-    # Generate the hdf5 files
-    for sample in samples.keys():
-        tomos = samples[sample]['tomos']
-        # Create FF reader
-        ff_files = samples[sample]['ff']
-        ff_files.sort(key=lambda x: os.path.getmtime(x))
-        ffreader = xrmReader(ff_files)
-        for tomo in tomos.keys():
-            tomo_files = samples[sample]['tomos'][tomo]
+
+    def tomo_jobs():
+        for sample in samples.keys():
+            tomos = samples[sample]['tomos']
+            ff_files = samples[sample]['ff']
             if len(ff_files) == 0:
-                print "WARNING: %s of Sample: %s have not BrightField " \
-                      "files. HDF5 file can not be created for this tomo" %\
-                      (tomo, sample)
+                for tomo in tomos.keys():
+                    print "WARNING: %s of Sample: %s have not BrightField " \
+                          "files. HDF5 file can not be created for this " \
+                          "tomo" % (tomo, sample)
                 continue
-            # sort files
-            tomo_files.sort(key=lambda x: os.path.getmtime(x))
-
-            reader = xrmReader(tomo_files)
-
-            xrm = xrmNXtomo(reader, ffreader,
-                            'sb',  # TODO: Not need?
-                            'xrm2nexus',
-                            hdf5_output_path=output_dir,
-                            title=args.title,
-                            zero_deg_in=None,  # TODO Not well implemented
-                            zero_deg_final=None,  # TODO Not well implemented
-                            sourcename=args.source_name,
-                            sourcetype=args.source_type,
-                            sourceprobe=args.source_probe,
-                            instrument=args.instrument_name,
-                            )
-            xrm.convert_metadata()
-            xrm.convert_tomography()
+            # The FF images of the sample are decoded once, and shared by
+            # the conversions of all its tomos
+            ff_files.sort(key=lambda x: os.path.getmtime(x))
+            ffreader = xrmCachedReader(xrmReader(ff_files))
+            for tomo in tomos.keys():
+                tomo_files = samples[sample]['tomos'][tomo]
+                # sort files
+                tomo_files.sort(key=lambda x: os.path.getmtime(x))
+                yield delayed(convert_tomo)(
+                    tomo_files, ffreader, output_dir, args.title,
+                    args.source_name, args.source_type, args.source_probe,
+                    args.instrument_name)
+
+    # Generate the hdf5 files: the tomos are converted in parallel, the FF
+    # images of each sample being decoded when its first tomo is submitted
+    Parallel(n_jobs=args.cores, backend="multiprocessing")(tomo_jobs())
 
     print("\n")
     print(datetime.datetime.today())
@@ -26,6 +26,10 @@ from argparse import RawTextHelpFormatter
 
 from txm2nexuslib.images.multiplexrm2h5 import multiple_xrm_2_hdf5
 from txm2nexuslib.parser import create_db, get_db_path
+from txm2nexuslib.storage import (add_storage_arguments,
+                                   set_storage_policy_from_args)
+from txm2nexuslib.reading import (add_read_arguments,
+                                  set_read_policy_from_args)
 
 
 def main():
@@ -59,13 +63,43 @@ def main():
                         help='Update DB with hdf5 records\n'
                              '(default: True)')
 
+    parser.add_argument('--container', type='bool',
+                        default='False',
+                        help='- If True: Gather the images of each '
+                             'acquisition (date, sample,\n'
+                             '  energy, zpz...) in a single hdf5 file\n'
+                             '- If False: One hdf5 file per xrm file\n'
+                             '(default: False)')
+
+    parser.add_argument('-i', '--incremental', type='bool',
+                        default='True',
+                        help='- If True: Skip the files already converted '
+                             'from their\n'
+                             '  current xrm file (see the DB manifest)\n'
+                             '- If False: Convert all the files\n'
+                             '(default: True)')
+
+    parser.add_argument('--hash', type='bool',
+                        default='False',
+                        help='Identify the xrm files by a hash of their '
+                             'contents,\n'
+                             'and not only by their size and modification '
+                             'time\n'
+                             '(default: False)')
+
+    add_storage_arguments(parser)
+    add_read_arguments(parser)
     args = parser.parse_args()
+    set_storage_policy_from_args(args)
+    set_read_policy_from_args(args)
 
     db_filename = get_db_path(args.txm_txt_script)
     create_db(args.txm_txt_script)
 
     multiple_xrm_2_hdf5(db_filename, subfolders=args.subfolders,
-                        cores=args.cores, update_db=args.update_db)
+                        cores=args.cores, update_db=args.update_db,
+                        container=args.container,
+                        incremental=args.incremental, use_hash=args.hash)
 
 
 if __name__ == "__main__":
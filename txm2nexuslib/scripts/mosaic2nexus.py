@@ -22,6 +22,10 @@ along with this program.  If not, see <http://www.gnu.org/licenses/>.
 from txm2nexuslib import mosaicnex
 import datetime
 import argparse
+from txm2nexuslib.storage import (add_storage_arguments,
+                                   set_storage_policy_from_args)
+from txm2nexuslib.reading import (add_read_arguments,
+                                  set_read_policy_from_args)
 
 
 def main():
@@ -58,7 +62,11 @@ def main():
     parser.add_argument('--sample-name', type=str, default='Unknown', 
         help="Sets the sample name") 
 
+    add_storage_arguments(parser)
+    add_read_arguments(parser)
     args = parser.parse_args()
+    set_storage_policy_from_args(args)
+    set_read_policy_from_args(args)
 
     nexusmosaic = mosaicnex.MosaicNex(args.files, args.files_order, args.title,
                                       args.source_name, args.source_type, 
@@ -24,6 +24,8 @@ from txm2nexuslib import tomonorm
 from txm2nexuslib import specnorm
 from txm2nexuslib import mosaicnorm
 import argparse
+from txm2nexuslib.storage import (add_storage_arguments,
+                                   set_storage_policy_from_args)
 
 
 class CustomFormatter(argparse.ArgumentDefaultsHelpFormatter,
@@ -80,7 +82,9 @@ def main():
                         help='Correct diffraction pattern with external '
                              'given avgFF (-d=1).')
 
+    add_storage_arguments(parser)
     args = parser.parse_args()
+    set_storage_policy_from_args(args)
 
     if args.mosaicnorm == 1:
         print("\nNormalizing Mosaic")
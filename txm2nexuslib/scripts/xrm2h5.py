@@ -24,6 +24,10 @@ import os
 import argparse
 from argparse import RawTextHelpFormatter
 from txm2nexuslib.image.xrm2hdf5 import Xrm2H5Converter
+from txm2nexuslib.storage import (add_storage_arguments,
+                                   set_storage_policy_from_args)
+from txm2nexuslib.reading import (add_read_arguments,
+                                  set_read_policy_from_args)
 
 
 def main():
@@ -42,7 +46,11 @@ def main():
                              'given it will keep the input name with the hdf5'
                              'extension')
 
+    add_storage_arguments(parser)
+    add_read_arguments(parser)
     args = parser.parse_args()
+    set_storage_policy_from_args(args)
+    set_read_policy_from_args(args)
 
     xrm2h5_converter = Xrm2H5Converter(args.xrm_filename)
     xrm2h5_converter.convert_xrm_to_h5_file()
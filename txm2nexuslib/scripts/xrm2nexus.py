@@ -25,6 +25,10 @@ import datetime
 import argparse
 from argparse import RawTextHelpFormatter
 from txm2nexuslib.xrmnex import FilesOrganization, xrmNXtomo, xrmReader
+from txm2nexuslib.storage import (add_storage_arguments,
+                                   set_storage_policy_from_args)
+from txm2nexuslib.reading import (add_read_arguments,
+                                  set_read_policy_from_args)
 
 
 def main():
@@ -76,7 +80,11 @@ def main():
     parser.add_argument('--instrument-name', type=str, default='BL09 @ ALBA',
                         help="Sets the instrument name")
 
+    add_storage_arguments(parser)
+    add_read_arguments(parser)
     args = parser.parse_args()
+    set_storage_policy_from_args(args)
+    set_read_policy_from_args(args)
 
     txm_txt_script = args.input_txm_script
     output_dir = os.path.abspath(args.output_dir)
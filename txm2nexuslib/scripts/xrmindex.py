@@ -0,0 +1,67 @@
+#!/usr/bin/python
+
+"""
+(C) Copyright 2018 ALBA-CELLS
+Authors: Marc Rosanes, Carlos Falcon, Zbigniew Reszela, Carlos Pascual
+The program is distributed under the terms of the
+GNU General Public License (or the Lesser GPL).
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+
+import argparse
+from argparse import RawTextHelpFormatter
+
+from txm2nexuslib.images.xrmindex import index_xrm_files
+from txm2nexuslib.reading import (add_read_arguments,
+                                  set_read_policy_from_args)
+
+
+def main():
+
+    description = 'Create the files index DB (index.json) of the xrm ' \
+                  'files of a folder and its subfolders, from the metadata ' \
+                  'recorded in the files (no TXM txt script needed)'
+    parser = argparse.ArgumentParser(description=description,
+                                     formatter_class=RawTextHelpFormatter)
+
+    parser.add_argument('root_dir', metavar='root_dir',
+                        type=str, nargs='?', default='.',
+                        help='Folder containing the xrm files\n'
+                             '(default: current folder)')
+
+    parser.add_argument('-o', '--output', type=str, default=None,
+                        help='Files index DB to be created\n'
+                             '(default: index.json in root_dir)')
+
+    parser.add_argument('-p', '--pattern', type=str, default='*.xrm',
+                        help='Pattern of the files to be indexed\n'
+                             '(default: *.xrm)')
+
+    parser.add_argument('-c', '--cores', type=int,
+                        default=-2,
+                        help='Number of cores used for reading the files\n'
+                             '(default is all the available CPUs but one: -2)')
+
+    add_read_arguments(parser)
+    args = parser.parse_args()
+    set_read_policy_from_args(args)
+
+    index_xrm_files(args.root_dir, db_filename=args.output,
+                    pattern=args.pattern, cores=args.cores)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+#!/usr/bin/python
+
+"""
+(C) Copyright 2018 ALBA-CELLS
+Authors: Marc Rosanes, Carlos Falcon, Zbigniew Reszela, Carlos Pascual
+The program is distributed under the terms of the
+GNU General Public License (or the Lesser GPL).
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+
+import signal
+import argparse
+from argparse import RawTextHelpFormatter
+
+from txm2nexuslib.images.xrmwatch import XrmWatcher
+from txm2nexuslib.storage import (add_storage_arguments,
+                                   set_storage_policy_from_args)
+from txm2nexuslib.reading import (add_read_arguments,
+                                  set_read_policy_from_args)
+
+
+def main():
+
+    def str2bool(v):
+        return v.lower() in ("yes", "true", "t", "1")
+
+    description = ('Watch an acquisition folder, and convert each new xrm '
+                   'file to hdf5\nas soon as it is written, adding it to the '
+                   'files index DB.\nOptionally, copy the hdf5 files for '
+                   'processing, crop them and\nnormalize them as soon as '
+                   'their FF images are processed.\n'
+                   'The files already processed are not processed again '
+                   'when\nthe program is started again.')
+    parser = argparse.ArgumentParser(description=description,
+                                     formatter_class=RawTextHelpFormatter)
+    parser.register('type', 'bool', str2bool)
+
+    parser.add_argument('root_dir', metavar='root_dir',
+                        type=str, nargs='?', default='.',
+                        help='Acquisition folder\n'
+                             '(default: current folder)')
+
+    parser.add_argument('-s', '--txm_txt_script', type=str, default=None,
+                        help='TXM txt script of the acquisition; if not '
+                             'given, the\nindex records are read from the '
+                             'xrm files\n(default: None)')
+
+    parser.add_argument('-o', '--output', type=str, default=None,
+                        help='Files index DB\n'
+                             '(default: index.json in root_dir)')
+
+    parser.add_argument('-p', '--pattern', type=str, default='*.xrm',
+                        help='Pattern of the files to be processed\n'
+                             '(default: *.xrm)')
+
+    parser.add_argument('-n', '--normalize', type='bool', default='False',
+                        help='Copy for processing, crop and normalize the '
+                             'images\n(default: False)')
+
+    parser.add_argument('--crop', type='bool', default='True',
+                        help='Crop the images before normalizing them\n'
+                             '(default: True)')
+
+    parser.add_argument('-w', '--workers', type=int, default=2,
+                        help='Number of worker processes\n(default: 2)')
+
+    parser.add_argument('-t', '--poll_interval', type=float, default=2.0,
+                        help='Seconds between two scans of the folder\n'
+                             '(default: 2)')
+
+    parser.add_argument('--idle_timeout', type=float, default=None,
+                        help='Exit after this number of seconds without '
+                             'new files\n(default: run until interrupted)')
+
+    add_storage_arguments(parser)
+    add_read_arguments(parser)
+    args = parser.parse_args()
+    set_storage_policy_from_args(args)
+    set_read_policy_from_args(args)
+
+    watcher = XrmWatcher(args.root_dir, txm_txt_script=args.txm_txt_script,
+                         db_filename=args.output, pattern=args.pattern,
+                         normalize=args.normalize, crop=args.crop,
+                         workers=args.workers,
+                         poll_interval=args.poll_interval)
+    signal.signal(signal.SIGTERM, lambda signum, frame: watcher.stop())
+    try:
+        watcher.run(idle_timeout=args.idle_timeout)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        watcher.close()
+
+
+if __name__ == "__main__":
+    main()
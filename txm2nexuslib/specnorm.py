@@ -23,6 +23,8 @@ along with this program.  If not, see <http://www.gnu.org/licenses/>.
 import numpy as np
 import h5py
 
+from txm2nexuslib.storage import dataset_options
+
 
 class SpecNormalize:
 
@@ -182,15 +184,12 @@ class SpecNormalize:
                   "(for sampleImages and FF) is present in the hdf5 file.\n")
 
 
+            shape = (self.nFrames, self.numrows, self.numcols)
             self.norm_grp.create_dataset(
                 "spectroscopy_normalized",
-                shape=(self.nFrames,
-                       self.numrows,
-                       self.numcols),
-                chunks=(1,
-                        self.numrows,
-                        self.numcols),
-                dtype='float32')
+                shape=shape,
+                **dataset_options(shape, 'float32',
+                                  chunks=(1, self.numrows, self.numcols)))
 
             self.norm_grp['spectroscopy_normalized'].attrs[
                 'Number of Frames'] = self.nFrames
@@ -0,0 +1,291 @@
+#!/usr/bin/python
+
+"""
+(C) Copyright 2018 ALBA-CELLS
+Authors: Marc Rosanes, Carlos Falcon, Zbigniew Reszela, Carlos Pascual
+The program is distributed under the terms of the
+GNU General Public License (or the Lesser GPL).
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+
+import os
+import json
+
+import numpy as np
+
+
+# Environment variable through which the storage policy set by a script is
+# passed to the programs it calls (os.system, subprocess)
+STORAGE_POLICY_ENV = "TXM2NEXUS_STORAGE_POLICY"
+
+COMPRESSIONS = ("none", "lzf", "gzip")
+FLOAT_DTYPES = ("float16", "float32", "float64")
+
+DEFAULT_GZIP_LEVEL = 4
+
+# Size of the buffer in which FrameWriter gathers the frames written at once,
+# when the number of frames per write is not given
+WRITE_BUFFER_SIZE = 64 << 20
+
+
+class StoragePolicy(object):
+    """Layout of the image datasets written in the HDF5 files: compression
+    filter, chunk shape and dtype of the floating point images.
+
+    The default policy writes the datasets as they have always been
+    written: uncompressed, chunked by the writers (one frame per chunk for
+    the stacks) and with the dtype chosen by the writers.
+    """
+
+    def __init__(self, compression=None, compression_level=None,
+                 shuffle=False, frames_per_chunk=1, float_dtype=None,
+                 frames_per_write=None):
+        """
+        :param compression: None, "lzf" (fast, only readable with h5py)
+        or "gzip" (readable by any HDF5 application)
+        :param compression_level: gzip level, from 0 to 9
+        :param shuffle: apply the shuffle filter before the compression;
+        it improves the compression of the multi-byte data (as uint16)
+        :param frames_per_chunk: number of frames (or rows, for the 2D
+        datasets chunked by rows) grouped in each chunk of the datasets
+        :param float_dtype: dtype of the processed floating point images
+        (normalized, magnified, stacks...); None keeps the writers' dtype
+        :param frames_per_write: number of frames of the stacks written at
+        once by FrameWriter, rounded to whole chunks; None fills a buffer
+        of WRITE_BUFFER_SIZE bytes
+        """
+        if compression == "none":
+            compression = None
+        if compression not in COMPRESSIONS[1:] + (None,):
+            raise ValueError("Unknown compression: %s" % compression)
+        if float_dtype is not None and float_dtype not in FLOAT_DTYPES:
+            raise ValueError("Unknown float dtype: %s" % float_dtype)
+        if frames_per_chunk < 1:
+            raise ValueError("frames_per_chunk must be at least 1")
+        if frames_per_write is not None and frames_per_write < 1:
+            raise ValueError("frames_per_write must be at least 1")
+        if compression != "gzip":
+            compression_level = None
+        elif compression_level is None:
+            compression_level = DEFAULT_GZIP_LEVEL
+        self.compression = compression
+        self.compression_level = compression_level
+        self.shuffle = shuffle
+        self.frames_per_chunk = frames_per_chunk
+        self.float_dtype = float_dtype
+        self.frames_per_write = frames_per_write
+
+    def __repr__(self):
+        return "StoragePolicy(%s)" % ", ".join(
+            "%s=%r" % item for item in sorted(self.to_dict().items()))
+
+    def to_dict(self):
+        return {'compression': self.compression,
+                'compression_level': self.compression_level,
+                'shuffle': self.shuffle,
+                'frames_per_chunk': self.frames_per_chunk,
+                'float_dtype': self.float_dtype,
+                'frames_per_write': self.frames_per_write}
+
+    def get_dtype(self, dtype, raw=False):
+        """dtype with which an image of the given dtype is stored: the
+        processed floating point images are stored with float_dtype"""
+        if (raw or self.float_dtype is None or
+                not np.issubdtype(np.dtype(dtype), np.floating)):
+            return dtype
+        return self.float_dtype
+
+    def dataset_options(self, shape, dtype, chunks=None, raw=False):
+        """Keyword arguments of h5py create_dataset for an image dataset
+        :param shape: shape of the dataset
+        :param dtype: dtype chosen by the writer
+        :param chunks: chunk shape chosen by the writer, if any
+        :param raw: True for the raw data (as read from the xrm/txrm
+        files), whose dtype is never changed
+        """
+        dtype = self.get_dtype(dtype, raw=raw)
+        frames = max(1, min(self.frames_per_chunk, shape[0]))
+        if chunks is not None and self.frames_per_chunk > 1:
+            chunks = (frames,) + tuple(chunks[1:])
+        if self.compression is None:
+            return {'dtype': dtype, 'chunks': chunks}
+        if chunks is None:
+            # the filters need a chunked dataset: the whole image, or
+            # frames_per_chunk frames of the stacks, per chunk
+            if len(shape) > 2:
+                chunks = (frames,) + tuple(shape[1:])
+            else:
+                chunks = tuple(shape)
+        options = {'dtype': dtype, 'chunks': chunks,
+                   'compression': self.compression}
+        if self.compression == "gzip":
+            options['compression_opts'] = self.compression_level
+        if self.shuffle and np.dtype(dtype).itemsize > 1:
+            options['shuffle'] = True
+        return options
+
+    def get_frames_per_write(self, dataset):
+        """Number of frames of a stack dataset written at once: a whole
+        number of chunks, and at most the frames of the dataset"""
+        chunk_frames = dataset.chunks[0] if dataset.chunks else 1
+        frames = self.frames_per_write
+        if frames is None:
+            frame_size = (np.prod(dataset.shape[1:], dtype=np.int64) *
+                          dataset.dtype.itemsize)
+            frames = WRITE_BUFFER_SIZE // max(1, frame_size)
+        frames = max(chunk_frames, frames // chunk_frames * chunk_frames)
+        return max(1, min(frames, dataset.shape[0]))
+
+
+_storage_policy = None
+
+
+def get_storage_policy():
+    """Storage policy of the current process: the one set by
+    set_storage_policy, or by the calling program, or the default one"""
+    global _storage_policy
+    if _storage_policy is None:
+        if os.environ.get(STORAGE_POLICY_ENV):
+            _storage_policy = StoragePolicy(
+                **json.loads(os.environ[STORAGE_POLICY_ENV]))
+        else:
+            _storage_policy = StoragePolicy()
+    return _storage_policy
+
+
+def set_storage_policy(policy):
+    """Set the storage policy used by all the HDF5 writers of this process,
+    of the worker processes and of the programs it calls"""
+    global _storage_policy
+    _storage_policy = policy
+    os.environ[STORAGE_POLICY_ENV] = json.dumps(policy.to_dict())
+
+
+def dataset_options(shape, dtype, chunks=None, raw=False):
+    """create_dataset keyword arguments given by the current storage
+    policy (see StoragePolicy.dataset_options)"""
+    return get_storage_policy().dataset_options(shape, dtype, chunks=chunks,
+                                                raw=raw)
+
+
+class FrameWriter(object):
+    """Write consecutive frames of a 3D dataset in batches: the frames are
+    gathered in a contiguous buffer, and each batch is written with a
+    single write_direct of a hyperslab of the dataset, instead of a
+    selection and a write per frame.
+
+        with FrameWriter(dataset) as writer:
+            for image in images:
+                writer.write(image)
+
+    next_frame returns the next frame of the buffer, to decode an image
+    directly in it. The frames are written at the latest when the writer
+    is flushed, or at the end of the with block.
+    """
+
+    def __init__(self, dataset, offset=0, frames_per_write=None):
+        """
+        :param dataset: 3D dataset (frames, rows, columns)
+        :param offset: frame of the dataset where the first frame is written
+        :param frames_per_write: number of frames written at once (default:
+        given by the storage policy)
+        """
+        if frames_per_write is None:
+            frames_per_write = get_storage_policy().get_frames_per_write(
+                dataset)
+        self.dataset = dataset
+        self.offset = offset
+        self.buffer = np.empty((frames_per_write,) + dataset.shape[1:],
+                               dtype=dataset.dtype)
+        self.count = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        if type is None:
+            self.flush()
+
+    def next_frame(self):
+        """Next frame of the buffer, to be filled by the caller"""
+        if self.count == len(self.buffer):
+            self.flush()
+        frame = self.buffer[self.count]
+        self.count += 1
+        return frame
+
+    def write(self, image):
+        """Write an image in the next frame"""
+        self.next_frame()[...] = image
+
+    def flush(self):
+        """Write the frames of the buffer in the dataset"""
+        if not self.count:
+            return
+        self.dataset.write_direct(
+            self.buffer, source_sel=np.s_[:self.count],
+            dest_sel=np.s_[self.offset:self.offset + self.count])
+        self.offset += self.count
+        self.count = 0
+
+
+def add_storage_arguments(parser):
+    """Add the storage policy options to an argparse parser"""
+
+    def str2bool(v):
+        return v.lower() in ("yes", "true", "t", "1")
+
+    group = parser.add_argument_group('HDF5 storage')
+    group.add_argument('--compression', type=str, default="none",
+                       choices=COMPRESSIONS,
+                       help='Compression of the image datasets: lzf is '
+                            'fast\nbut only readable with h5py; gzip is '
+                            'readable\nby any HDF5 application '
+                            '(default: %(default)s)')
+    group.add_argument('--compression_level', type=int,
+                       default=DEFAULT_GZIP_LEVEL, choices=range(10),
+                       help='gzip compression level (default: %(default)s)')
+    group.add_argument('--shuffle', type=str2bool, default=False,
+                       help='Apply the shuffle filter before compressing;\n'
+                            'it improves the compression of uint16 data\n'
+                            '(default: %(default)s)')
+    group.add_argument('--frames_per_chunk', type=int, default=1,
+                       help='Number of frames in each chunk of the image\n'
+                            'stacks (default: %(default)s)')
+    group.add_argument('--frames_per_write', type=int, default=None,
+                       help='Number of frames of the image stacks written '
+                            'at once;\nNone fills a buffer of %d MiB\n'
+                            '(default: %%(default)s)'
+                            % (WRITE_BUFFER_SIZE >> 20))
+    group.add_argument('--float_dtype', type=str, default=None,
+                       choices=FLOAT_DTYPES,
+                       help='dtype of the processed floating point images;\n'
+                            'None keeps the one of each program\n'
+                            '(default: %(default)s)')
+
+
+def set_storage_policy_from_args(args):
+    """Set the storage policy from the options added by
+    add_storage_arguments; without options the policy inherited from the
+    calling program, if any, is kept"""
+    policy = StoragePolicy(compression=args.compression,
+                           compression_level=args.compression_level,
+                           shuffle=args.shuffle,
+                           frames_per_chunk=args.frames_per_chunk,
+                           float_dtype=args.float_dtype,
+                           frames_per_write=args.frames_per_write)
+    if policy.to_dict() != StoragePolicy().to_dict():
+        set_storage_policy(policy)
@@ -0,0 +1,74 @@
+#!/usr/bin/python
+
+"""
+Micro-benchmark of the OleFileIO open profiles: latency of opening an xrm
+file and reading all its metadata, parsing the file (default profile) and
+from the layout kept in its sidecar (layout cache profile, see OleFileIO),
+over many small xrm files. The sidecars are written by the first
+repetition.
+
+    python benchmark_olefile.py /beamlines/bl09/data/20160626 -r 3
+"""
+
+import time
+import argparse
+from argparse import RawTextHelpFormatter
+
+from txm2nexuslib.xrmnex import XradiaFile
+from txm2nexuslib.images.xrmindex import find_xrm_files
+
+
+PROFILES = (
+    ('default', {}),
+    ('layout', {'layout_cache': True}),
+)
+
+
+def open_and_read_metadata(file_names, ole_options):
+    """Open each file and read all its metadata; return the elapsed time"""
+    start_time = time.time()
+    for file_name in file_names:
+        with XradiaFile(file_name, **ole_options) as xrm_file:
+            xrm_file.read_all_metadata()
+    return time.time() - start_time
+
+
+def main():
+
+    description = 'Compare the open + metadata latency of the OleFileIO ' \
+                  'profiles over the xrm files of a folder'
+    parser = argparse.ArgumentParser(description=description,
+                                     formatter_class=RawTextHelpFormatter)
+    parser.add_argument('root_dir', metavar='root_dir', type=str,
+                        help='Folder containing the xrm files')
+    parser.add_argument('-p', '--pattern', type=str, default='*.xrm',
+                        help='Pattern of the files to be read\n'
+                             '(default: *.xrm)')
+    parser.add_argument('-r', '--repeat', type=int, default=3,
+                        help='Number of repetitions; the best one is '
+                             'reported\n(default: 3)')
+    args = parser.parse_args()
+
+    file_names = find_xrm_files(args.root_dir, pattern=args.pattern)
+    if not file_names:
+        parser.error("no file matching %s in %s" % (args.pattern,
+                                                    args.root_dir))
+    # the files are read once before timing, so that all the profiles
+    # find them in the page cache
+    open_and_read_metadata(file_names, {})
+
+    print("%d files\n" % len(file_names))
+    print("%-10s %12s %12s" % ("profile", "total (s)", "per file (ms)"))
+    reference = None
+    for name, ole_options in PROFILES:
+        elapsed = min(open_and_read_metadata(file_names, ole_options)
+                      for _ in range(args.repeat))
+        if reference is None:
+            reference = elapsed
+        print("%-10s %12.3f %12.3f   x%.2f" % (
+            name, elapsed, 1000 * elapsed / len(file_names),
+            reference / elapsed))
+
+
+if __name__ == "__main__":
+    main()
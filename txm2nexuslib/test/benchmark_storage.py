@@ -0,0 +1,119 @@
+#!/usr/bin/python
+
+"""
+Benchmark of the HDF5 storage policies: write and read throughput, and size
+on disk, of a stack of raw frames read from the xrm files of a folder,
+stored with each compression filter.
+
+    python benchmark_storage.py /beamlines/bl09/data/20160626 -n 100
+"""
+
+import os
+import time
+import shutil
+import argparse
+import tempfile
+from argparse import RawTextHelpFormatter
+
+import h5py
+import numpy as np
+
+from txm2nexuslib.xrmnex import XradiaFile
+from txm2nexuslib.images.xrmindex import find_xrm_files
+from txm2nexuslib.storage import StoragePolicy
+
+
+POLICIES = (
+    ('none', StoragePolicy()),
+    ('lzf', StoragePolicy(compression="lzf")),
+    ('lzf+shuffle', StoragePolicy(compression="lzf", shuffle=True)),
+    ('gzip1', StoragePolicy(compression="gzip", compression_level=1)),
+    ('gzip1+shuffle', StoragePolicy(compression="gzip", compression_level=1,
+                                    shuffle=True)),
+    ('gzip4', StoragePolicy(compression="gzip", compression_level=4)),
+    ('gzip4+shuffle', StoragePolicy(compression="gzip", compression_level=4,
+                                    shuffle=True)),
+    ('gzip9+shuffle', StoragePolicy(compression="gzip", compression_level=9,
+                                    shuffle=True)),
+)
+
+
+def read_frames(file_names):
+    """Stack of the images of the xrm files"""
+    frames = []
+    for file_name in file_names:
+        with XradiaFile(file_name) as xrm_file:
+            frames.append(xrm_file.get_raw_image_2D())
+    return np.array(frames)
+
+
+def write_and_read(frames, policy, h5_filename):
+    """Write the frames, one by one, with the policy and read them back;
+    return the write time, the read time and the size of the file"""
+    shape = frames.shape
+    start_time = time.time()
+    with h5py.File(h5_filename, 'w') as f:
+        data = f.create_dataset(
+            "data", shape=shape,
+            **policy.dataset_options(shape, frames.dtype,
+                                     chunks=(1,) + shape[1:], raw=True))
+        for i, frame in enumerate(frames):
+            data[i] = frame
+    write_time = time.time() - start_time
+    start_time = time.time()
+    with h5py.File(h5_filename, 'r') as f:
+        data = f["data"]
+        for i in range(shape[0]):
+            data[i]
+    read_time = time.time() - start_time
+    return write_time, read_time, os.path.getsize(h5_filename)
+
+
+def main():
+
+    description = 'Compare the throughput and the size on disk of the HDF5 ' \
+                  'storage policies\non the frames of the xrm files of a ' \
+                  'folder'
+    parser = argparse.ArgumentParser(description=description,
+                                     formatter_class=RawTextHelpFormatter)
+    parser.add_argument('root_dir', metavar='root_dir', type=str,
+                        help='Folder containing the xrm files')
+    parser.add_argument('-p', '--pattern', type=str, default='*.xrm',
+                        help='Pattern of the files to be read\n'
+                             '(default: *.xrm)')
+    parser.add_argument('-n', '--number', type=int, default=100,
+                        help='Maximum number of frames\n(default: 100)')
+    parser.add_argument('-d', '--directory', type=str, default=None,
+                        help='Folder where the HDF5 files are written; use '
+                             'one on the\ndisk to be measured '
+                             '(default: a temporary folder)')
+    args = parser.parse_args()
+
+    file_names = find_xrm_files(args.root_dir, pattern=args.pattern)
+    if not file_names:
+        parser.error("no file matching %s in %s" % (args.pattern,
+                                                    args.root_dir))
+    frames = read_frames(file_names[:args.number])
+    raw_size = frames.nbytes
+    megabytes = raw_size / float(1 << 20)
+
+    print("%d frames of %dx%d %s (%.1f MiB)\n" % (
+        (len(frames),) + frames.shape[1:] + (frames.dtype, megabytes)))
+    print("%-14s %12s %12s %12s %8s" % ("policy", "write MiB/s",
+                                        "read MiB/s", "size MiB", "ratio"))
+    work_dir = tempfile.mkdtemp(dir=args.directory)
+    try:
+        for name, policy in POLICIES:
+            h5_filename = os.path.join(work_dir, name + ".hdf5")
+            write_time, read_time, size = write_and_read(frames, policy,
+                                                         h5_filename)
+            os.remove(h5_filename)
+            print("%-14s %12.1f %12.1f %12.1f %8.2f" % (
+                name, megabytes / write_time, megabytes / read_time,
+                size / float(1 << 20), raw_size / float(size)))
+    finally:
+        shutil.rmtree(work_dir)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+#!/usr/bin/python
+
+"""
+Stand-in of the microscope for testing xrmwatch: copy the xrm files of a
+folder (and its TXM script, if any) into an acquisition folder, one after
+the other, writing each file in blocks as done during an acquisition.
+
+    python feed_folder.py /beamlines/bl09/data/20160626 /tmp/acquisition \
+        -s /beamlines/bl09/data/20160626/tomo.txt -i 0.5
+    xrmwatch /tmp/acquisition -s /tmp/acquisition/tomo.txt -n True
+"""
+
+import os
+import time
+import shutil
+import argparse
+from argparse import RawTextHelpFormatter
+
+from txm2nexuslib.images.xrmindex import find_xrm_files
+
+
+def feed_file(source, target, block_size, block_interval):
+    """Copy a file in blocks, waiting block_interval seconds between two
+    blocks"""
+    with open(source, "rb") as f_in:
+        with open(target, "wb") as f_out:
+            while True:
+                block = f_in.read(block_size)
+                if not block:
+                    break
+                f_out.write(block)
+                f_out.flush()
+                time.sleep(block_interval)
+
+
+def main():
+
+    description = 'Copy the xrm files of a folder into an acquisition ' \
+                  'folder, one by one,\nsimulating an acquisition'
+    parser = argparse.ArgumentParser(description=description,
+                                     formatter_class=RawTextHelpFormatter)
+    parser.add_argument('source_dir', metavar='source_dir', type=str,
+                        help='Folder containing the xrm files')
+    parser.add_argument('target_dir', metavar='target_dir', type=str,
+                        help='Acquisition folder')
+    parser.add_argument('-s', '--txm_txt_script', type=str, default=None,
+                        help='TXM script copied first into the acquisition '
+                             'folder\n(default: None)')
+    parser.add_argument('-p', '--pattern', type=str, default='*.xrm',
+                        help='Pattern of the files to be copied\n'
+                             '(default: *.xrm)')
+    parser.add_argument('-i', '--interval', type=float, default=1.0,
+                        help='Seconds between two files\n(default: 1)')
+    parser.add_argument('-b', '--block_size', type=int, default=1 << 16,
+                        help='Size of the blocks written\n(default: 65536)')
+    parser.add_argument('--block_interval', type=float, default=0.01,
+                        help='Seconds between two blocks\n(default: 0.01)')
+    args = parser.parse_args()
+
+    if not os.path.isdir(args.target_dir):
+        os.makedirs(args.target_dir)
+    if args.txm_txt_script is not None:
+        shutil.copy(args.txm_txt_script, args.target_dir)
+
+    source_dir = os.path.abspath(args.source_dir)
+    file_names = find_xrm_files(source_dir, pattern=args.pattern)
+    file_names.sort(key=os.path.getmtime)
+    for file_name in file_names:
+        target = os.path.join(args.target_dir,
+                              os.path.relpath(file_name, source_dir))
+        if not os.path.isdir(os.path.dirname(target)):
+            os.makedirs(os.path.dirname(target))
+        feed_file(file_name, target, args.block_size, args.block_interval)
+        print("%s written" % target)
+        time.sleep(args.interval)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,272 @@
+"""
+Minimal writer of OLE2 files, to create small xrm and txrm files for the
+tests: write_ole writes streams into an OLE2 container (optionally with
+fragmented streams), and make_xrm writes random images with the metadata
+streams read by txm2nexuslib.
+"""
+
+import struct
+import random
+
+import numpy as np
+
+SECT = 512
+MINI = 64
+CUTOFF = 4096
+ENDOFCHAIN = 0xFFFFFFFE
+FREESECT = 0xFFFFFFFF
+FATSECT = 0xFFFFFFFD
+DIFSECT = 0xFFFFFFFC
+NOSTREAM = 0xFFFFFFFF
+
+
+class Node(object):
+    def __init__(self, name, data=None):
+        self.name = name
+        self.data = data
+        self.kids = {}
+        self.sid = None
+
+
+def build_tree(streams):
+    root = Node('Root Entry')
+    for path, data in streams.items():
+        parts = path.split('/')
+        node = root
+        for p in parts[:-1]:
+            node = node.kids.setdefault(p, Node(p))
+        node.kids[parts[-1]] = Node(parts[-1], data)
+    return root
+
+
+def write_ole(filename, streams, shuffle=False, seed=0):
+    """
+    Write an OLE2 file (version 3, sectors of 512 bytes).
+
+    streams: dictionary {stream path: data}, paths separated by '/'
+    shuffle: if True, the sectors are shuffled by groups of three, so that
+             the streams are fragmented all over the file
+    """
+    root = build_tree(streams)
+    nodes = []
+
+    def assign(node):
+        node.sid = len(nodes)
+        nodes.append(node)
+        for k in sorted(node.kids):
+            assign(node.kids[k])
+    assign(root)
+
+    # ministream
+    ministream = []
+    minifat = []
+    big = []
+    for n in nodes:
+        if n.data is None:
+            continue
+        if len(n.data) < CUTOFF:
+            start = len(minifat)
+            nsec = (len(n.data) + MINI - 1) // MINI
+            if nsec == 0:
+                n.start = ENDOFCHAIN
+                continue
+            for i in range(nsec):
+                minifat.append(start + i + 1 if i < nsec - 1 else ENDOFCHAIN)
+            ministream.append(n.data.ljust(nsec * MINI, '\0'))
+            n.start = start
+        else:
+            big.append(n)
+    ministream = ''.join(ministream)
+    # streams stored in sectors: (owner, data)
+    blobs = [(n, n.data) for n in big]
+    if ministream:
+        blobs.append((root, ministream))
+    else:
+        root.start = ENDOFCHAIN
+    mf_data = ''.join(struct.pack('<I', x) for x in minifat)
+    # directory, written once the sectors are allocated
+    ndir = len(nodes)
+    dir_size = ((ndir * 128 + SECT - 1) // SECT) * SECT
+    # sectors of the data
+    tagged = []
+    for owner, data in blobs:
+        ns = (len(data) + SECT - 1) // SECT
+        tagged.append((owner, data, ns))
+    mf_ns = (len(mf_data) + SECT - 1) // SECT if mf_data else 0
+    dir_ns = dir_size // SECT
+    data_ns = sum(t[2] for t in tagged) + mf_ns + dir_ns
+    # fat sectors needed
+    nfat = 1
+    ndif = 0
+    while True:
+        total = data_ns + nfat + ndif
+        need = (total + 127) // 128
+        nd = 0 if need <= 109 else (need - 109 + 126) // 127
+        if need == nfat and nd == ndif:
+            break
+        nfat, ndif = need, nd
+    # ordering of data sectors
+    seq = []
+    for owner, data, ns in tagged:
+        for i in range(ns):
+            seq.append(('blob', owner, i))
+    for i in range(mf_ns):
+        seq.append(('mf', None, i))
+    for i in range(dir_ns):
+        seq.append(('dir', None, i))
+    if shuffle:
+        rnd = random.Random(seed)
+        # shuffle in blocks to make fragmented but partially contiguous
+        blocks = [seq[i:i + 3] for i in range(0, len(seq), 3)]
+        rnd.shuffle(blocks)
+        seq = [x for b in blocks for x in b]
+    # place fat/difat sectors at beginning
+    pos = {}
+    fat = []
+    for i in range(nfat):
+        fat.append(FATSECT)
+    for i in range(ndif):
+        fat.append(DIFSECT)
+    base = nfat + ndif
+    for k, item in enumerate(seq):
+        pos[(item[0], id(item[1]) if item[1] is not None else None, item[2])] = base + k
+    total = base + len(seq)
+    fat.extend([FREESECT] * (total - len(fat)))
+
+    def chain(tag, owner, ns):
+        sects = [pos[(tag, id(owner) if owner is not None else None, i)] for i in range(ns)]
+        for a, b in zip(sects, sects[1:]):
+            fat[a] = b
+        if sects:
+            fat[sects[-1]] = ENDOFCHAIN
+        return sects
+    sectdata = {}
+    for owner, data, ns in tagged:
+        s = chain('blob', owner, ns)
+        owner.start = s[0]
+        padded = data.ljust(ns * SECT, '\0')
+        for i, sn in enumerate(s):
+            sectdata[sn] = padded[i * SECT:(i + 1) * SECT]
+    mf_sects = chain('mf', None, mf_ns)
+    padded = mf_data.ljust(mf_ns * SECT, '\xff')
+    for i, sn in enumerate(mf_sects):
+        sectdata[sn] = padded[i * SECT:(i + 1) * SECT]
+    dir_sects = chain('dir', None, dir_ns)
+
+    # directory entries with balanced trees
+    def set_tree(node):
+        kids = [node.kids[k] for k in sorted(node.kids, key=lambda s: (len(s), s.upper()))]
+        for kid in kids:
+            kid.left = kid.right = NOSTREAM
+            kid.child = NOSTREAM
+
+        def bal(lst):
+            if not lst:
+                return NOSTREAM
+            m = len(lst) // 2
+            lst[m].left = bal(lst[:m])
+            lst[m].right = bal(lst[m + 1:])
+            return lst[m].sid
+        node.child = bal(kids)
+        for kid in kids:
+            if kid.data is None:
+                set_tree(kid)
+    root.left = root.right = NOSTREAM
+    set_tree(root)
+    entries = []
+    for n in nodes:
+        name = n.name.encode('utf-16-le') + '\0\0'
+        if n is root:
+            typ = 5
+            size = len(ministream)
+        elif n.data is None:
+            typ = 1
+            size = 0
+            n.start = 0
+        else:
+            typ = 2
+            size = len(n.data)
+        entries.append(struct.pack('<64sHBBIII16sI8s8sIII', name, len(name), typ, 1,
+                                   n.left, n.right, n.child, '\0' * 16, 0,
+                                   '\0' * 8, '\0' * 8, n.start, size, 0))
+    dirdata = ''.join(entries).ljust(dir_size, '\0')
+    for i, sn in enumerate(dir_sects):
+        sectdata[sn] = dirdata[i * SECT:(i + 1) * SECT]
+    # FAT sectors
+    fat.extend([FREESECT] * (nfat * 128 - len(fat)))
+    fatbytes = ''.join(struct.pack('<I', x) for x in fat)
+    for i in range(nfat):
+        sectdata[i] = fatbytes[i * SECT:(i + 1) * SECT]
+    fat_sect_ids = list(range(nfat))
+    difat_head = fat_sect_ids[:109] + [FREESECT] * (109 - min(109, nfat))
+    rest = fat_sect_ids[109:]
+    for d in range(ndif):
+        part = rest[d * 127:(d + 1) * 127]
+        part = part + [FREESECT] * (127 - len(part))
+        nxt = nfat + d + 1 if d < ndif - 1 else ENDOFCHAIN
+        sectdata[nfat + d] = ''.join(struct.pack('<I', x) for x in part + [nxt])
+    header = struct.pack('<8s16sHHHHHHIIIIIIIIII', '\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1',
+                         '\0' * 16, 0x3E, 3, 0xFFFE, 9, 6, 0, 0, 0, nfat,
+                         dir_sects[0], 0, CUTOFF,
+                         mf_sects[0] if mf_sects else ENDOFCHAIN, mf_ns,
+                         nfat if ndif else ENDOFCHAIN, ndif)
+    header += ''.join(struct.pack('<I', x) for x in difat_head)
+    assert len(header) == 512
+    with open(filename, 'wb') as f:
+        f.write(header)
+        for i in range(total):
+            f.write(sectdata.get(i, '\0' * SECT))
+
+
+AXES = ['ax%d' % i for i in range(32)]
+AXES[2] = 'Sample Z'
+AXES[23] = 'Detector Z'
+AXES[24] = 'ZPz'
+AXES[27] = 'Energy'
+AXES[28] = 'machine_current'
+AXES[30] = 'Energyenc'
+
+
+def make_xrm(filename, rows=64, cols=48, nimages=1, dtype='uint16', seed=0,
+             shuffle=False, energyenc=True):
+    """
+    Write an xrm (nimages == 1) or txrm file of random images.
+
+    return: images, motor positions and streams written
+    """
+    rnd = np.random.RandomState(seed)
+    axes = list(AXES)
+    if not energyenc:
+        axes[30] = 'other'
+    s = {}
+    s['ImageInfo/NoOfImages'] = struct.pack('<I', nimages)
+    s['ImageInfo/ImageWidth'] = struct.pack('<I', cols)
+    s['ImageInfo/ImageHeight'] = struct.pack('<I', rows)
+    s['ImageInfo/DataType'] = struct.pack('<I', 5 if dtype == 'uint16' else 10)
+    s['ImageInfo/PixelSize'] = struct.pack('<f', 0.01)
+    s['ImageInfo/XrayMagnification'] = struct.pack('<f', 1300.0)
+    s['ImageInfo/ExpTimes'] = np.arange(1, nimages + 1, dtype='<f4').tostring()
+    s['ImageInfo/Angles'] = np.linspace(-70, 70, nimages).astype('<f4').tostring()
+    s['ImageInfo/Energy'] = np.full(nimages, 520.0, '<f4').tostring()
+    s['ImageInfo/XPosition'] = np.arange(nimages, dtype='<f4').tostring()
+    s['ImageInfo/YPosition'] = (np.arange(nimages, dtype='<f4') * 2).tostring()
+    s['ImageInfo/ZPosition'] = (np.arange(nimages, dtype='<f4') * 3).tostring()
+    s['ImageInfo/Date'] = ''.join(struct.pack('17s23x', '06/26/16 12:00:%02d' % (i % 60)) for i in range(nimages))
+    s['SampleInfo/SampleID'] = struct.pack('50s', 'mysample')
+    s['ConfigureBackup/ConfigCamera/Camera 1/ConfigZonePlates/DetZero'] = struct.pack('<f', 5.0)
+    s['PositionInfo/AxisNames'] = ''.join(a + '\0\0' for a in axes)
+    mp = rnd.rand(nimages, len(axes)).astype('<f4')
+    mp[:, 28] = 250 + np.arange(nimages)
+    mp[:, 30] = 700 + np.arange(nimages)
+    mp[:, 27] = 600 + np.arange(nimages)
+    s['PositionInfo/MotorPositions'] = mp.tostring()
+    imgs = []
+    for i in range(1, nimages + 1):
+        if dtype == 'uint16':
+            img = rnd.randint(0, 65535, (rows, cols)).astype('<u2')
+        else:
+            img = rnd.rand(rows, cols).astype('<f4')
+        imgs.append(img)
+        s['ImageData%d/Image%d' % ((i + 99) // 100, i)] = img.tostring()
+    write_ole(filename, s, shuffle=shuffle, seed=seed)
+    return imgs, mp, s
@@ -0,0 +1,59 @@
+import os
+import sys
+import shutil
+import tempfile
+from unittest import TestCase
+
+import h5py
+import numpy as np
+
+from txm2nexuslib.scripts.autotxrm2nexus import convert_tomo_folder, main
+from olewriter import make_xrm
+
+
+class TestAutoTxrm2Nexus(TestCase):
+    """Conversion of the tomo folders, some of which can not be converted"""
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.cwd = os.getcwd()
+        for folder in ("tomo1", "tomo2", "tomo3"):
+            os.mkdir(os.path.join(self.dir, folder))
+        self.images = make_xrm(os.path.join(self.dir, "tomo1", "s1.txrm"),
+                               16, 8, nimages=3)[0]
+        make_xrm(os.path.join(self.dir, "tomo1", "s1_FF.txrm"), 16, 8,
+                 nimages=2, seed=1)
+        # a tomography file which can not be read
+        with open(os.path.join(self.dir, "tomo2", "s2.txrm"), "wb") as f:
+            f.write("not a txrm file")
+        # tomo3 has no tomography file
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        shutil.rmtree(self.dir)
+
+    def test_convert_tomo_folder(self):
+        folder = os.path.join(self.dir, "tomo2")
+        result_folder, seconds, error = convert_tomo_folder(folder)
+        self.assertEqual(result_folder, folder)
+        self.assertIsNotNone(error)
+        self.assertEqual(os.getcwd(), self.cwd)
+        folder = os.path.join(self.dir, "tomo1")
+        self.assertIsNone(convert_tomo_folder(folder)[2])
+        self.assertEqual(os.getcwd(), self.cwd)
+
+    def test_main(self):
+        argv = sys.argv
+        sys.argv = ["autotxrm2nexus", "-f", self.dir, "-c", "1"]
+        try:
+            with self.assertRaises(SystemExit) as context:
+                main()
+        finally:
+            sys.argv = argv
+        self.assertEqual(context.exception.code, 1)
+        self.assertEqual(os.getcwd(), self.cwd)
+        # the other folders are still converted
+        with h5py.File(os.path.join(self.dir, "tomo1", "s1.hdf5"), "r") as f:
+            np.testing.assert_array_equal(
+                f["NXtomo/instrument/sample/data"][...],
+                np.array(self.images)[:, ::-1])
@@ -0,0 +1,73 @@
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+
+import h5py
+import numpy as np
+from tinydb import TinyDB
+
+from txm2nexuslib.images.xrmindex import index_xrm_files
+from txm2nexuslib.images.multiplexrm2h5 import multiple_xrm_2_hdf5
+from txm2nexuslib.images.util import copy2proc_multiple
+from txm2nexuslib.images.multiplenormalization import (normalize_images,
+                                                       average_ff)
+from txm2nexuslib.images.multiplealign import align_images
+from txm2nexuslib.images.multipleaverage import average_image_groups
+from txm2nexuslib.images.imagestostack import many_images_to_h5_stack
+from olewriter import make_xrm
+
+IMAGES = ["20161203_s1_520.0_%d.xrm" % i for i in range(5)]
+FF_IMAGES = ["20161203_s1_520.0_FF_%d.xrm" % i for i in range(2)]
+
+
+class TestContainer(TestCase):
+    """Images of an acquisition converted into a single hdf5 file"""
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.db_filename = os.path.join(self.dir, "index.json")
+        self.images = {}
+        for seed, name in enumerate(IMAGES + FF_IMAGES):
+            filename = os.path.join(self.dir, name)
+            self.images[name] = make_xrm(filename, seed=seed)[0][0]
+        index_xrm_files(self.dir, cores=1)
+        # the random motor positions of the files give them different
+        # zpz: they are taken as a single acquisition
+        db = TinyDB(self.db_filename)
+        db.update({"zpz": 0.0})
+        db.close()
+        # a file which can not be read any more once indexed
+        with open(os.path.join(self.dir, IMAGES[2]), "wb") as f:
+            f.write("not an xrm file")
+        multiple_xrm_2_hdf5(self.db_filename, cores=1, container=True)
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_unreadable_file(self):
+        names = IMAGES[:2] + IMAGES[3:]
+        db = TinyDB(self.db_filename)
+        records = [record for record in db.table("hdf5_raw").all()
+                   if not record["FF"]]
+        db.close()
+        container = records[0]["filename"]
+        self.assertEqual(sorted((record["frame"], record["xrm_filename"])
+                                for record in records),
+                         list(enumerate(names)))
+        for record in records:
+            self.assertEqual(record["filename"], container)
+        with h5py.File(os.path.join(self.dir, container), "r") as f:
+            self.assertEqual(f["data"].shape[0], len(names))
+            self.assertEqual(f["data"].attrs["Number of Frames"], len(names))
+            for frame, name in enumerate(names):
+                np.testing.assert_array_equal(
+                    f["data"][frame], np.flipud(self.images[name]))
+            self.assertEqual(list(f["metadata/input_file"]), names)
+
+    def test_single_image_stages(self):
+        copy2proc_multiple(self.db_filename, cores=1)
+        for stage in (average_ff, normalize_images, align_images,
+                      average_image_groups, many_images_to_h5_stack):
+            with self.assertRaisesRegexp(ValueError, "container"):
+                stage(self.db_filename, cores=1)
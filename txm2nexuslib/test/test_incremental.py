@@ -0,0 +1,190 @@
+import os
+import time
+import shutil
+import tempfile
+from unittest import TestCase
+
+import h5py
+import numpy as np
+from tinydb import TinyDB, Query
+
+from txm2nexuslib.images.xrmindex import index_xrm_files
+from txm2nexuslib.images.multiplexrm2h5 import multiple_xrm_2_hdf5
+from txm2nexuslib.images.util import copy2proc_multiple
+from txm2nexuslib.images.multiplecrop import crop_images
+from txm2nexuslib.images.multiplenormalization import (normalize_images,
+                                                       NORMALIZE_STAGE)
+from txm2nexuslib.images.multiplealign import align_images
+from txm2nexuslib.images.multipleaverage import average_image_groups
+from txm2nexuslib.images.manifest import Manifest
+from txm2nexuslib.images.xrmwatch import XrmWatcher
+from olewriter import make_xrm
+
+ROI = {"top": 26, "bottom": 24, "left": 21, "right": 19}
+IMAGES = ["20161203_s1_520.0_%d.xrm" % i for i in range(4)]
+FF_IMAGES = ["20161203_s1_520.0_FF_%d.xrm" % i for i in range(2)]
+
+
+def crop(image):
+    rows, columns = image.shape
+    return image[ROI["top"]:rows - ROI["bottom"],
+                 ROI["left"]:columns - ROI["right"]]
+
+
+def proc_file(xrm_file):
+    return os.path.splitext(xrm_file)[0] + "_proc.hdf5"
+
+
+class IncrementalTestCase(TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.images = {}
+        self.db_filename = os.path.join(self.dir, "index.json")
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def write(self, names):
+        for name in names:
+            seed = (IMAGES + FF_IMAGES).index(name)
+            filename = os.path.join(self.dir, name)
+            image = make_xrm(filename, seed=seed)[0][0]
+            # the images are flipped by the conversion to hdf5
+            self.images[name] = np.flipud(image)
+
+    def prepare(self):
+        multiple_xrm_2_hdf5(self.db_filename, cores=1)
+        copy2proc_multiple(self.db_filename, cores=1)
+        crop_images(self.db_filename, cores=1)
+
+    def snapshot(self):
+        """Modification time and datasets of each hdf5 file"""
+        files = {}
+        for name in sorted(os.listdir(self.dir)):
+            filename = os.path.join(self.dir, name)
+            if name.endswith(".hdf5"):
+                with h5py.File(filename, "r") as f:
+                    files[name] = (os.path.getmtime(filename),
+                                   sorted(f.keys()))
+        return files
+
+    def expected_image(self, name, ff_names=FF_IMAGES):
+        """Image normalized once by the average of the FF images"""
+        ff_average = np.mean([crop(self.images[ff_name]).astype(np.float64)
+                              for ff_name in ff_names], axis=0)
+        return crop(self.images[name]) / ff_average
+
+    def assert_normalized_once(self, names=IMAGES, ff_names=FF_IMAGES):
+        for name in names:
+            with h5py.File(os.path.join(self.dir, proc_file(name)),
+                           "r") as f:
+                self.assertTrue(np.allclose(
+                    f["data"].value, self.expected_image(name, ff_names)),
+                    "%s not normalized once" % name)
+
+
+class TestIncrementalWorkflow(IncrementalTestCase):
+    """Workflow run again on the same files, as done by ctbio"""
+
+    def setUp(self):
+        IncrementalTestCase.setUp(self)
+        self.write(IMAGES + FF_IMAGES)
+        index_xrm_files(self.dir, cores=1)
+
+    def run_workflow(self):
+        self.prepare()
+        normalize_images(self.db_filename, cores=1)
+        align_images(self.db_filename, align_method='cv2.TM_SQDIFF_NORMED',
+                     cores=1)
+        average_image_groups(self.db_filename, cores=1)
+
+    def test_rerun(self):
+        self.run_workflow()
+        files = self.snapshot()
+        self.assertIn(proc_file(IMAGES[1]), files)
+        self.run_workflow()
+        self.assertEqual(self.snapshot(), files)
+
+    def test_rerun_after_normalization(self):
+        self.prepare()
+        normalize_images(self.db_filename, cores=1)
+        self.prepare()
+        normalize_images(self.db_filename, cores=1)
+        self.assert_normalized_once()
+
+    def test_resume(self):
+        # normalization interrupted after the first two images
+        self.prepare()
+        done = [proc_file(name) for name in IMAGES[:2]]
+        normalize_images(self.db_filename, cores=1,
+                         query=Query().filename.one_of(done))
+        db = TinyDB(self.db_filename)
+        normalized = [entry["output"] for entry in db.table("manifest").all()
+                      if NORMALIZE_STAGE in entry["stages"]]
+        db.close()
+        self.assertEqual(sorted(normalized),
+                         sorted(done + [proc_file(name)
+                                        for name in FF_IMAGES]))
+        self.prepare()
+        normalize_images(self.db_filename, cores=1)
+        self.assert_normalized_once()
+
+
+class TestWatcher(IncrementalTestCase):
+    """Files processed by XrmWatcher, and by the workflow afterwards"""
+
+    def watch(self, watcher, timeout=30):
+        """Poll the watcher until it has nothing more to do"""
+        idle = 0
+        end = time.time() + timeout
+        while idle < 5 and time.time() < end:
+            if watcher.poll() or watcher.pending:
+                idle = 0
+            else:
+                idle += 1
+
+    def assert_ff_unmodified(self, ff_names=FF_IMAGES):
+        db = TinyDB(self.db_filename)
+        manifest = Manifest(db, self.dir)
+        for name in ff_names:
+            self.assertTrue(manifest.is_consistent(
+                os.path.join(self.dir, proc_file(name))),
+                "%s modified" % proc_file(name))
+        db.close()
+
+    def test_watcher_then_batch(self):
+        self.write(IMAGES + FF_IMAGES)
+        watcher = XrmWatcher(self.dir, normalize=True, workers=1,
+                             poll_interval=0.05, use_inotify=False)
+        try:
+            self.watch(watcher)
+        finally:
+            watcher.close()
+        self.assert_normalized_once()
+        self.assert_ff_unmodified()
+        files = self.snapshot()
+        self.prepare()
+        normalize_images(self.db_filename, cores=1)
+        self.assert_normalized_once()
+        for name in IMAGES:
+            self.assertEqual(self.snapshot()[proc_file(name)],
+                             files[proc_file(name)])
+
+    def test_new_ff_images(self):
+        self.write(IMAGES[:2] + FF_IMAGES[:1])
+        watcher = XrmWatcher(self.dir, normalize=True, workers=1,
+                             poll_interval=0.05, use_inotify=False)
+        try:
+            self.watch(watcher)
+            self.assert_normalized_once(IMAGES[:2], FF_IMAGES[:1])
+            self.write(FF_IMAGES[1:])
+            self.watch(watcher)
+            self.write(IMAGES[2:])
+            self.watch(watcher)
+        finally:
+            watcher.close()
+        # the average FF image is computed again with the new FF image
+        self.assert_normalized_once(IMAGES[:2], FF_IMAGES[:1])
+        self.assert_normalized_once(IMAGES[2:], FF_IMAGES)
+        self.assert_ff_unmodified()
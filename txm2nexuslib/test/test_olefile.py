@@ -0,0 +1,216 @@
+import os
+import json
+import argparse
+import shutil
+import tempfile
+from unittest import TestCase
+
+import numpy as np
+
+from txm2nexuslib import reading
+from txm2nexuslib.OleFileIO_PL import OleFileIO, layout_cache_path
+from txm2nexuslib.xrmnex import XradiaFile
+from olewriter import make_xrm
+
+NIMAGES = 20
+
+
+class TestReadStrategy(TestCase):
+    """Bytes read by OleFileIO from a file with fragmented streams"""
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.filename = os.path.join(self.dir, "fragmented.txrm")
+        self.images = make_xrm(self.filename, 100, 200, NIMAGES,
+                               shuffle=True, seed=1)[0]
+        self.size = os.path.getsize(self.filename)
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def read_images(self, **kwargs):
+        ole = OleFileIO(self.filename, **kwargs)
+        try:
+            for i, image in enumerate(self.images):
+                data = ole.read_stream("ImageData1/Image%d" % (i + 1))
+                self.assertEqual(data, image.tostring())
+            return ole.get_io_stats()
+        finally:
+            ole.close()
+
+    def test_no_strategy(self):
+        stats = self.read_images()
+        self.assertLessEqual(stats['bytes'], 1.1 * self.size)
+
+    def test_min_read_size(self):
+        for min_read_size in (4096, 1 << 16, 1 << 20):
+            stats = self.read_images(min_read_size=min_read_size)
+            # the header, FAT and directory are read by blocks, then the
+            # images are read at most twice:
+            self.assertLessEqual(stats['bytes'],
+                                 2 * self.size + min_read_size,
+                                 "min_read_size %d: %d bytes read for a "
+                                 "file of %d bytes" % (
+                                     min_read_size, stats['bytes'],
+                                     self.size))
+
+    def test_merge_gap(self):
+        stats = self.read_images(min_read_size=1 << 16, merge_gap=1024)
+        self.assertLessEqual(stats['bytes'], 2 * self.size + (1 << 16))
+        self.assertLess(stats['reads'], self.read_images()['reads'])
+
+    def test_read_policy(self):
+        parser = argparse.ArgumentParser()
+        reading.add_read_arguments(parser)
+        args = parser.parse_args(["--min_read_size", "65536",
+                                  "--merge_gap", "1024"])
+        reading.set_read_policy_from_args(args)
+        try:
+            with XradiaFile(self.filename) as xrm:
+                frames = xrm.frames[:]
+                stats = xrm.file.get_io_stats()
+        finally:
+            reading.set_read_policy(reading.ReadPolicy())
+        np.testing.assert_array_equal(frames,
+                                      np.array(self.images)[:, ::-1])
+        self.assertEqual(xrm.ole_options['min_read_size'], 65536)
+        self.assertEqual(xrm.ole_options['merge_gap'], 1024)
+        self.assertLess(stats['reads'], self.read_images()['reads'])
+
+
+class TestMemoryMap(TestCase):
+    """Streams read from the memory mapped file (use_mmap)"""
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.filename = os.path.join(self.dir, "fragmented.txrm")
+        self.images = make_xrm(self.filename, 100, 200, NIMAGES,
+                               shuffle=True, seed=1)[0]
+        self.xrm_filename = os.path.join(self.dir, "image.xrm")
+        self.image = make_xrm(self.xrm_filename, 100, 200)[0][0]
+
+    def tearDown(self):
+        reading.set_read_policy(reading.ReadPolicy())
+        shutil.rmtree(self.dir)
+
+    def test_buffers(self):
+        ole = OleFileIO(self.filename, use_mmap=True)
+        try:
+            for i, image in enumerate(self.images):
+                name = "ImageData1/Image%d" % (i + 1)
+                data = image.tostring()
+                self.assertEqual(str(ole.openstream_buffer(name)), data)
+                self.assertEqual(
+                    str(ole.openstream_buffer(name, offset=1000, size=600)),
+                    data[1000:1600])
+                self.assertEqual(ole.read_stream(name), data)
+        finally:
+            ole.close()
+
+    def test_close(self):
+        ole = OleFileIO(self.filename, use_mmap=True)
+        mapped_file = ole._mmap
+        ole.close()
+        self.assertRaises(ValueError, mapped_file.size)
+
+    def test_images(self):
+        for use_mmap in (False, True):
+            with XradiaFile(self.filename, use_mmap=use_mmap) as xrm:
+                frames = xrm.frames[::-1]
+            np.testing.assert_array_equal(frames,
+                                          np.array(self.images)[::-1, ::-1])
+            with XradiaFile(self.xrm_filename, use_mmap=use_mmap) as xrm:
+                image = xrm.get_raw_image_2D()
+                out = np.zeros((100, 200), np.uint16)
+                xrm.get_raw_image_2D(out=out)
+            # the images remain valid once the file is closed
+            np.testing.assert_array_equal(image, self.image[::-1])
+            np.testing.assert_array_equal(out, self.image[::-1])
+
+    def test_read_policy(self):
+        self.assertEqual(XradiaFile(self.xrm_filename).ole_options,
+                         {'use_mmap': False, 'layout_cache': False,
+                          'min_read_size': 0, 'merge_gap': 0})
+        reading.set_read_policy(reading.ReadPolicy(use_mmap=True))
+        self.assertEqual(json.loads(os.environ[reading.READ_POLICY_ENV]),
+                         {'use_mmap': True, 'layout_cache': False,
+                          'min_read_size': 0, 'merge_gap': 0})
+        # the policy is given to the processes started from this one
+        reading._read_policy = None
+        with XradiaFile(self.xrm_filename) as xrm:
+            self.assertTrue(xrm.file.use_mmap)
+            np.testing.assert_array_equal(xrm.get_raw_image_2D(),
+                                          self.image[::-1])
+
+
+class TestLayoutCache(TestCase):
+    """Files opened from the layout kept in their sidecar (layout_cache)"""
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.filename = os.path.join(self.dir, "fragmented.txrm")
+        self.sidecar = layout_cache_path(self.filename)
+        self.images = make_xrm(self.filename, 100, 200, NIMAGES,
+                               shuffle=True, seed=1)[0]
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def open(self):
+        """Open the file with the layout cache, and check that its images
+        and its metadata are read as without it"""
+        ole = OleFileIO(self.filename, layout_cache=True)
+        reference = OleFileIO(self.filename)
+        try:
+            self.assertEqual(ole.listdir(), reference.listdir())
+            for name in ("ImageInfo/NoOfImages", "PositionInfo/AxisNames",
+                         "PositionInfo/MotorPositions"):
+                self.assertEqual(ole.openstream(name).read(),
+                                 reference.openstream(name).read())
+            for i, image in enumerate(self.images):
+                data = ole.read_stream("ImageData1/Image%d" % (i + 1))
+                self.assertEqual(data, image.tostring())
+            # the FAT is only loaded when the file is parsed
+            return len(ole.fat) > 0
+        finally:
+            ole.close()
+            reference.close()
+
+    def test_cold_cache(self):
+        self.assertFalse(os.path.exists(self.sidecar))
+        self.assertTrue(self.open())
+        self.assertTrue(os.path.exists(self.sidecar))
+
+    def test_warm_cache(self):
+        self.open()
+        self.assertFalse(self.open())
+
+    def test_stale_cache(self):
+        self.open()
+        mtime = os.path.getmtime(self.filename)
+        self.images = make_xrm(self.filename, 100, 200, NIMAGES,
+                               shuffle=True, seed=2)[0]
+        os.utime(self.filename, (mtime + 10, mtime + 10))
+        self.assertTrue(self.open())
+        # the sidecar is written again for the new file
+        self.assertFalse(self.open())
+
+    def test_corrupt_cache(self):
+        self.open()
+        with open(self.sidecar, "r+b") as f:
+            f.seek(100)
+            f.write("corrupt")
+        self.assertTrue(self.open())
+        self.assertFalse(self.open())
+        with open(self.sidecar, "wb") as f:
+            f.write("corrupt")
+        self.assertTrue(self.open())
+
+    def test_read_policy(self):
+        reading.set_read_policy(reading.ReadPolicy(layout_cache=True))
+        try:
+            with XradiaFile(self.filename) as xrm:
+                self.assertEqual(xrm.get_no_of_images(), NIMAGES)
+        finally:
+            reading.set_read_policy(reading.ReadPolicy())
+        self.assertTrue(os.path.exists(self.sidecar))
@@ -0,0 +1,161 @@
+import os
+import sys
+import json
+import shutil
+import argparse
+import tempfile
+import subprocess
+from unittest import TestCase
+
+import h5py
+import numpy as np
+
+from txm2nexuslib import storage
+from txm2nexuslib.storage import StoragePolicy, FrameWriter
+from txm2nexuslib.txrmnex import txrmNXtomo
+from olewriter import make_xrm
+
+
+class TestStoragePolicy(TestCase):
+    """Options of the image datasets given by the storage policy"""
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        os.environ.pop(storage.STORAGE_POLICY_ENV, None)
+        storage._storage_policy = None
+        shutil.rmtree(self.dir)
+
+    def test_default(self):
+        policy = StoragePolicy()
+        self.assertEqual(policy.dataset_options((5, 64, 48), np.uint16,
+                                                chunks=(1, 64, 48)),
+                         {'dtype': np.uint16, 'chunks': (1, 64, 48)})
+        self.assertEqual(policy.dataset_options((64, 48), np.float32),
+                         {'dtype': np.float32, 'chunks': None})
+        self.assertEqual(storage.get_storage_policy().to_dict(),
+                         policy.to_dict())
+
+    def test_dataset_options(self):
+        policy = StoragePolicy(compression="gzip", shuffle=True,
+                               frames_per_chunk=4, float_dtype="float32")
+        self.assertEqual(
+            policy.dataset_options((10, 64, 48), np.float64,
+                                   chunks=(1, 64, 48)),
+            {'dtype': "float32", 'chunks': (4, 64, 48),
+             'compression': "gzip",
+             'compression_opts': storage.DEFAULT_GZIP_LEVEL,
+             'shuffle': True})
+        # the raw data and the integer images keep their dtype; the
+        # images are chunked whole
+        self.assertEqual(
+            policy.dataset_options((64, 48), np.float64, raw=True),
+            {'dtype': np.float64, 'chunks': (64, 48),
+             'compression': "gzip",
+             'compression_opts': storage.DEFAULT_GZIP_LEVEL,
+             'shuffle': True})
+        self.assertEqual(policy.get_dtype(np.uint16), np.uint16)
+        options = policy.dataset_options((10, 64, 48), np.float64)
+        with h5py.File(os.path.join(self.dir, "images.hdf5"), "w") as f:
+            data = np.random.rand(10, 64, 48)
+            dataset = f.create_dataset("data", data=data, **options)
+            self.assertEqual(dataset.compression, "gzip")
+            self.assertEqual(dataset.chunks, (4, 64, 48))
+            np.testing.assert_allclose(dataset[...], data, rtol=1e-6)
+
+    def test_invalid(self):
+        for kwargs in ({'compression': "bzip2"},
+                       {'float_dtype': "int8"},
+                       {'frames_per_chunk': 0},
+                       {'frames_per_write': 0}):
+            with self.assertRaises(ValueError):
+                StoragePolicy(**kwargs)
+
+    def test_environment(self):
+        parser = argparse.ArgumentParser()
+        storage.add_storage_arguments(parser)
+        # without options, the policy of the calling program is kept
+        storage.set_storage_policy_from_args(parser.parse_args([]))
+        self.assertNotIn(storage.STORAGE_POLICY_ENV, os.environ)
+        storage.set_storage_policy_from_args(parser.parse_args(
+            ["--compression", "lzf", "--frames_per_chunk", "8",
+             "--float_dtype", "float16"]))
+        policy = storage.get_storage_policy()
+        self.assertEqual(policy.compression, "lzf")
+        self.assertEqual(json.loads(os.environ[storage.STORAGE_POLICY_ENV]),
+                         policy.to_dict())
+        # the policy is given to the programs started from this one
+        output = subprocess.check_output([
+            sys.executable, "-c",
+            "import json; from txm2nexuslib import storage; "
+            "print(json.dumps(storage.get_storage_policy().to_dict()))"])
+        self.assertEqual(json.loads(output), policy.to_dict())
+
+
+class TestFrameWriter(TestCase):
+    """Frames written in batches, compared with the frames written one by
+    one"""
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.frames = np.random.RandomState(0).rand(7, 16, 8)
+
+    def tearDown(self):
+        os.environ.pop(storage.STORAGE_POLICY_ENV, None)
+        storage._storage_policy = None
+        shutil.rmtree(self.dir)
+
+    def write(self, name, dtype, chunks, frames_per_write=None, offset=0):
+        shape = (offset + len(self.frames),) + self.frames.shape[1:]
+        with h5py.File(os.path.join(self.dir, name), "w") as f:
+            for dataset_name in ("frames", "batches"):
+                f.create_dataset(dataset_name, shape=shape, dtype=dtype,
+                                 chunks=chunks)
+            for i, frame in enumerate(self.frames):
+                f["frames"][offset + i] = frame
+            with FrameWriter(f["batches"], offset=offset,
+                             frames_per_write=frames_per_write) as writer:
+                for frame in self.frames:
+                    writer.write(frame)
+            np.testing.assert_array_equal(f["batches"][...],
+                                          f["frames"][...])
+
+    def test_write(self):
+        for dtype in (np.uint16, np.float32):
+            self.write("default.hdf5", dtype, (1, 16, 8))
+            self.write("batches.hdf5", dtype, (1, 16, 8), frames_per_write=3)
+            self.write("offset.hdf5", dtype, (2, 16, 8), frames_per_write=1,
+                       offset=2)
+
+    def test_frames_per_write(self):
+        with h5py.File(os.path.join(self.dir, "frames.hdf5"), "w") as f:
+            dataset = f.create_dataset("data", shape=(100, 16, 8),
+                                       dtype=np.float32, chunks=(4, 16, 8))
+            # whole chunks, and at most the frames of the dataset
+            for frames_per_write, frames in ((None, 100), (1, 4), (9, 8),
+                                             (1000, 100)):
+                policy = StoragePolicy(frames_per_write=frames_per_write)
+                self.assertEqual(policy.get_frames_per_write(dataset),
+                                 frames)
+
+    def test_txrm(self):
+        storage.set_storage_policy(StoragePolicy(frames_per_write=2))
+        for dtype in ('uint16', 'float'):
+            sample = os.path.join(self.dir, dtype + ".txrm")
+            bright = os.path.join(self.dir, dtype + "_FF.txrm")
+            images = make_xrm(sample, 16, 8, nimages=5, dtype=dtype,
+                              shuffle=True)[0]
+            bright_images = make_xrm(bright, 16, 8, nimages=3, seed=1)[0]
+            nexus = txrmNXtomo([sample, bright], 'sb')
+            nexus.NXtomo_structure()
+            nexus.convert_metadata()
+            nexus.convert_image_stack()
+            with h5py.File(nexus.filename_hdf5, "r") as f:
+                data = f["NXtomo/instrument/sample/data"]
+                self.assertEqual(data.dtype, np.array(images).dtype)
+                np.testing.assert_array_equal(data[...],
+                                              np.array(images)[:, ::-1])
+                np.testing.assert_array_equal(
+                    f["NXtomo/instrument/bright_field/data"][...],
+                    np.array(bright_images)[:, ::-1])
@@ -0,0 +1,78 @@
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+
+import h5py
+import numpy as np
+from tinydb import TinyDB
+
+from txm2nexuslib.images.xrmindex import index_xrm_files
+from txm2nexuslib.images.multiplexrm2h5 import multiple_xrm_2_hdf5
+from txm2nexuslib.images.util import copy2proc_multiple
+from txm2nexuslib.images.multiplecrop import crop_images
+from txm2nexuslib.images.multiplenormalization import normalize_images
+from txm2nexuslib.images.multiplexrm2norm import multiple_xrm_2_normalized
+from olewriter import make_xrm
+
+IMAGES = (["20161203_s1_520.0_%d.xrm" % i for i in range(3)] +
+          ["20161203_s1_520.0_FF_%d.xrm" % i for i in range(2)] +
+          ["20161203_s2_520.0_0.xrm", "20161203_s2_520.0_FF_0.xrm"])
+
+
+class TestXrm2Normalized(TestCase):
+    """Fused xrm -> cropped -> normalized stage, compared with the
+    separate stages"""
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.stages_dir = os.path.join(self.dir, "stages")
+        self.fused_dir = os.path.join(self.dir, "fused")
+        for folder in (self.stages_dir, self.fused_dir):
+            os.mkdir(folder)
+            for seed, name in enumerate(IMAGES):
+                make_xrm(os.path.join(folder, name), seed=seed)
+            index_xrm_files(folder, cores=1)
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def tables(self, folder):
+        db = TinyDB(os.path.join(folder, "index.json"))
+        tables = dict((table, sorted(db.table(table).all()))
+                      for table in ("hdf5_raw", "hdf5_proc"))
+        db.close()
+        return tables
+
+    def assert_same_files(self):
+        for name in sorted(os.listdir(self.stages_dir)):
+            if not name.endswith(".hdf5"):
+                continue
+            with h5py.File(os.path.join(self.stages_dir, name), "r") as f, \
+                    h5py.File(os.path.join(self.fused_dir, name), "r") as g:
+                self.assertEqual(g["data"].dtype, f["data"].dtype)
+                np.testing.assert_allclose(g["data"][...], f["data"][...],
+                                           rtol=1e-12)
+                for field in ("energy", "angle", "exposure_time",
+                              "machine_current", "pixel_size"):
+                    self.assertEqual(g["metadata"][field].value,
+                                     f["metadata"][field].value)
+
+    def test_stages(self):
+        db_filename = os.path.join(self.stages_dir, "index.json")
+        multiple_xrm_2_hdf5(db_filename, cores=1)
+        copy2proc_multiple(db_filename, cores=1)
+        crop_images(db_filename, cores=1)
+        normalize_images(db_filename, cores=1)
+        fused_db_filename = os.path.join(self.fused_dir, "index.json")
+        multiple_xrm_2_normalized(fused_db_filename, keep_raw=True, cores=1)
+        self.assertEqual(self.tables(self.fused_dir),
+                         self.tables(self.stages_dir))
+        self.assert_same_files()
+        # an image normalized again with the FF images already processed
+        # (sample s2 has a single FF image)
+        for name in ("20161203_s1_520.0_0_proc.hdf5",
+                     "20161203_s2_520.0_0_proc.hdf5"):
+            os.remove(os.path.join(self.fused_dir, name))
+        multiple_xrm_2_normalized(fused_db_filename, keep_raw=True, cores=1)
+        self.assert_same_files()
@@ -0,0 +1,77 @@
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+
+from tinydb import TinyDB
+
+from txm2nexuslib.images.xrmindex import index_xrm_files
+from olewriter import make_xrm, write_ole
+
+
+class TestXrmIndex(TestCase):
+    """File index DB built from the metadata of the xrm files"""
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        os.mkdir(os.path.join(self.dir, "FF"))
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def records(self):
+        index_xrm_files(self.dir, cores=1)
+        db = TinyDB(os.path.join(self.dir, "index.json"))
+        records = dict((record["filename"], record) for record in db.all())
+        db.close()
+        return records
+
+    def test_records(self):
+        motor_positions = {}
+        for seed, name in enumerate(["20161203_s1_520.0_0.xrm",
+                                     "20161203_s1_520.0_1.xrm",
+                                     "FF/20161203_s1_520.0_FF_0.xrm"]):
+            filename = os.path.join(self.dir, name)
+            motor_positions[name] = make_xrm(filename, seed=seed)[1]
+        records = self.records()
+        self.assertEqual(records["20161203_s1_520.0_0.xrm"], {
+            "filename": "20161203_s1_520.0_0.xrm", "extension": ".xrm",
+            "date": 20161203, "sample": "s1", "FF": False,
+            "energy": 700.0, "angle": -70.0, "exposure_time": 1.0,
+            "machine_current": 250.0, "x_position": 0.0,
+            "y_position": 0.0, "z_position": 0.0,
+            "date_time": "2016-06-26T12:00:00",
+            "zpz": round(float(
+                motor_positions["20161203_s1_520.0_0.xrm"][0, 24]), 1),
+            "processed": False, "repetition": 0})
+        # same parameters than the previous file, except for zpz
+        record = records["20161203_s1_520.0_1.xrm"]
+        zpz = round(float(motor_positions["20161203_s1_520.0_1.xrm"][0, 24]),
+                    1)
+        self.assertEqual(record["zpz"], zpz)
+        self.assertEqual(record["repetition"], int(
+            zpz == records["20161203_s1_520.0_0.xrm"]["zpz"]))
+        record = records["20161203_s1_520.0_FF_0.xrm"]
+        self.assertTrue(record["FF"])
+        self.assertEqual(record["subfolder"], "FF")
+
+    def test_repetitions(self):
+        for i in range(3):
+            filename = os.path.join(self.dir, "20161203_s1_520.0_%d.xrm" % i)
+            make_xrm(filename)
+        records = self.records()
+        self.assertEqual(
+            [records["20161203_s1_520.0_%d.xrm" % i]["repetition"]
+             for i in range(3)], [0, 1, 2])
+
+    def test_missing_streams(self):
+        filename = os.path.join(self.dir, "20161203_s1_520.0_0.xrm")
+        streams = make_xrm(filename)[2]
+        del streams["ImageInfo/Angles"]
+        del streams["PositionInfo/AxisNames"]
+        streams["ImageInfo/Date"] = "no date".ljust(40, "\0")
+        write_ole(filename, streams)
+        record = self.records()["20161203_s1_520.0_0.xrm"]
+        for field in ("angle", "energy", "zpz", "date_time"):
+            self.assertNotIn(field, record)
+        self.assertEqual(record["exposure_time"], 1.0)
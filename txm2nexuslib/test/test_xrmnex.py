@@ -0,0 +1,143 @@
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+
+import numpy as np
+from joblib import Parallel, delayed
+
+from txm2nexuslib.xrmnex import XradiaFile, xrmReader, xrmCachedReader
+from olewriter import make_xrm, write_ole
+
+
+class TestXradiaFile(TestCase):
+    """Images of synthetic xrm and txrm files"""
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def write(self, name, **kwargs):
+        filename = os.path.join(self.dir, name)
+        images = make_xrm(filename, **kwargs)[0]
+        return filename, np.array(images)
+
+    def test_image_types(self):
+        for dtype, raw_dtype, image_dtype in (
+                ('uint16', np.uint16, np.int_),
+                ('float', np.float32, np.float64)):
+            filename, images = self.write(dtype + ".xrm", dtype=dtype)
+            with XradiaFile(filename) as xrm:
+                raw_image = xrm.get_raw_image_2D()
+                image = xrm.get_image_2D()
+            self.assertEqual(raw_image.dtype, raw_dtype)
+            self.assertEqual(image.dtype, image_dtype)
+            np.testing.assert_array_equal(raw_image, images[0][::-1])
+            np.testing.assert_array_equal(image, images[0][::-1])
+            # the image is a copy, which can be modified
+            image += 1
+
+    def test_read_all_metadata(self):
+        filename = os.path.join(self.dir, "image.xrm")
+        streams = make_xrm(filename)[2]
+        with XradiaFile(filename) as xrm:
+            metadata = xrm.read_all_metadata()
+        self.assertEqual(metadata['image_height'], 64)
+        self.assertEqual(metadata['machine_currents'], [250.0])
+        # missing and truncated streams
+        del streams['ImageInfo/Angles']
+        streams['ImageInfo/ExpTimes'] = streams['ImageInfo/ExpTimes'][:2]
+        write_ole(filename, streams)
+        with XradiaFile(filename) as xrm:
+            self.assertEqual(xrm.read_all_metadata(),
+                             dict(metadata, angles=None, exp_times=None))
+
+    def test_frames(self):
+        filename, images = self.write("images.txrm", nimages=5,
+                                      shuffle=True)
+        images = images[:, ::-1]
+        with XradiaFile(filename) as txrm:
+            frames = txrm.frames
+            self.assertEqual(len(frames), 5)
+            np.testing.assert_array_equal(frames[1], images[1])
+            np.testing.assert_array_equal(frames[-1], images[4])
+            np.testing.assert_array_equal(frames[1:4], images[1:4])
+            np.testing.assert_array_equal(frames[::2], images[::2])
+            np.testing.assert_array_equal(frames[::-1], images[::-1])
+            np.testing.assert_array_equal(frames[[3, -5]], images[[3, 0]])
+            self.assertEqual(frames[2:2].shape, (0, 64, 48))
+            out = np.zeros((2, 64, 48), dtype=np.uint16)
+            self.assertIs(frames.read([0, 2], out=out), out)
+            np.testing.assert_array_equal(out, images[[0, 2]])
+            for index in (5, -6):
+                with self.assertRaises(IndexError):
+                    frames[index]
+
+    def test_roi(self):
+        # the ROI crop done by crop_images, on the full image
+        rois = ({"top": 0, "bottom": 0, "left": 0, "right": 0},
+                {"top": 6, "bottom": 4, "left": 1, "right": 3},
+                {"top": 3, "bottom": 0, "left": 0, "right": 5},
+                {"top": 0, "bottom": 15, "left": 7, "right": 0})
+        # images in fragmented sectors (uint16 64x48) and in the
+        # MiniStream (float32 16x8)
+        for dtype, rows, cols in (('uint16', 64, 48), ('float', 16, 8)):
+            filename = self.write(dtype + ".xrm", rows=rows, cols=cols,
+                                  dtype=dtype, shuffle=True)[0]
+            with XradiaFile(filename) as xrm:
+                image = xrm.get_raw_image_2D()
+                for roi in rois:
+                    expected = image[roi["top"]:rows - roi["bottom"],
+                                     roi["left"]:cols - roi["right"]]
+                    np.testing.assert_array_equal(
+                        xrm.get_raw_image_2D(roi=roi), expected)
+                    np.testing.assert_array_equal(
+                        xrm.get_image_2D(roi=roi), expected)
+                    out = np.empty_like(expected)
+                    xrm.get_raw_image_2D(roi=roi, out=out)
+                    np.testing.assert_array_equal(out, expected)
+
+
+def read_cached_images(reader):
+    return [reader.get_raw_image_2D(i)
+            for i in range(reader.get_images_number())]
+
+
+class TestXrmCachedReader(TestCase):
+    """FF images given from memory, compared with the ones read from the
+    xrm files"""
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_reader(self):
+        for dtype in ('uint16', 'float'):
+            file_names = []
+            for seed in range(3):
+                file_names.append(os.path.join(
+                    self.dir, "%s_FF_%d.xrm" % (dtype, seed)))
+                make_xrm(file_names[-1], 16, 8, dtype=dtype, seed=seed)
+            reader = xrmReader(file_names, cores=1)
+            cached_reader = xrmCachedReader(reader)
+            for getter in ("get_images_number", "get_data_type",
+                           "get_image_size", "get_machine_currents",
+                           "get_exp_times"):
+                self.assertEqual(getattr(cached_reader, getter)(),
+                                 getattr(reader, getter)())
+            for i in range(len(file_names)):
+                for getter in ("get_raw_image_2D", "get_image_2D"):
+                    expected = getattr(reader, getter)(i)
+                    image = getattr(cached_reader, getter)(i)
+                    self.assertEqual(image.dtype, expected.dtype)
+                    np.testing.assert_array_equal(image, expected)
+            # the reader given to the worker processes
+            images = Parallel(n_jobs=2, backend="multiprocessing")(
+                delayed(read_cached_images)(cached_reader) for _ in range(2))
+            for worker_images in images:
+                np.testing.assert_array_equal(
+                    worker_images, read_cached_images(reader))
@@ -22,6 +22,8 @@ along with this program.  If not, see <http://www.gnu.org/licenses/>.
 import numpy as np
 import h5py
 
+from txm2nexuslib.storage import dataset_options
+
 
 class TomoNormalize:
 
@@ -161,15 +163,12 @@ class TomoNormalize:
         if dimensions_singleimage_tomo == \
                 dimensions_singleimage_flatfield:
 
+            shape = (self.nFramesSample, self.numrows, self.numcols)
             self.norm_grp.create_dataset(
                 "TomoNormalized",
-                shape=(self.nFramesSample,
-                       self.numrows,
-                       self.numcols),
-                chunks=(1,
-                        self.numrows,
-                        self.numcols),
-                dtype='float32')
+                shape=shape,
+                **dataset_options(shape, 'float32',
+                                  chunks=(1, self.numrows, self.numcols)))
 
             self.norm_grp['TomoNormalized'].attrs['Number of Frames'] = \
                 self.nFramesSample
@@ -215,15 +214,13 @@ class TomoNormalize:
 
                 # FlatField (FF) images normalized with current,
                 # and Average of FlatField Normalized with current
+                shape = (self.nFramesFF, self.numrowsFF, self.numcolsFF)
                 self.norm_grp.create_dataset(
                     "FFNormalizedWithCurrent",
-                    shape=(self.nFramesFF,
-                           self.numrowsFF,
-                           self.numcolsFF),
-                    chunks=(1,
-                            self.numrowsFF,
-                            self.numcolsFF),
-                    dtype='float32')
+                    shape=shape,
+                    **dataset_options(shape, 'float32',
+                                      chunks=(1, self.numrowsFF,
+                                              self.numcolsFF)))
 
                 dset_FF_norm_current = self.norm_grp["FFNormalizedWithCurrent"]
                 dset_FF_norm_current.attrs['Number of Frames'] = self.nFramesFF
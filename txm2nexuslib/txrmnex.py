@@ -29,9 +29,19 @@ import numpy as np
 import argparse
 import h5py
 
+from txm2nexuslib import reading
+from txm2nexuslib.storage import dataset_options, FrameWriter
+
 
 class txrmNXtomo:
 
+    # Pixel formats of the frames, by data type
+    frame_dtypes = {
+        'uint16': np.dtype('<u2'),
+        'float': np.dtype('<f4'),
+        'float32': np.dtype('<f4'),
+    }
+
     def __init__(self, files, files_order='sb', zero_deg_in=None,
                  zero_deg_final=None, title='X-ray imaging',
                  sourcename='ALBA', sourcetype='Synchrotron X-ray Source', 
@@ -190,7 +200,7 @@ class txrmNXtomo:
         print("Trying to convert txrm metadata to NeXus HDF5.")
         
         # Opening the .txrm files as Ole structures
-        ole = OleFileIO(self.filename_txrm)
+        ole = OleFileIO(self.filename_txrm, **reading.ole_options())
 
         # Sample-ID
         if ole.exists('SampleInfo/SampleID'):   
@@ -620,122 +630,74 @@ class txrmNXtomo:
             print('There is no information about the 0 degrees image size '
                   '(ImageHeight, or about ImageWidth)')
 
-        if ole_zerodeg.exists('ImageData1/Image1'):        
-            img_string = "ImageData1/Image1"
-            stream = ole_zerodeg.openstream(img_string) 
-            data = stream.read()
-            if self.datatype == 'uint16':
-                struct_fmt = "<{0:10}H".format(self.numrows_zerodeg *
-                                               self.numcols_zerodeg)
-                imgdata = struct.unpack(struct_fmt, data)
-            elif self.datatype == 'float':                   
-                struct_fmt = "<{0:10}f".format(self.numrows_zerodeg *
-                                               self.numcols_zerodeg)
-                imgdata = struct.unpack(struct_fmt, data)
-            else:                            
-                print "Wrong data type"
-
-            imgdata_zerodeg = np.flipud(np.reshape(imgdata,
-                                                   (self.numrows,
-                                                    self.numcols),
-                                                   order='A'))
+        if ole_zerodeg.exists('ImageData1/Image1'):
+            imgdata_zerodeg = self.extract_frame(
+                ole_zerodeg, 1,
+                self.new_frame_buffer(self.datatype_zerodeg,
+                                      self.numrows_zerodeg,
+                                      self.numcols_zerodeg))
         else:
             imgdata_zerodeg = 0
         return imgdata_zerodeg
 
-    # Read single image. Function that will be used inside
-    # convert_image_stack() for converting the full image stack
-    # thanks to multiple chunks.
-    def extract_single_image(self, ole, numimage): 
-
-        # Read the images - They are stored in the txrm as ImageData1,
-        # ImageData2...
-        # Each folder contains 100 images 1-100, 101-200...
-        img_string = "ImageData%i/Image%i" % (np.ceil(numimage/100.0),
-                                              numimage)
-        stream = ole.openstream(img_string)
-        data = stream.read()
-    
-        if self.datatype == 'uint16':
-            struct_fmt = "<{0:10}H".format(self.numrows*self.numcols)
-            imgdata = struct.unpack(struct_fmt, data)
-        elif self.datatype == 'float':                   
-            struct_fmt = "<{0:10}f".format(self.numrows*self.numcols)
-            imgdata = struct.unpack(struct_fmt, data)
-        else:                            
+    # Allocate the buffer in which a single frame is decoded by
+    # extract_frame.
+    def new_frame_buffer(self, datatype, numrows, numcols):
+        if datatype not in self.frame_dtypes:
             print "Wrong data type"
             return
-            
-        singleimage = np.flipud(np.reshape(imgdata,
-                                           (self.numrows, self.numcols),
-                                           order='A'))
-        singleimage = np.reshape(singleimage,
-                                 (1, self.numrows, self.numcols),
-                                 order='A')
-        return singleimage
-
-    # Read single image. Function that will be used inside
-    # convert_image_stack()
-    def extract_single_image_bright(self, ole, numimage): 
-
-        # Read the images - They are stored in the txrm as ImageData1,
-        # ImageData2...
-        # Each folder contains 100 images 1-100, 101-200...
-        img_string = "ImageData%i/Image%i" % (np.ceil(numimage/100.0),
-                                              numimage)
-        stream = ole.openstream(img_string)
-        data = stream.read()
-    
-        if self.datatype_bright == 'uint16':
-            struct_fmt = "<{0:10}H".format(self.numrows_bright *
-                                           self.numcols_bright)
-            imgdata = struct.unpack(struct_fmt, data)
-        elif self.datatype_bright == 'float':                   
-            struct_fmt = "<{0:10}f".format(self.numrows_bright *
-                                           self.numcols_bright)
-            imgdata = struct.unpack(struct_fmt, data)
-        else:                            
-            print "Wrong data type"
+        return np.empty((numrows, numcols),
+                        dtype=self.frame_dtypes[datatype].newbyteorder('='))
+
+    # Decode a single frame (sample, bright-field, dark-field or zero
+    # degrees image) into a buffer allocated with new_frame_buffer, or into
+    # the next frame of a FrameWriter, flipped vertically. Function used
+    # inside convert_image_stack() for converting the full image stacks
+    # frame by frame.
+    def extract_frame(self, ole, numimage, out):
+        if out is None:
             return
-            
-        singleimage = np.flipud(np.reshape(imgdata,
-                                           (self.numrows_bright,
-                                            self.numcols_bright),
-                                           order='A'))
-        singleimage = np.reshape(singleimage,
-                                 (1, self.numrows_bright, self.numcols_bright),
-                                 order='A')
-        return singleimage
-
-    # Read single image. Function that will only be used inside
-    # convert_image_stack().
-    def extract_single_image_dark(self, ole, numimage): 
 
         # Read the images - They are stored in the txrm as ImageData1,
         # ImageData2...
         # Each folder contains 100 images 1-100, 101-200...
         img_string = "ImageData%i/Image%i" % (np.ceil(numimage/100.0),
                                               numimage)
-        stream = ole.openstream(img_string)
-        data = stream.read()
-    
-        if self.datatype_dark == 'uint16':
-            struct_fmt = "<{0:10}H".format(self.numrows_dark*self.numcols_dark)
-            imgdata = struct.unpack(struct_fmt, data)
-        elif self.datatype_dark == 'float':                   
-            struct_fmt = "<{0:10}f".format(self.numrows_dark*self.numcols_dark)
-            imgdata = struct.unpack(struct_fmt, data)
-        else:                            
-            print "Wrong data type"
+        data = ole.openstream_buffer(img_string)
+        numrows, numcols = out.shape
+        imgdata = np.frombuffer(data, dtype=out.dtype.newbyteorder('<'),
+                                count=numrows*numcols)
+        out[...] = imgdata.reshape(numrows, numcols)[::-1]
+        return out
+
+    # Read single image.
+    def extract_single_image(self, ole, numimage):
+        singleimage = self.extract_frame(
+            ole, numimage,
+            self.new_frame_buffer(self.datatype, self.numrows, self.numcols))
+        if singleimage is None:
+            return
+        return singleimage[np.newaxis]
+
+    # Read single image.
+    def extract_single_image_bright(self, ole, numimage):
+        singleimage = self.extract_frame(
+            ole, numimage,
+            self.new_frame_buffer(self.datatype_bright, self.numrows_bright,
+                                  self.numcols_bright))
+        if singleimage is None:
+            return
+        return singleimage[np.newaxis]
+
+    # Read single image.
+    def extract_single_image_dark(self, ole, numimage):
+        singleimage = self.extract_frame(
+            ole, numimage,
+            self.new_frame_buffer(self.datatype_dark, self.numrows_dark,
+                                  self.numcols_dark))
+        if singleimage is None:
             return
-             
-        singleimage = np.flipud(np.reshape(imgdata, (self.numrows_dark,
-                                                     self.numcols_dark),
-                                           order='A'))
-        singleimage = np.reshape(singleimage,
-                                 (1, self.numrows_dark, self.numcols_dark),
-                                 order='A')
-        return singleimage
+        return singleimage[np.newaxis]
 
     # Function used to convert all the images (main data),
     # from .txrm to NeXus .hdf5.
@@ -745,7 +707,8 @@ class txrmNXtomo:
         if self.metadata == 1:
                 
             if self.filename_zerodeg_in is not None:
-                ole_zerodeg_in = OleFileIO(self.filename_zerodeg_in)        
+                ole_zerodeg_in = OleFileIO(self.filename_zerodeg_in,
+                                           **reading.ole_options())
                 image_zerodeg_in = self.convert_zero_deg_images(ole_zerodeg_in)
                 self.nxdetectorsample.create_dataset(
                     '0_degrees_initial_image',
@@ -760,7 +723,8 @@ class txrmNXtomo:
                 print('Zero degrees initial image converted')
 
             if self.filename_zerodeg_final is not None:
-                ole_zerodeg_final = OleFileIO(self.filename_zerodeg_final)
+                ole_zerodeg_final = OleFileIO(self.filename_zerodeg_final,
+                                              **reading.ole_options())
                 image_zerodeg_final = self.convert_zero_deg_images(
                     ole_zerodeg_final)
                 self.nxdetectorsample.create_dataset(
@@ -788,22 +752,22 @@ class txrmNXtomo:
             print(self.orderlist)
             for i in range(len(self.orderlist)):
 
-                ole = OleFileIO(self.files[i])
+                ole = OleFileIO(self.files[i], **reading.ole_options())
 
                 # Data Images
                 if self.orderlist[i] == 's':
                     if self.datatype == 'float':
                         self.datatype = 'float32'
 
+                    shape = (self.nSampleFrames, self.numrows,
+                             self.numcols)
                     self.nxdetectorsample.create_dataset(
                         "data",
-                        shape=(self.nSampleFrames,
-                               self.numrows,
-                               self.numcols),
-                        chunks=(1,
-                                self.numrows,
-                                self.numcols),
-                        dtype=self.datatype)
+                        shape=shape,
+                        **dataset_options(shape, self.datatype,
+                                          chunks=(1, self.numrows,
+                                                  self.numcols),
+                                          raw=True))
 
                     self.nxdetectorsample['data'].attrs[
                         'Data Type'] = self.datatype
@@ -816,16 +780,18 @@ class txrmNXtomo:
 
                     print('Image pixels are {0}rows * {1}columns \n'.format(
                         self.numrows, self.numcols))
-                    for numimage in range(self.nSampleFrames):
-                        self.count_num_sequence = self.count_num_sequence+1
-                        tomoimagesingle = self.extract_single_image(ole,
-                                                                    numimage+1)
-                        self.num_sample_sequence.append(
-                            self.count_num_sequence)
-                        self.nxdetectorsample['data'][numimage] = \
-                            tomoimagesingle
-                        if numimage % 10 == 0:
-                            print('Image %i converted' % numimage)
+                    # The frames are decoded in the buffer of the
+                    # writer, and written in batches
+                    with FrameWriter(self.nxdetectorsample['data']) as writer:
+                        for numimage in range(self.nSampleFrames):
+                            self.count_num_sequence = \
+                                self.count_num_sequence + 1
+                            self.extract_frame(ole, numimage+1,
+                                               writer.next_frame())
+                            self.num_sample_sequence.append(
+                                self.count_num_sequence)
+                            if numimage % 10 == 0:
+                                print('Image %i converted' % numimage)
 
                     # h5py NeXus link
                     source_addr = '/NXtomo/instrument/sample/data'
@@ -897,15 +863,15 @@ class txrmNXtomo:
                         self.nxbright = self.nxinstrument.create_group(
                             "bright_field")
                         self.nxbright.attrs['NX_class'] = "Unknown"
+                        shape = (nBrightFrames, self.numrows_bright,
+                                 self.numcols_bright)
                         self.nxbright.create_dataset(
                             "data",
-                            shape=(nBrightFrames,
-                                   self.numrows_bright,
-                                   self.numcols_bright),
-                            chunks=(1,
-                                    self.numrows_bright,
-                                    self.numcols_bright),
-                            dtype=self.datatype_bright)
+                            shape=shape,
+                            **dataset_options(shape, self.datatype_bright,
+                                              chunks=(1, self.numrows_bright,
+                                                      self.numcols_bright),
+                                              raw=True))
                         self.nxbright['data'].attrs['Data Type'] = \
                             self.datatype_bright
                         self.nxbright['data'].attrs['Image Height'] = \
@@ -916,18 +882,19 @@ class txrmNXtomo:
                     print('BrightField pixels are {0}rows * '
                           '{1}columns'.format(self.numrows_bright,
                                               self.numcols_bright))
-                    for numimage in range(nBrightFrames):
-                        if numimage + 1 == nBrightFrames:
-                            print ('%i Bright-Field images '
-                                   'converted\n' % nBrightFrames)
-                        self.count_num_sequence = self.count_num_sequence + 1
-                        tomoimagebright = self.extract_single_image_bright(
-                            ole, numimage+1)
-                        self.num_bright_sequence.append(
-                            self.count_num_sequence)
-                        self.nxbright['data'][counter_bright_frames] = \
-                            tomoimagebright
-                        counter_bright_frames = counter_bright_frames+1
+                    with FrameWriter(self.nxbright['data'],
+                                     offset=counter_bright_frames) as writer:
+                        for numimage in range(nBrightFrames):
+                            if numimage + 1 == nBrightFrames:
+                                print ('%i Bright-Field images '
+                                       'converted\n' % nBrightFrames)
+                            self.count_num_sequence = \
+                                self.count_num_sequence + 1
+                            self.extract_frame(ole, numimage+1,
+                                               writer.next_frame())
+                            self.num_bright_sequence.append(
+                                self.count_num_sequence)
+                            counter_bright_frames = counter_bright_frames+1
 
                     # machine_current name of FF images #
                     if ole.exists('PositionInfo/AxisNames'):   
@@ -1058,15 +1025,15 @@ class txrmNXtomo:
                         self.nxdark = self.nxinstrument.create_group(
                             "dark_field")
                         self.nxdark.attrs['NX_class'] = "Unknown"
+                        shape = (nDarkFrames, self.numrows_dark,
+                                 self.numcols_dark)
                         self.nxdark.create_dataset(
                             "data",
-                            shape=(nDarkFrames,
-                                   self.numrows_dark,
-                                   self.numcols_dark),
-                            chunks=(1,
-                                    self.numrows_dark,
-                                    self.numcols_dark),
-                            dtype=self.datatype_dark)
+                            shape=shape,
+                            **dataset_options(shape, self.datatype_dark,
+                                              chunks=(1, self.numrows_dark,
+                                                      self.numcols_dark),
+                                              raw=True))
 
                         self.nxdark['data'].attrs['Data Type'] = \
                             self.datatype_dark
@@ -1078,17 +1045,19 @@ class txrmNXtomo:
                     print('DarkField pixels are {0}rows * '
                           '{1}columns'.format(self.numrows_dark,
                                               self.numcols_dark))
-                    for numimage in range(nDarkFrames):
-                        if numimage + 1 == nDarkFrames:
-                            print ('%i Dark-Field images '
-                                   'converted\n' % nDarkFrames)
-                        self.count_num_sequence = self.count_num_sequence+1
-                        tomoimagedark = self.extract_single_image_dark(
-                            ole, numimage+1)
-                        self.num_dark_sequence.append(self.count_num_sequence)
-                        self.nxdark['data'][counter_dark_frames] = \
-                            tomoimagedark
-                        counter_dark_frames = counter_dark_frames + 1
+                    with FrameWriter(self.nxdark['data'],
+                                     offset=counter_dark_frames) as writer:
+                        for numimage in range(nDarkFrames):
+                            if numimage + 1 == nDarkFrames:
+                                print ('%i Dark-Field images '
+                                       'converted\n' % nDarkFrames)
+                            self.count_num_sequence = \
+                                self.count_num_sequence + 1
+                            self.extract_frame(ole, numimage+1,
+                                               writer.next_frame())
+                            self.num_dark_sequence.append(
+                                self.count_num_sequence)
+                            counter_dark_frames = counter_dark_frames + 1
 
                     # machine_current name of DF images #
                     if ole.exists('PositionInfo/AxisNames'):   
@@ -30,6 +30,7 @@ from tinydb import TinyDB, Query
 from tinydb.middlewares import CachingMiddleware
 
 from txm2nexuslib.images.multiplexrm2h5 import multiple_xrm_2_hdf5
+from txm2nexuslib.images.multiplexrm2norm import multiple_xrm_2_normalized
 from txm2nexuslib.images.util import copy2proc_multiple
 from txm2nexuslib.images.multiplecrop import crop_images
 from txm2nexuslib.images.multiplenormalization import normalize_images
@@ -37,6 +38,10 @@ from txm2nexuslib.images.multiplealign import align_images
 from txm2nexuslib.images.multipleaverage import average_image_groups
 from txm2nexuslib.images.imagestostack import many_images_to_h5_stack
 from txm2nexuslib.parser import create_db, get_db_path
+from txm2nexuslib.storage import (add_storage_arguments,
+                                   set_storage_policy_from_args)
+from txm2nexuslib.reading import (add_read_arguments,
+                                  set_read_policy_from_args)
 
 def main():
     """
@@ -66,6 +71,21 @@ def main():
                              '- If False: Do not crop images\n'
                              '(default: True)')
 
+    parser.add_argument('-f', '--fused', type='bool',
+                        default='False',
+                        help='- If True: Convert, crop and normalize each '
+                             'xrm image in\n  a single step, writing only '
+                             'the normalized image\n'
+                             '- If False: Write the raw, copied, cropped '
+                             'and\n  normalized images in separated steps\n'
+                             '(default: False)')
+
+    parser.add_argument('--keep_raw', type='bool',
+                        default='False',
+                        help='Also write the raw hdf5 files when the '
+                             'images are\nnormalized in a single step '
+                             '(--fused True)\n(default: False)')
+
     parser.add_argument('--table_for_stack', type=str,
                         default='hdf5_averages',
                         help=("DB table of image files to create the stacks" +
@@ -80,7 +100,11 @@ def main():
                         default='True',
                         help="Convert FS hdf5 to mrc")
 
+    add_storage_arguments(parser)
+    add_read_arguments(parser)
     args = parser.parse_args()
+    set_storage_policy_from_args(args)
+    set_read_policy_from_args(args)
 
     print("\nWorkflow with Extended Depth of Field:\n" +
           "xrm -> hdf5 -> crop -> normalize -> align for same angle and" +
@@ -90,18 +114,28 @@ def main():
 
     db_filename = get_db_path(args.txm_txt_script)
     create_db(args.txm_txt_script)
-    # Multiple xrm 2 hdf5 files: working with many single images files
-    multiple_xrm_2_hdf5(db_filename)
-
-    # Copy of multiple hdf5 raw data files to files for processing
-    copy2proc_multiple(db_filename)
-
-    # Multiple files hdf5 images crop: working with single images files
-    if args.crop:
-        crop_images(db_filename)
-
-    # Normalize multiple hdf5 files: working with many single images files
-    normalize_images(db_filename)
+    if args.fused:
+        # xrm -> crop -> normalize in memory, writing only the normalized
+        # hdf5 files (and the raw ones if keep_raw)
+        roi = None
+        if args.crop:
+            roi = {"top": 26, "bottom": 24, "left": 21, "right": 19}
+        multiple_xrm_2_normalized(db_filename, roi=roi,
+                                  keep_raw=args.keep_raw)
+    else:
+        # Multiple xrm 2 hdf5 files: working with many single images files
+        multiple_xrm_2_hdf5(db_filename)
+
+        # Copy of multiple hdf5 raw data files to files for processing
+        copy2proc_multiple(db_filename)
+
+        # Multiple files hdf5 images crop: working with single images files
+        if args.crop:
+            crop_images(db_filename)
+
+        # Normalize multiple hdf5 files: working with many single images
+        # files
+        normalize_images(db_filename)
 
     if args.stacks_zp:
         many_images_to_h5_stack(db_filename, table_name="hdf5_proc",
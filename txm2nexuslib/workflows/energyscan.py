@@ -37,6 +37,10 @@ from txm2nexuslib.images.multipleaverage import (average_image_group_by_energy,
                                                  average_image_groups)
 from txm2nexuslib.images.imagestostack import many_images_to_h5_stack
 from txm2nexuslib.parser import create_db, get_db_path
+from txm2nexuslib.storage import (add_storage_arguments,
+                                   set_storage_policy_from_args)
+from txm2nexuslib.reading import (add_read_arguments,
+                                  set_read_policy_from_args)
 
 
 def partial_preprocesing_escan(db_filename, variable, crop=False, query=None):
@@ -111,7 +115,11 @@ def main():
                              '- If False: Do not calculate stack\n'
                              '(default: True)')
 
+    add_storage_arguments(parser)
+    add_read_arguments(parser)
     args = parser.parse_args()
+    set_storage_policy_from_args(args)
+    set_read_policy_from_args(args)
 
     print("\nWorkflow for energyscan experiments:\n" +
           "xrm -> hdf5 -> crop -> normalize -> align for same energy, "
@@ -38,6 +38,10 @@ from txm2nexuslib.images.multipleaverage import (average_image_group_by_angle,
                                                  average_image_groups)
 from txm2nexuslib.images.imagestostack import many_images_to_h5_stack
 from txm2nexuslib.parser import create_db, get_db_path
+from txm2nexuslib.storage import (add_storage_arguments,
+                                   set_storage_policy_from_args)
+from txm2nexuslib.reading import (add_read_arguments,
+                                  set_read_policy_from_args)
 
 
 def partial_preprocesing(db_filename, variable, crop, query=None, is_ff=False):
@@ -127,7 +131,11 @@ def main():
                              '(default: False)')
 
 
+    add_storage_arguments(parser)
+    add_read_arguments(parser)
     args = parser.parse_args()
+    set_storage_policy_from_args(args)
+    set_read_policy_from_args(args)
 
     print("\nWorkflow for magnetism experiments:\n" +
           "xrm -> hdf5 -> crop -> normalize -> align for same angle, same"
@@ -26,6 +26,11 @@ import subprocess
 import argparse
 from argparse import RawTextHelpFormatter
 
+from txm2nexuslib.storage import (add_storage_arguments,
+                                   set_storage_policy_from_args)
+from txm2nexuslib.reading import (add_read_arguments,
+                                  set_read_policy_from_args)
+
 
 def main():
     """
@@ -64,7 +69,11 @@ def main():
                              '- If False: Do not crop images\n'
                              '(default: True)')
 
+    add_storage_arguments(parser)
+    add_read_arguments(parser)
     args = parser.parse_args()
+    set_storage_policy_from_args(args)
+    set_read_policy_from_args(args)
 
     start_time = time.time()
     subprocess.call(["manyxrm2h5", args.txm_txt_script])
@@ -35,6 +35,10 @@ from txm2nexuslib.images.multiplealign import align_images
 from txm2nexuslib.images.multipleaverage import average_image_groups
 from txm2nexuslib.images.imagestostack import many_images_to_h5_stack
 from txm2nexuslib.parser import create_db, get_db_path
+from txm2nexuslib.storage import (add_storage_arguments,
+                                   set_storage_policy_from_args)
+from txm2nexuslib.reading import (add_read_arguments,
+                                  set_read_policy_from_args)
 
 def main():
     """
@@ -74,7 +78,11 @@ def main():
                         help="Create individual ZP stacks\n"
                              "(default: True)")
 
+    add_storage_arguments(parser)
+    add_read_arguments(parser)
     args = parser.parse_args()
+    set_storage_policy_from_args(args)
+    set_read_policy_from_args(args)
 
     print("\nWorkflow with Extended Depth of Field:\n" +
           "xrm -> hdf5 -> crop -> normalize -> align for same angle and" +
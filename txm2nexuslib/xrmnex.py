@@ -28,11 +28,17 @@ import struct
 import datetime
 import re
 import pkg_resources
+from collections import deque
+from itertools import islice
+from multiprocessing.pool import ThreadPool
+from joblib import Parallel, delayed
 #import pprint
 
 from tinydb import Query
 from operator import itemgetter
 from txm2nexuslib.parser import get_db, get_file_paths
+from txm2nexuslib import reading
+from txm2nexuslib.storage import dataset_options, FrameWriter
 
 
 SAMPLEENC = 2
@@ -41,6 +47,32 @@ ENERGY = 27
 CURRENT = 28
 ENERGYENC = 30
 
+
+def read_ahead(function, args, depth=4, workers=2):
+    """Call function for each of the args in a pool of worker threads, and
+    yield the results in order. At most depth results are computed in
+    advance of the consumer, which overlaps reading and decoding the next
+    images with writing the current one. With depth 0, function is simply
+    called for each arg, serially.
+    """
+    if depth < 1:
+        for arg in args:
+            yield function(arg)
+        return
+    args = iter(args)
+    pool = ThreadPool(max(1, min(workers, depth)))
+    try:
+        pending = deque(pool.apply_async(function, (arg,))
+                        for arg in islice(args, depth))
+        while pending:
+            result = pending.popleft().get()
+            for arg in islice(args, 1):
+                pending.append(pool.apply_async(function, (arg,)))
+            yield result
+    finally:
+        pool.terminate()
+
+
 class FilesOrganization(object):
 
     def __init__(self):
@@ -149,21 +181,118 @@ class validate_getter(object):
         self.required_fields = required_fields
 
     def __call__(self, method):
-        def wrapped_method(xradia_file):
+        def wrapped_method(xradia_file, *args, **kwargs):
             if not xradia_file.is_opened():
                 raise RuntimeError("XradiaFile is not opened")
             for field in self.required_fields:
                 if not xradia_file.exists(field):
                     raise RuntimeError(
                         "%s does not exist in XradiaFile" % field)
-            return method(xradia_file)
+            return method(xradia_file, *args, **kwargs)
 
         return wrapped_method
 
 
+class XradiaFrames(object):
+    """Lazy, sliceable access to the frames of an opened XradiaFile:
+    frames[i] decodes a single frame, frames[10:50] or frames[::4] decode
+    only the requested frames into a single (k, rows, cols) array.
+    Frames are flipped vertically, as done by XradiaFile.get_image_2D, and
+    given in their native data type (see XradiaFile.get_raw_image_2D).
+    """
+
+    def __init__(self, xradia_file):
+        self.xradia_file = xradia_file
+
+    def __len__(self):
+        return self.xradia_file.no_of_images
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return self.read(range(*index.indices(len(self))))
+        if isinstance(index, (int, long, np.integer)):
+            return self.read([index])[0]
+        return self.read(index)
+
+    def read(self, indexes, out=None):
+        """Decode the given frames.
+        :param indexes: sequence of frame indexes (starting at 0; negative
+        indexes count from the last frame)
+        :param out: optional preallocated (k, rows, cols) array, with the
+        data type of the images, in which the frames are decoded
+        :return: (k, rows, cols) array
+        """
+        xradia_file = self.xradia_file
+        dtype = xradia_file.image_dtypes.get(xradia_file.data_type)
+        if dtype is None:
+            raise RuntimeError("Wrong data type")
+        rows = xradia_file.image_height
+        cols = xradia_file.image_width
+        n_frames = len(self)
+        frame_indexes = []
+        for index in indexes:
+            if index < 0:
+                index += n_frames
+            if not 0 <= index < n_frames:
+                raise IndexError("frame index out of range")
+            frame_indexes.append(index)
+        if out is None:
+            out = np.empty((len(frame_indexes), rows, cols),
+                           dtype=dtype.newbyteorder('='))
+        for i, index in enumerate(frame_indexes):
+            numimage = index + 1
+            img_string = "ImageData%i/Image%i" % ((numimage + 99) // 100,
+                                                  numimage)
+            data = xradia_file.file.openstream_buffer(img_string)
+            frame = np.frombuffer(data, dtype=dtype, count=rows * cols)
+            out[i] = frame.reshape(rows, cols)[::-1]
+        return out
+
+
 class XradiaFile(object):
-    def __init__(self, file_name):
+
+    # Metadata fields read by read_all_metadata, and their getters
+    metadata_getters = (
+        ('sample_id', 'get_sample_id'),
+        ('pixel_size', 'get_pixel_size'),
+        ('xray_magnification', 'get_xray_magnification'),
+        ('no_of_images', 'get_no_of_images'),
+        ('image_width', 'get_image_width'),
+        ('image_height', 'get_image_height'),
+        ('data_type', 'get_data_type'),
+        ('axes_names', 'get_axes_names'),
+        ('machine_currents', 'get_machine_currents'),
+        ('energies', 'get_energies'),
+        ('exp_times', 'get_exp_times'),
+        ('angles', 'get_angles'),
+        ('x_positions', 'get_x_positions'),
+        ('y_positions', 'get_y_positions'),
+        ('z_positions', 'get_z_positions'),
+        ('dates', 'get_dates'),
+        ('det_zero', 'get_det_zero'),
+        ('distance', 'get_distance'),
+    )
+
+    # Errors raised by the getters when a field is missing from the file
+    # (RuntimeError, see validate_getter) or when its stream can not be
+    # read or decoded
+    metadata_errors = (RuntimeError, IOError, struct.error, ValueError,
+                       IndexError)
+
+    # Pixel formats of the images, by data type (see get_raw_image_2D)
+    image_dtypes = {
+        'uint16': np.dtype('<u2'),
+        'float': np.dtype('<f4'),
+    }
+
+    def __init__(self, file_name, **ole_options):
+        """
+        :param ole_options: options of the OleFileIO used to read the file
+        (use_mmap...); by default, the ones of the current read policy
+        (see txm2nexuslib.reading)
+        """
         self.file_name = file_name
+        self.ole_options = ole_options or reading.ole_options()
         self.file = None
         self._axes_names = None
         self._no_of_images = None
@@ -176,6 +305,7 @@ class XradiaFile(object):
         self._pixel_size = None
         self._dates = None
         self._axes_positions = None
+        self._motor_positions = None
 
     def __enter__(self):
         self.open()
@@ -188,7 +318,7 @@ class XradiaFile(object):
         return self.file is not None
 
     def open(self):
-        self.file = OleFileIO(self.file_name)
+        self.file = OleFileIO(self.file_name, **self.ole_options)
 
     def close(self):
         self.file.close()
@@ -196,6 +326,22 @@ class XradiaFile(object):
     def exists(self, field):
         return self.file.exists(field)
 
+    def read_all_metadata(self):
+        """Read all the known metadata fields of the file in one pass.
+        The small metadata streams are all stored in the MiniStream, which
+        is loaded once and sliced for each field.
+        :return: dictionary with one entry per field of metadata_getters;
+        fields that are missing or cannot be decoded (metadata_errors) are
+        set to None
+        """
+        metadata = {}
+        for field, getter in self.metadata_getters:
+            try:
+                metadata[field] = getattr(self, getter)()
+            except self.metadata_errors:
+                metadata[field] = None
+        return metadata
+
     @validate_getter(["SampleInfo/SampleID"])
     def get_sample_id(self):
         stream = self.file.openstream('SampleInfo/SampleID')
@@ -235,13 +381,28 @@ class XradiaFile(object):
             xray_magnification = 0.0
         return xray_magnification
 
-    @validate_getter(["PositionInfo/MotorPositions"])
+    @validate_getter(["PositionInfo/MotorPositions",
+                      "PositionInfo/AxisNames",
+                      "ImageInfo/NoOfImages"])
+    def get_motor_positions(self):
+        """Positions of all the motor axes for every image, parsed once per
+        file: (no_of_images, no_of_axes) float32 array, one column by axis
+        (read-only view over the MotorPositions stream).
+        """
+        if self._motor_positions is None:
+            data = self.file.read_stream('PositionInfo/MotorPositions')
+            number_of_floats = self.no_of_axes * self.no_of_images
+            motor_positions = np.frombuffer(data, dtype='<f4',
+                                            count=number_of_floats)
+            self._motor_positions = motor_positions.reshape(
+                self.no_of_images, self.no_of_axes)
+        return self._motor_positions
+
+    motor_positions = property(get_motor_positions)
+
     def get_axes_positions(self):
         if self._axes_positions is None:
-            stream = self.file.openstream('PositionInfo/MotorPositions')
-            data = stream.read(112)
-            struct_fmt = '<28f'
-            self._axes_positions = struct.unpack(struct_fmt, data)
+            self._axes_positions = tuple(self.motor_positions[0].tolist())
         return self._axes_positions
 
     axes_positions = property(get_axes_positions)
@@ -261,50 +422,76 @@ class XradiaFile(object):
                     self.detectorenc_name == "Detector Z"):
             distance = (self.det_zero + self.detector_distance +
                         self.sample_distance)
+        else:
+            raise RuntimeError("The distance can not be computed from the "
+                               "%s and %s axes" % (self.sampleenc_name,
+                                                   self.detectorenc_name))
         return distance
 
-    @validate_getter(["ImageData1/Image1"])
-    def get_image(self):
-        stream = self.file.openstream('ImageData1/Image1')
-        data = stream.read()
+    @validate_getter(["ImageInfo/NoOfImages"])
+    def get_frames(self):
+        return XradiaFrames(self)
 
-        if self.data_type == 'uint16':
-            struct_fmt = "<{0:10}H".format(
-                self.image_height * self.image_width)
-            imgdata = struct.unpack(struct_fmt, data)
-        elif self.data_type == 'float':
-            struct_fmt = "<{0:10}f".format(
-                self.image_height * self.image_width)
-            imgdata = struct.unpack(struct_fmt, data)
-        else:
-            print "Wrong data type"
-            return
+    frames = property(get_frames)
 
-        image = np.flipud(np.reshape(imgdata, (self.image_height,
-                                               self.image_width), order='A'))
-        image = np.reshape(image, (1, self.image_height, self.image_width),
-                           order='A')
-        return image
+    @validate_getter(["ImageData1/Image1"])
+    def get_image(self, roi=None):
+        image = self.get_image_2D(roi=roi)
+        if image is None:
+            return
+        return image[np.newaxis]
 
     @validate_getter(["ImageData1/Image1"])
-    def get_image_2D(self):
-        stream = self.file.openstream('ImageData1/Image1')
-        data = stream.read()
+    def get_image_2D(self, roi=None):
+        """Return the image, vertically flipped, as a writable array of
+        int64 (uint16 images) or float64 (float images).
+        :param roi: see get_raw_image_2D
+        """
+        image = self.get_raw_image_2D(roi=roi)
+        if image is None:
+            return
+        if image.dtype.kind == 'f':
+            return image.astype(np.float64)
+        return image.astype(np.int_)
 
-        if self.data_type == 'uint16':
-            struct_fmt = "<{0:10}H".format(
-                self.image_height * self.image_width)
-            imgdata = struct.unpack(struct_fmt, data)
-        elif self.data_type == 'float':
-            struct_fmt = "<{0:10}f".format(
-                self.image_height * self.image_width)
-            imgdata = struct.unpack(struct_fmt, data)
-        else:
+    @validate_getter(["ImageData1/Image1"])
+    def get_raw_image_2D(self, roi=None, out=None):
+        """Return the image, vertically flipped, in its native data type
+        (uint16 or float32), as the converters store it. The array is a
+        read-only view over the data read from the file; if the file is
+        memory mapped, the image is copied out of the map, which is closed
+        with the file.
+        :param roi: optional dictionary with the number of pixels to cut
+        off at the "top", "bottom", "left" and "right" of the image (as
+        done by crop_images). Only the rows of the ROI are read from the
+        file.
+        :param out: optional array with the shape of the (cropped) image,
+        in which the image is decoded directly from the file
+        """
+        dtype = self.image_dtypes.get(self.data_type)
+        if dtype is None:
             print "Wrong data type"
             return
-
-        image = np.flipud(np.reshape(imgdata, (self.image_height,
-                                               self.image_width), order='A'))
+        rows, columns = self.image_height, self.image_width
+        if roi is None:
+            roi = {"top": 0, "bottom": 0, "left": 0, "right": 0}
+        # The image is stored bottom-up (it is flipped once read), so the
+        # top rows of the image are the last rows of the stream
+        rows_from = roi["bottom"]
+        rows_to = max(rows - roi["top"], rows_from)
+        row_size = columns * dtype.itemsize
+        data = self.file.openstream_buffer(
+            'ImageData1/Image1', offset=rows_from * row_size,
+            size=(rows_to - rows_from) * row_size)
+        image = np.frombuffer(data, dtype=dtype,
+                              count=(rows_to - rows_from) * columns)
+        image = image.reshape(rows_to - rows_from, columns)
+        image = image[::-1, roi["left"]:columns - roi["right"]]
+        if out is not None:
+            out[...] = image
+            return out
+        if self.file.use_mmap:
+            image = image.copy()
         return image
 
     @validate_getter(["PositionInfo/AxisNames"])
@@ -389,46 +576,18 @@ class XradiaFile(object):
 
     image_height = property(get_image_height)
 
-    @validate_getter(["PositionInfo/MotorPositions"])
     def get_machine_currents(self):
-        stream = self.file.openstream('PositionInfo/MotorPositions')
-        num_axes = len(self.axes_names) - 1
-        number_of_floats = num_axes * self.no_of_images
-        struct_fmt = '<' + str(number_of_floats) + 'f'
-        number_of_bytes = number_of_floats * 4  # 4 bytes every float
-        data = stream.read(number_of_bytes)
-        axis = struct.unpack(struct_fmt, data)
-
-        currents = self.no_of_images * [0]
-        for i in range(self.no_of_images):
-            currents[i] = axis[self.no_of_axes * i + CURRENT]  # In mA
-        return currents
+        return self.motor_positions[:, CURRENT].tolist()  # In mA
 
     @validate_getter([])
     def get_energies(self):
         if (self.energyenc_name.lower() == "energyenc"):
             if self.file.exists('PositionInfo/MotorPositions'):
-                stream = self.file.openstream('PositionInfo/MotorPositions')
-                number_of_floats = self.no_of_axes * self.no_of_images
-                struct_fmt = '<' + str(number_of_floats) + 'f'
-                number_of_bytes = number_of_floats * 4  # 4 bytes every float
-                data = stream.read(number_of_bytes)
-                axis = struct.unpack(struct_fmt, data)
-                energies = self.no_of_images * [0]
-                for i in range(self.no_of_images):
-                    energies[i] = axis[self.no_of_axes * i + ENERGYENC] # In eV
+                energies = self.motor_positions[:, ENERGYENC].tolist()  # eV
         # Energy for each image calculated from Energy motor ####
         elif (self.energy_name == "Energy"):
             if self.file.exists('PositionInfo/MotorPositions'):
-                stream = self.file.openstream('PositionInfo/MotorPositions')
-                number_of_floats = self.no_of_axes * self.no_of_images
-                struct_fmt = '<' + str(number_of_floats) + 'f'
-                number_of_bytes = number_of_floats * 4  # 4 bytes every float
-                data = stream.read(number_of_bytes)
-                axis = struct.unpack(struct_fmt, data)
-                energies = self.no_of_images * [0]
-                for i in range(self.no_of_images):
-                    energies[i] = axis[self.no_of_axes * i + ENERGY]  # In eV
+                energies = self.motor_positions[:, ENERGY].tolist()  # In eV
         # Energy for each image calculated from ImageInfo ####
         elif self.file.exists('ImageInfo/Energy'):
             stream = self.file.openstream('ImageInfo/Energy')
@@ -605,18 +764,19 @@ class XradiaFile(object):
     def get_det_zero(self):
         where_detzero = ("ConfigureBackup/ConfigCamera/" +
                          "Camera 1/ConfigZonePlates/DetZero")
-        if self._det_zero is None and self.file.exists(where_detzero):
-            stream = self.file.openstream("ConfigureBackup/ConfigCamera/" +
-                                          "Camera 1/ConfigZonePlates/DetZero")
-            data = stream.read()
-            if len(data) != 0:
-                struct_fmt = '<1f'
-                sample_to_detector_zero_enc = struct.unpack(struct_fmt, data)
-                self._det_zero = sample_to_detector_zero_enc[0]
+        if self._det_zero is None:
+            if self.file.exists(where_detzero):
+                stream = self.file.openstream(where_detzero)
+                data = stream.read()
+                if len(data) != 0:
+                    struct_fmt = '<1f'
+                    sample_to_detector_zero_enc = struct.unpack(struct_fmt,
+                                                                data)
+                    self._det_zero = sample_to_detector_zero_enc[0]
+                else:
+                    self._det_zero = 0
             else:
                 self._det_zero = 0
-        else:
-            self._det_zero = 0
         return self._det_zero
 
     det_zero = property(get_det_zero)
@@ -634,10 +794,18 @@ class xrmNXtomo(object):
                  zero_deg_in=None, zero_deg_final=None, sourcename='ALBA',
                  sourcetype='Synchrotron X-ray Source',
                  sourceprobe='x-ray', instrument='BL09 @ ALBA',
-                 sample='Unknown'):
+                 sample='Unknown', read_ahead=4, decode_workers=2):
+        """
+        :param read_ahead: number of images read and decoded in advance
+        while the current image is written (0 to convert serially)
+        :param decode_workers: number of threads reading and decoding
+        the images
+        """
 
         self.reader = reader
         self.ff_reader = ffreader
+        self.read_ahead = read_ahead
+        self.decode_workers = decode_workers
         if hdf5_output_path is None:
             path = reader.get_sample_path()
         else:
@@ -809,15 +977,15 @@ class xrmNXtomo(object):
         else:
             self.datatype = data_type
 
+        shape = (self.nSampleFrames, self.numrows,
+                 self.numcols)
         self.nxdetectorsample.create_dataset(
             "data",
-            shape=(self.nSampleFrames,
-                   self.numrows,
-                   self.numcols),
-            chunks=(1,
-                    self.numrows,
-                    self.numcols),
-            dtype=self.datatype)
+            shape=shape,
+            **dataset_options(shape, self.datatype,
+                              chunks=(1, self.numrows,
+                                      self.numcols),
+                              raw=True))
 
         self.nxdetectorsample['data'].attrs[
             'Data Type'] = self.datatype
@@ -828,16 +996,19 @@ class xrmNXtomo(object):
         self.nxdetectorsample['data'].attrs[
             'Image Width'] = self.numcols
 
-        for numimage in range(self.nSampleFrames):
-            self.count_num_sequence = self.count_num_sequence + 1
-            tomoimagesingle = self.reader.get_image(numimage)
-            self.num_sample_sequence.append(
-                self.count_num_sequence)
-            self.nxdetectorsample['data'][numimage] = tomoimagesingle
-            if numimage % 20 == 0:
-                print('Image %i converted' % numimage)
-            if numimage + 1 == self.nSampleFrames:
-                print ('%i images converted\n' % self.nSampleFrames)
+        images = read_ahead(self.reader.get_raw_image_2D,
+                            range(self.nSampleFrames),
+                            self.read_ahead, self.decode_workers)
+        with FrameWriter(self.nxdetectorsample['data']) as writer:
+            for numimage, tomoimagesingle in enumerate(images):
+                self.count_num_sequence = self.count_num_sequence + 1
+                self.num_sample_sequence.append(
+                    self.count_num_sequence)
+                writer.write(tomoimagesingle)
+                if numimage % 20 == 0:
+                    print('Image %i converted' % numimage)
+                if numimage + 1 == self.nSampleFrames:
+                    print ('%i images converted\n' % self.nSampleFrames)
 
         # h5py NeXus link
         source_addr = '/NXtomo/instrument/sample/data'
@@ -855,15 +1026,15 @@ class xrmNXtomo(object):
 
         self.nxbright = self.nxinstrument.create_group("bright_field")
         self.nxbright.attrs['NX_class'] = "Unknown"
+        shape = (self.nFramesBright, self.numrows_bright,
+                 self.numcols_bright)
         self.nxbright.create_dataset(
             "data",
-            shape=(self.nFramesBright,
-                   self.numrows_bright,
-                   self.numcols_bright),
-            chunks=(1,
-                    self.numrows_bright,
-                    self.numcols_bright),
-            dtype=self.datatype_bright)
+            shape=shape,
+            **dataset_options(shape, self.datatype_bright,
+                              chunks=(1, self.numrows_bright,
+                                      self.numcols_bright),
+                              raw=True))
         self.nxbright['data'].attrs['Data Type'] = \
             self.datatype_bright
         self.nxbright['data'].attrs['Image Height'] = \
@@ -871,14 +1042,17 @@ class xrmNXtomo(object):
         self.nxbright['data'].attrs['Image Width'] = \
             self.numcols_bright
 
-        for numimage in range(self.nFramesBright):
-            if numimage + 1 == self.nFramesBright:
-                print ('%i Bright-Field images '
-                       'converted\n' % self.nFramesBright)
-            self.count_num_sequence = self.count_num_sequence + 1
-            tomoimagesingle = self.ff_reader.get_image(numimage)
-            self.num_bright_sequence.append(self.count_num_sequence)
-            self.nxbright['data'][numimage] = tomoimagesingle
+        images = read_ahead(self.ff_reader.get_raw_image_2D,
+                            range(self.nFramesBright),
+                            self.read_ahead, self.decode_workers)
+        with FrameWriter(self.nxbright['data']) as writer:
+            for numimage, tomoimagesingle in enumerate(images):
+                if numimage + 1 == self.nFramesBright:
+                    print ('%i Bright-Field images '
+                           'converted\n' % self.nFramesBright)
+                self.count_num_sequence = self.count_num_sequence + 1
+                self.num_bright_sequence.append(self.count_num_sequence)
+                writer.write(tomoimagesingle)
 
         # Accelerator current for each image of FF (machine current)
         ff_currents = self.ff_reader.get_machine_currents()
@@ -955,7 +1129,8 @@ class xrmNXtomo(object):
     def convert_tomography(self):
         # TODO: 0 degree images not implemented in xrm2nexs
         if self.filename_zerodeg_in is not None:
-            ole_zerodeg_in = OleFileIO(self.filename_zerodeg_in)
+            ole_zerodeg_in = OleFileIO(self.filename_zerodeg_in,
+                                       **reading.ole_options())
             image_zerodeg_in = self._convert_zero_deg_images(ole_zerodeg_in)
             self.nxdetectorsample.create_dataset(
                 '0_degrees_initial_image',
@@ -970,7 +1145,8 @@ class xrmNXtomo(object):
             print('Zero degrees initial image converted')
 
         if self.filename_zerodeg_final is not None:
-            ole_zerodeg_final = OleFileIO(self.filename_zerodeg_final)
+            ole_zerodeg_final = OleFileIO(self.filename_zerodeg_final,
+                                          **reading.ole_options())
             image_zerodeg_final = self._convert_zero_deg_images(
                 ole_zerodeg_final)
             self.nxdetectorsample.create_dataset(
@@ -1025,38 +1201,72 @@ class xrmNXtomo(object):
         self.txrmhdf.close()
 
 
+def read_xrm_metadata(file_name):
+    """Read all the metadata of an xrm file (see
+    XradiaFile.read_all_metadata), opening it once."""
+    with XradiaFile(file_name) as xrm_file:
+        return xrm_file.read_all_metadata()
+
+
 class xrmReader(object):
-    def __init__(self, file_names):
+    def __init__(self, file_names, cores=-2, backend="threading"):
+        """
+        :param file_names: xrm files, in the order of the image sequence
+        :param cores: number of parallel jobs used to read the metadata of
+        the files (all cores but one by default)
+        :param backend: "threading" or "multiprocessing"
+        """
         self.file_names = file_names
+        self.cores = cores
+        self.backend = backend
+        self._metadata = None
+
+    def get_metadata(self):
+        """Metadata table of the files, read on first access with one open
+        per file, in parallel: dictionary with one column (list with one
+        value per file) by field of XradiaFile.metadata_getters.
+        """
+        if self._metadata is None:
+            records = Parallel(n_jobs=self.cores, backend=self.backend)(
+                delayed(read_xrm_metadata)(file_name)
+                for file_name in self.file_names)
+            self._metadata = {}
+            for field, _ in XradiaFile.metadata_getters:
+                self._metadata[field] = [record[field] for record in records]
+        return self._metadata
+
+    metadata = property(get_metadata)
+
+    def _get_file_value(self, field, index):
+        value = self.metadata[field][index]
+        if value is None:
+            # The field could not be read in the metadata scan: the getter
+            # is called again to raise the corresponding error.
+            getter = dict(XradiaFile.metadata_getters)[field]
+            with XradiaFile(self.file_names[index]) as xrm_file:
+                value = getattr(xrm_file, getter)()
+        return value
+
+    def _get_column(self, field):
+        values = []
+        for index in range(len(self.file_names)):
+            values.extend(self._get_file_value(field, index))
+        return values
 
     def get_images_number(self):
         return len(self.file_names)
 
     def get_pixel_size(self):
-        file_name = self.file_names[0]
-        with XradiaFile(file_name) as xrm_file:
-            return xrm_file.pixel_size
+        return self._get_file_value('pixel_size', 0)
 
     def get_exp_times(self):
-        exp_times = []
-        for file_name in self.file_names:
-            with XradiaFile(file_name) as xrm_file:
-                exp_times.extend(xrm_file.get_exp_times())
-        return exp_times
+        return self._get_column('exp_times')
 
     def get_machine_currents(self):
-        currents = []
-        for file_name in self.file_names:
-            with XradiaFile(file_name) as xrm_file:
-                currents.extend(xrm_file.get_machine_currents())
-        return currents
+        return self._get_column('machine_currents')
 
     def get_energies(self):
-        energies = []
-        for file_name in self.file_names:
-            with XradiaFile(file_name) as xrm_file:
-                energies.extend(xrm_file.get_energies())
-        return energies
+        return self._get_column('energies')
 
     def get_start_time(self):
         filename = self.file_names[0]
@@ -1069,32 +1279,16 @@ class xrmReader(object):
             return xrm_file.get_end_date()
 
     def get_angles(self):
-        angles = []
-        for file_name in self.file_names:
-            with XradiaFile(file_name) as xrm_file:
-                angles.extend(xrm_file.get_angles())
-        return angles
+        return self._get_column('angles')
 
     def get_x_positions(self):
-        positions = []
-        for file_name in self.file_names:
-            with XradiaFile(file_name) as xrm_file:
-                positions.extend(xrm_file.get_x_positions())
-        return positions
+        return self._get_column('x_positions')
 
     def get_y_positions(self):
-        positions = []
-        for file_name in self.file_names:
-            with XradiaFile(file_name) as xrm_file:
-                positions.extend(xrm_file.get_y_positions())
-        return positions
+        return self._get_column('y_positions')
 
     def get_z_positions(self):
-        positions = []
-        for file_name in self.file_names:
-            with XradiaFile(file_name) as xrm_file:
-                positions.extend(xrm_file.get_z_positions())
-        return positions
+        return self._get_column('z_positions')
 
     def get_image(self, id):
         """
@@ -1105,35 +1299,40 @@ class xrmReader(object):
         with XradiaFile(filename) as xrm_file:
             return xrm_file.get_image()
 
-    def get_distance(self):
-        filename = self.file_names[0]
-        # TODO: get the data from the first file
+    def get_image_2D(self, id):
+        """
+        :param id: number of the images sequence
+        :return: image data, as a 2D array
+        """
+        filename = self.file_names[id]
         with XradiaFile(filename) as xrm_file:
-            return xrm_file.get_distance()
+            return xrm_file.get_image_2D()
 
-    def get_sample_id(self):
-        filename = self.file_names[0]
-        # TODO: get the data from the first file
+    def get_raw_image_2D(self, id):
+        """
+        :param id: number of the images sequence
+        :return: image data, as a 2D read-only array of its native data
+        type (see XradiaFile.get_raw_image_2D)
+        """
+        filename = self.file_names[id]
         with XradiaFile(filename) as xrm_file:
-            return xrm_file.get_sample_id()
+            return xrm_file.get_raw_image_2D()
+
+    def get_distance(self):
+        return self._get_file_value('distance', 0)
+
+    def get_sample_id(self):
+        return self._get_file_value('sample_id', 0)
 
     def get_xray_magnification(self):
-        filename = self.file_names[0]
-        # TODO: get the data from the first file
-        with XradiaFile(filename) as xrm_file:
-            return xrm_file.get_xray_magnification()
+        return self._get_file_value('xray_magnification', 0)
 
     def get_data_type(self):
-        filename = self.file_names[0]
-        # TODO: get the data from the first file
-        with XradiaFile(filename) as xrm_file:
-            return xrm_file.data_type
+        return self._get_file_value('data_type', 0)
 
     def get_image_size(self):
-        filename = self.file_names[0]
-        # TODO: get the data from the first file
-        with XradiaFile(filename) as xrm_file:
-            return xrm_file.image_height, xrm_file.image_width
+        return (self._get_file_value('image_height', 0),
+                self._get_file_value('image_width', 0))
 
     def get_sample_name(self):
         filename = self.file_names[0]
@@ -1152,3 +1351,69 @@ class xrmReader(object):
         filename = self.file_names[0]
         path = filename.rsplit('/', 1)[0]
         return path
+
+
+class xrmCachedReader(object):
+    """Images and metadata of a sequence of xrm files decoded once, as
+    needed by xrmNXtomo to convert them as FF images (bright field).
+
+    The FF images of a sample are shared by all its tomos: they are read
+    from the xrm files once per sample, instead of once per tomo, and
+    given from memory afterwards. Given to joblib worker processes, the
+    images are shared with them through a memory mapped file instead of
+    being copied to each one.
+    """
+
+    def __init__(self, reader, read_ahead_depth=4, decode_workers=2):
+        """
+        :param reader: xrmReader of the xrm files
+        :param read_ahead_depth: see read_ahead
+        :param decode_workers: see read_ahead
+        """
+        self.file_names = reader.file_names
+        self.data_type = reader.get_data_type()
+        self.image_size = reader.get_image_size()
+        self.machine_currents = reader.get_machine_currents()
+        self.exp_times = reader.get_exp_times()
+        n_images = reader.get_images_number()
+        self.images = None
+        for index, image in enumerate(read_ahead(reader.get_raw_image_2D,
+                                                 range(n_images),
+                                                 read_ahead_depth,
+                                                 decode_workers)):
+            if self.images is None:
+                self.images = np.empty((n_images,) + image.shape,
+                                       dtype=image.dtype)
+            self.images[index] = image
+
+    def get_images_number(self):
+        return len(self.file_names)
+
+    def get_data_type(self):
+        return self.data_type
+
+    def get_image_size(self):
+        return self.image_size
+
+    def get_machine_currents(self):
+        return self.machine_currents
+
+    def get_exp_times(self):
+        return self.exp_times
+
+    def get_raw_image_2D(self, id):
+        """
+        :param id: number of the images sequence
+        :return: image data, as a 2D array of its native data type
+        """
+        return self.images[id]
+
+    def get_image_2D(self, id):
+        """
+        :param id: number of the images sequence
+        :return: image data, as a 2D array (see XradiaFile.get_image_2D)
+        """
+        image = self.images[id]
+        if image.dtype.kind == 'f':
+            return image.astype(np.float64)
+        return image.astype(np.int_)